@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Benchmark hors-ligne de bout en bout : download_all_playlists_parallel contre un faux YouTube local
+Un serveur HTTP local (processus séparé) sert des playlists et des flux audio synthétiques,
+avec latence, débit limité, erreurs 503 et throttling 429 injectables. Des extracteurs yt-dlp
+de substitution redirigent les URLs YouTube du benchmark vers ce serveur : extraction à plat,
+WorkerContext, file globale, pool de transcodage et manifeste tournent comme en vrai.
+Mesures par configuration : titres/s, CPU (secondes et %), RSS, temps moyen par étape
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import resource  # Pic de RSS (Linux / macOS)
+except ImportError:
+    resource = None
+
+PAGE_SIZE = 100  # Titres par page de playlist (pagination comme YouTube)
+
+# --- Faux serveur YouTube (processus séparé : son CPU ne compte pas dans la mesure) ---
+
+class FakeYoutubeHandler(BaseHTTPRequestHandler):
+    """/playlist/<id>?page=N (JSON), /video/<id> (JSON), /audio/<id>.m4a (flux audio)"""
+    protocol_version = 'HTTP/1.1'
+    faults = {}
+    payload = b''
+
+    def _send(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        return body
+
+    def do_GET(self):
+        faults = self.faults
+        time.sleep(faults['latency'])
+        url = urlparse(self.path)
+
+        match = re.fullmatch(r'/playlist/(BENCH-[\w-]+)-n(\d+)', url.path)
+        if match:
+            playlist_id, count = match.group(1), int(match.group(2))
+            page = int(parse_qs(url.query).get('page', ['0'])[0])
+            start = page * PAGE_SIZE
+            entries = [{'id': f'bench-{playlist_id[6:]}-v{i}', 'title': f'Titre {i} ({playlist_id})'}
+                       for i in range(start, min(start + PAGE_SIZE, count))]
+            body = json.dumps({'title': f'Bench {playlist_id}', 'entries': entries,
+                               'has_more': start + PAGE_SIZE < count}).encode()
+            self.wfile.write(self._send(200, body))
+            return
+
+        match = re.fullmatch(r'/video/(bench-[\w-]+)', url.path)
+        if match:
+            if random.random() < faults['throttle_rate']:
+                self.wfile.write(self._send(429, b'{}'))
+                return
+            video_id = match.group(1)
+            body = json.dumps({'id': video_id, 'title': f'Titre {video_id}', 'artist': 'Bench'}).encode()
+            self.wfile.write(self._send(200, body))
+            return
+
+        if url.path.startswith('/audio/'):
+            if random.random() < faults['error_rate']:
+                self.wfile.write(self._send(503, b''))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mp4')
+            self.send_header('Content-Length', str(len(self.payload)))
+            self.end_headers()
+            self._stream(self.payload, faults['bandwidth'])
+            return
+
+        self.wfile.write(self._send(404, b'{}'))
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mp4')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+
+    def _stream(self, data, bandwidth):
+        """Écrit le flux par blocs, en respectant le débit max par connexion (0 = illimité)"""
+        chunk = 16 * 1024
+        for offset in range(0, len(data), chunk):
+            block = data[offset:offset + chunk]
+            self.wfile.write(block)
+            if bandwidth:
+                time.sleep(len(block) / bandwidth)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port_queue, faults, payload):
+    FakeYoutubeHandler.faults = faults
+    FakeYoutubeHandler.payload = payload
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeYoutubeHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+# --- Extracteurs yt-dlp de substitution ---
+
+def install_stub_extractors(base_url):
+    """Place les extracteurs du benchmark devant ceux de yt-dlp (URLs YouTube BENCH-* seulement)"""
+    import yt_dlp
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class BenchPlaylistIE(InfoExtractor):
+        IE_NAME = 'bench:playlist'
+        _VALID_URL = r'https?://(?:music|www)\.youtube\.com/playlist\?list=(?P<id>BENCH-[\w-]+)'
+
+        def _real_extract(self, url):
+            playlist_id = self._match_id(url)
+
+            def pages():
+                page = 0
+                while True:
+                    data = self._download_json(f'{base_url}/playlist/{playlist_id}?page={page}', playlist_id,
+                                               note=False)
+                    for entry in data['entries']:
+                        yield self.url_result(f"https://www.youtube.com/watch?v={entry['id']}",
+                                              BenchVideoIE, entry['id'], entry['title'])
+                    if not data['has_more']:
+                        return
+                    page += 1
+
+            return self.playlist_result(pages(), playlist_id.rsplit('-n', 1)[0], f'Bench {playlist_id}')
+
+    class BenchVideoIE(InfoExtractor):
+        IE_NAME = 'bench:video'
+        _VALID_URL = r'https?://(?:music|www)\.youtube\.com/watch\?v=(?P<id>bench-[\w-]+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            data = self._download_json(f'{base_url}/video/{video_id}', video_id, note=False)
+            return {
+                'id': video_id,
+                'title': data['title'],
+                'artist': data['artist'],
+                'url': f'{base_url}/audio/{video_id}.m4a',
+                'ext': 'm4a',
+                'acodec': 'aac',
+                'vcodec': 'none',
+                'abr': 128,
+            }
+
+    class BenchYoutubeDL(yt_dlp.YoutubeDL):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            stubs = (BenchPlaylistIE(), BenchVideoIE())
+            for stub in stubs:
+                self.add_info_extractor(stub)
+            # add_info_extractor ajoute en fin de liste, derrière l'extracteur générique : on les remet devant
+            self._ies = {**{stub.ie_key(): stub for stub in stubs}, **self._ies}
+
+    yt_dlp.YoutubeDL = BenchYoutubeDL
+
+def stub_convert_audio(source_path, target_path, transcode=True, tags=None):
+    """Sans ffmpeg : copie + renommage, pour mesurer le téléchargeur seul"""
+    part_path = target_path.with_name(f"{target_path.stem}.part{target_path.suffix}")
+    shutil.copyfile(source_path, part_path)
+    os.replace(part_path, target_path)
+    if source_path != target_path:
+        source_path.unlink()
+    return target_path
+
+def stub_convert_stream(chunks, target_path, transcode=True, tags=None, on_block=None):
+    """Sans ffmpeg, mode pipe : le flux est écrit tel quel dans le .part puis renommé"""
+    part_path = target_path.with_name(f"{target_path.stem}.part{target_path.suffix}")
+    with open(part_path, 'wb') as f:
+        for block in chunks:
+            f.write(block)
+            if on_block:
+                on_block(len(block))
+    os.replace(part_path, target_path)
+    return target_path
+
+def make_audio_payload(seconds):
+    """Vrai flux AAC (sinusoïde) pour que ffmpeg ait quelque chose à convertir"""
+    import subprocess
+    import ultra_downloader as ud
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.m4a"
+        subprocess.run([ud.FFMPEG_BIN, '-y', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', f'sine=frequency=440:duration={seconds}', '-c:a', 'aac', '-b:a', '128k', str(path)],
+                       check=True)
+        return path.read_bytes()
+
+# --- Mesure ---
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def run_config(ud, run_id, playlists, threads, args, workdir):
+    """Un point de la matrice : bibliothèque neuve, IDs uniques (pas de cache ni de dédup entre runs)"""
+    library = workdir / f"run{run_id}"
+    if ud._manifest is not None:
+        ud._manifest.close()
+        ud._manifest = None
+    ud.LIBRARY_DIR = library
+    ud.global_stats = ud.GlobalStats()
+    urls = [f"https://music.youtube.com/playlist?list=BENCH-r{run_id}-p{i}-n{args.tracks}" for i in range(playlists)]
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ud.download_all_playlists_parallel(urls, playlists, threads, adaptive=args.adaptive,
+                                           output_policy=ud.OutputPolicy(args.output, pipe=args.pipe), progress='off',
+                                           retry_rounds=args.retry_rounds)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    _, _, videos_done, videos_failed, videos_total = ud.global_stats.get_stats()
+    report = ud.run_metrics.snapshot()
+    stages = report['stages']
+    shutil.rmtree(library, ignore_errors=True)
+    return {
+        'playlists': playlists,
+        'threads': threads,
+        'tracks_ok': videos_done,
+        'tracks_failed': videos_failed,
+        'tracks_total': videos_total,
+        'wall_seconds': round(wall, 3),
+        'tracks_per_second': round(videos_done / wall, 2) if wall else None,
+        'cpu_seconds': round(cpu, 3),
+        'cpu_percent': round(cpu / wall * 100, 1) if wall else None,
+        'rss_mb': current_rss_mb(),
+        'peak_rss_mb': peak_rss_mb(),
+        'retries': report['counters']['retries_http'] + report['counters']['retries_fragment'],
+        'stage_avg_seconds': {stage: timer['avg_seconds'] for stage, timer in stages.items() if timer['count']},
+    }
+
+def parse_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors-ligne de download_all_playlists_parallel")
+    parser.add_argument('--playlists', type=parse_list, default=[1, 2, 4],
+                        help="Playlists simultanées à tester (défaut 1,2,4)")
+    parser.add_argument('--threads', type=parse_list, default=[2, 6, 12],
+                        help="Threads vidéo par playlist à tester (défaut 2,6,12)")
+    parser.add_argument('--tracks', type=int, default=30, help="Titres par playlist (défaut 30)")
+    parser.add_argument('--track-kb', type=int, default=256, help="Taille d'un flux audio en KB (défaut 256)")
+    parser.add_argument('--latency', type=float, default=20, help="Latence par requête en ms (défaut 20)")
+    parser.add_argument('--bandwidth', type=float, default=0, help="Débit max par connexion en KB/s (0 = illimité)")
+    parser.add_argument('--error-rate', type=float, default=0, help="Part de flux audio en erreur 503 (0-1)")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="Part de requêtes vidéo en 429 (0-1)")
+    parser.add_argument('--output', choices=('mp3', 'native', 'auto'), default='native',
+                        help="Politique de sortie (défaut native)")
+    parser.add_argument('--ffmpeg', action='store_true',
+                        help="Vraie conversion ffmpeg (le serveur sert alors un vrai AAC de --track-seconds secondes)")
+    parser.add_argument('--track-seconds', type=int, default=30, help="Durée de l'audio généré avec --ffmpeg (défaut 30)")
+    parser.add_argument('--pipe', action='store_true', help="Mode flux direct vers ffmpeg (sans fichier intermédiaire)")
+    parser.add_argument('--retry-rounds', type=int, default=0,
+                        help="Nouveaux essais des échecs en fin de run (défaut 0 : le délai d'attente fausserait la mesure)")
+    parser.add_argument('--no-adaptive', dest='adaptive', action='store_false', help="Sans contrôleur adaptatif")
+    parser.add_argument('--json', help="Écrire les résultats dans ce fichier JSON")
+    args = parser.parse_args()
+
+    faults = {'latency': args.latency / 1000, 'bandwidth': args.bandwidth * 1024,
+              'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate}
+    payload = make_audio_payload(args.track_seconds) if args.ffmpeg else os.urandom(args.track_kb * 1024)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue, faults, payload), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+    install_stub_extractors(base_url)
+    import ultra_downloader as ud
+    ud.playlist_cache.ttl = 0
+    if not args.ffmpeg:
+        ud.convert_audio = stub_convert_audio
+        ud.convert_stream = stub_convert_stream
+
+    results = []
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        os.chdir(workdir)  # logs/, métriques, cookies : rien n'est écrit dans le dossier courant
+        ud.METRICS_DIR = workdir / "metrics"
+        try:
+            run_id = 0
+            for playlists in args.playlists:
+                for threads in args.threads:
+                    run_id += 1
+                    result = run_config(ud, run_id, playlists, threads, args, workdir)
+                    results.append(result)
+                    print(f"  {playlists} playlists x {threads:>2} threads : {result['tracks_per_second']:6.2f} titres/s, "
+                          f"{result['tracks_ok']}/{result['tracks_total']} OK, {result['retries']} retries, CPU {result['cpu_percent']}%, "
+                          f"RSS {result['rss_mb'] or 0:.0f} MB", flush=True)
+        finally:
+            os.chdir(original_cwd)
+    server.terminate()
+
+    print(f"\n📊 {args.tracks} titres/playlist, {len(payload) // 1024} KB/titre, latence {args.latency:g} ms, "
+          f"débit {'illimité' if not args.bandwidth else f'{args.bandwidth:g} KB/s'}, "
+          f"503 {args.error_rate:.0%}, 429 {args.throttle_rate:.0%}")
+    print(f"   {'playlists':>9} {'threads':>7} {'titres/s':>9} {'OK':>9} {'CPU s':>7} {'CPU %':>6} {'RSS MB':>7}  étape la plus lente")
+    for result in results:
+        slowest = max(result['stage_avg_seconds'].items(), key=lambda item: item[1], default=('-', 0))
+        print(f"   {result['playlists']:>9} {result['threads']:>7} {result['tracks_per_second']:>9.2f} "
+              f"{result['tracks_ok']:>4}/{result['tracks_total']:<4} {result['cpu_seconds']:>7.2f} "
+              f"{result['cpu_percent']:>6.1f} {result['rss_mb'] or 0:>7.0f}  {slowest[0]} ({slowest[1]:.3f}s)")
+    best = max(results, key=lambda result: result['tracks_per_second'] or 0)
+    print(f"🚀 Meilleur: {best['playlists']} playlists x {best['threads']} threads "
+          f"→ {best['tracks_per_second']:.2f} titres/s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Résultats: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark : coût de mise en place yt-dlp par vidéo
+Compare un YoutubeDL neuf par vidéo (ancienne méthode) à un contexte réutilisé par thread
+Tout se passe en local (serveur HTTP keep-alive sur 127.0.0.1), aucun accès à YouTube
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import yt_dlp
+import ultra_downloader as ud
+
+PAYLOAD = os.urandom(64 * 1024)  # Faux flux audio de 64 KB
+
+class AudioHandler(BaseHTTPRequestHandler):
+    """Sert le même faux fichier audio pour n'importe quel chemin, en HTTP/1.1 (keep-alive)"""
+    protocol_version = 'HTTP/1.1'
+
+    def _headers(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mp4')
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers()
+
+    def do_GET(self):
+        self._headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AudioHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def bench_new_instance(urls, output_dir):
+    """Ancienne méthode : options copiées + YoutubeDL neuf pour chaque vidéo"""
+    setup = 0.0
+    start = time.perf_counter()
+    for url in urls:
+        t0 = time.perf_counter()
+        ydl_opts = dict(ud.get_ultra_ydl_opts(str(output_dir)))
+        ydl_opts['ignoreerrors'] = False
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        setup += time.perf_counter() - t0
+        with ydl:
+            ydl.extract_info(url, download=True)
+    return time.perf_counter() - start, setup
+
+def bench_worker_context(urls, output_dir):
+    """Nouvelle méthode : un WorkerContext réutilisé pour toutes les vidéos"""
+    start = time.perf_counter()
+    context = ud.WorkerContext()
+    setup = time.perf_counter() - start
+    for url in urls:
+        context.download(url, output_dir)
+    context.close()
+    return time.perf_counter() - start, setup
+
+def main():
+    parser = argparse.ArgumentParser(description="Coût yt-dlp par vidéo : instance neuve vs contexte réutilisé")
+    parser.add_argument('--videos', type=int, default=50, help="Nombre de vidéos par méthode (défaut 50)")
+    args = parser.parse_args()
+
+    ud.progress_hook = lambda d: None  # Pas d'affichage de progression pendant la mesure
+    server = start_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, bench in (('YoutubeDL neuf par vidéo', bench_new_instance),
+                            ('WorkerContext réutilisé', bench_worker_context)):
+            output_dir = Path(tmp) / name.split()[0]
+            output_dir.mkdir()
+            urls = [f"{base_url}/{name.split()[0]}_{i}.m4a" for i in range(args.videos)]
+            results[name] = bench(urls, output_dir)
+
+    server.shutdown()
+
+    print(f"📊 {args.videos} vidéos par méthode (serveur local, {len(PAYLOAD) // 1024} KB par vidéo)")
+    for name, (total, setup) in results.items():
+        print(f"   {name:<26} {total / args.videos * 1000:7.2f} ms/vidéo "
+              f"(dont mise en place {setup / args.videos * 1000:6.2f} ms/vidéo)")
+    before = results['YoutubeDL neuf par vidéo'][0]
+    after = results['WorkerContext réutilisé'][0]
+    print(f"🚀 Gain: {(before - after) / args.videos * 1000:.2f} ms/vidéo ({before / max(after, 1e-9):.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Le script n'est pas un paquet : on l'importe depuis la racine du dépôt
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
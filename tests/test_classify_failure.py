@@ -0,0 +1,27 @@
+import pytest
+
+from ultra_downloader import classify_failure
+
+
+# Messages réels de yt-dlp ; les IDs vidéo contiennent volontairement des codes HTTP
+@pytest.mark.parametrize('message, expected', [
+    ("ERROR: [youtube] a503xYz_k-Q: Video unavailable", 'permanent'),
+    ("ERROR: [youtube] Kx429bcD-1q: Private video. Sign in if you've been granted access to this video", 'permanent'),
+    ("ERROR: [youtube] z403AbCdEfG: Video unavailable. This video has been removed by the uploader", 'permanent'),
+    ("ERROR: [youtube] Q500wErTyUi: This video is only available to Music Premium members", 'permanent'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm your age. This video may be inappropriate for some users.",
+     'permanent'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. This content isn't available, try again later.", 'permanent'),
+    ("ERROR: unable to download video data: HTTP Error 403: Forbidden", 'transient'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Unable to download API page: HTTP Error 429: Too Many Requests", 'transient'),
+    ("ERROR: [download] Got error: HTTP Error 503: Service Unavailable", 'transient'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you’re not a bot. Use --cookies-from-browser", 'transient'),
+    ("ERROR: unable to download video data: <urlopen error [Errno 104] Connection reset by peer>", 'transient'),
+    ("ERROR: [download] Got error: The read operation timed out", 'transient'),
+    ("ERROR: [download] Got error: 1048576 bytes read, 2097152 more expected", 'transient'),
+    ("Unable to download webpage: https://www.youtube.com/watch?v=a503xYzkQ12 Private video", 'permanent'),
+    ("", 'transient'),
+    (None, 'transient'),
+])
+def test_classify_failure(message, expected):
+    assert classify_failure(message) == expected
@@ -0,0 +1,104 @@
+import pytest
+
+from ultra_downloader import index_audio_file, read_id3_tags
+
+
+def syncsafe(size):
+    return bytes(((size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f))
+
+
+def frame(major, frame_id, body):
+    """Frame ID3 brute : en-tête court en v2.2, taille syncsafe en v2.4"""
+    if major == 2:
+        return frame_id.encode() + len(body).to_bytes(3, 'big') + body
+    size = syncsafe(len(body)) if major == 4 else len(body).to_bytes(4, 'big')
+    return frame_id.encode() + size + b'\0\0' + body
+
+
+def tag(major, frames, flags=0, extended=b'', padding=16, size=None):
+    body = extended + b''.join(frames) + b'\0' * padding
+    return b'ID3' + bytes((major, 0, flags)) + syncsafe(len(body) if size is None else size) + body
+
+
+def write(tmp_path, data, name='song.mp3'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+def test_v23_latin1_and_comment(tmp_path):
+    path = write(tmp_path, tag(3, [
+        frame(3, 'APIC', b'\0image/jpeg\0\3\0' + b'\xff' * 10000),  # Pochette sautée sans être lue
+        frame(3, 'TIT2', b'\0Caf\xe9'),
+        frame(3, 'TPE1', b'\0Artiste\0'),
+        frame(3, 'COMM', b'\0fra\0https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ]))
+    tags = read_id3_tags(path)
+    assert tags['title'] == 'Café'
+    assert tags['artist'] == 'Artiste'
+    assert tags['sources'] == ['https://www.youtube.com/watch?v=dQw4w9WgXcQ']
+
+
+def test_v22_short_frames(tmp_path):
+    path = write(tmp_path, tag(2, [
+        frame(2, 'TT2', b'\0Titre'),
+        frame(2, 'TP1', b'\0Artiste'),
+        frame(2, 'COM', b'\0eng\0https://youtu.be/dQw4w9WgXcQ'),
+        frame(2, 'WAF', b'https://example.com/'),
+    ]))
+    tags = read_id3_tags(path)
+    assert (tags['title'], tags['artist']) == ('Titre', 'Artiste')
+    assert tags['sources'] == ['https://youtu.be/dQw4w9WgXcQ', 'https://example.com/']
+
+
+def test_v24_utf16(tmp_path):
+    title = 'Été ♪'.encode('utf-16')  # Avec BOM
+    # Deux octets nuls à cheval sur deux caractères ("A" puis "Ā") : seul un terminateur aligné compte
+    description = 'AĀ'.encode('utf-16')
+    path = write(tmp_path, tag(4, [
+        frame(4, 'TIT2', b'\1' + title + b'\0\0'),
+        frame(4, 'TPE1', b'\2' + 'Ŝan'.encode('utf-16-be')),
+        frame(4, 'TXXX', b'\1' + description + b'\0\0' + 'purl https://youtu.be/dQw4w9WgXcQ'.encode('utf-16')),
+        frame(4, 'WXXX', b'\1' + 'lien'.encode('utf-16') + b'\0\0' + b'https://example.com/'),
+    ]))
+    tags = read_id3_tags(path)
+    assert tags['title'] == 'Été ♪'
+    assert tags['artist'] == 'Ŝan'
+    assert tags['sources'] == ['AĀ purl https://youtu.be/dQw4w9WgXcQ', 'lien https://example.com/']
+
+
+@pytest.mark.parametrize('major, extended', [
+    (3, (6).to_bytes(4, 'big') + b'\0' * 6),  # v2.3 : taille hors des 4 octets de taille
+    (4, syncsafe(6) + b'\1\0'),  # v2.4 : taille syncsafe, en-tête compris
+])
+def test_extended_header_skipped(tmp_path, major, extended):
+    path = write(tmp_path, tag(major, [frame(major, 'TIT2', b'\3Titre')], flags=0x40, extended=extended))
+    assert read_id3_tags(path)['title'] == 'Titre'
+
+
+def test_no_tag_or_unsupported(tmp_path):
+    empty = {'title': None, 'artist': None, 'sources': []}
+    assert read_id3_tags(write(tmp_path, b'ID3\3')) == empty  # En-tête tronqué
+    assert read_id3_tags(write(tmp_path, b'\xff\xfb' + b'\0' * 100)) == empty  # MP3 sans tag
+    assert read_id3_tags(write(tmp_path, tag(5, [frame(4, 'TIT2', b'\0X')]))) == empty  # Version inconnue
+    assert read_id3_tags(write(tmp_path, tag(3, [frame(3, 'TIT2', b'\0X')], flags=0x80))) == empty  # Désynchronisation
+
+
+def test_truncated_frames(tmp_path):
+    # Taille du tag plus grande que le fichier, dernière frame coupée au milieu
+    data = tag(3, [frame(3, 'TPE1', b'\0Artiste'), frame(3, 'TIT2', b'\0Un titre bien long')], padding=0, size=500)
+    tags = read_id3_tags(write(tmp_path, data[:-8]))
+    assert tags['artist'] == 'Artiste'
+    assert tags['title'] == 'Un titre b'
+    # Coupé au milieu d'un en-tête de frame : la lecture s'arrête sans erreur
+    tags = read_id3_tags(write(tmp_path, data[:len(data) - 22]))
+    assert (tags['title'], tags['artist']) == (None, 'Artiste')
+
+
+def test_index_audio_file_prefers_tag_and_survives_truncation(tmp_path):
+    comment = frame(3, 'COMM', b'\0eng\0https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    path = write(tmp_path, tag(3, [comment]), 'Mon titre [aaaaaaaaaaa].mp3')
+    assert index_audio_file(path) == ('dQw4w9WgXcQ', 'montitre')
+    # En-tête étendu tronqué : tags illisibles, l'ID du nom de fichier suffit
+    path = write(tmp_path, b'ID3\4\0\x40' + syncsafe(100) + b'\0\0', 'Mon titre [aaaaaaaaaaa].mp3')
+    assert index_audio_file(path) == ('aaaaaaaaaaa', 'montitre')
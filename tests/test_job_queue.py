@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from ultra_downloader import QUEUE_MAX_ATTEMPTS, JobQueue, PlaylistEntry
+
+
+def open_queue(path, count):
+    queue = JobQueue(path)
+    queue.enqueue([PlaylistEntry(f'vid{i}', f'Titre {i}') for i in range(count)], 'PL', 'Ma playlist', 'PLid')
+    return queue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = open_queue(tmp_path / 'queue.db', 3)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def single(tmp_path):
+    """Un seul titre : un essai remis en file passe après les titres neufs (available_at)"""
+    queue = open_queue(tmp_path / 'single.db', 1)
+    yield queue
+    queue.close()
+
+
+def state(queue, video_id):
+    return queue._conn.execute("SELECT state, attempts, available_at, error FROM queue_jobs "
+                               "WHERE video_id = ?", (video_id,)).fetchone()
+
+
+def test_claim_is_exclusive(queue):
+    first = queue.claim('w1', 2)
+    assert [job['video_id'] for job in first] == ['vid0', 'vid1']
+    assert first[0]['title'] == 'Titre 0' and first[0]['playlist'] == 'Ma playlist'
+    assert first[0]['claim_token'] == first[1]['claim_token']
+    second = queue.claim('w2', 5)
+    assert [job['video_id'] for job in second] == ['vid2']
+    assert queue.claim('w3', 5) == []
+    assert queue.counts() == {'queued': 0, 'leased': 3, 'done': 0, 'failed': 0}
+
+
+def test_enqueue_keeps_done_and_requeues_failed(queue):
+    done, failed = queue.claim('w1', 2)
+    assert queue.complete(done, '/lib/PL/a.mp3')
+    assert queue.fail(failed, 'Video unavailable', 'permanent') is False
+    assert queue.enqueue([PlaylistEntry('vid0', 'Titre 0'), PlaylistEntry('vid1', 'Titre 1')],
+                         'PL', 'Ma playlist', 'PLid') == 1
+    assert state(queue, 'vid0')[0] == 'done'
+    assert state(queue, 'vid1')[:2] == ('queued', 0)
+
+
+def test_fail_transient_backs_off_then_fails(single):
+    for attempt in range(1, QUEUE_MAX_ATTEMPTS + 1):
+        job = single.claim('w1', 1)[0]
+        assert job['attempts'] == attempt - 1
+        requeued = single.fail(job, 'HTTP Error 429', 'transient', backoff=0)
+        assert requeued is (attempt < QUEUE_MAX_ATTEMPTS)
+    assert state(single, 'vid0')[:2] == ('failed', QUEUE_MAX_ATTEMPTS)
+
+
+def test_fail_backoff_delays_next_claim(queue):
+    job = queue.claim('w1', 1)[0]
+    before = time.time()
+    assert queue.fail(job, 'HTTP Error 429', 'transient', backoff=60) is True
+    assert state(queue, 'vid0')[2] >= before + 60
+    assert [job['video_id'] for job in queue.claim('w1', 5)] == ['vid1', 'vid2']
+
+
+def test_permanent_failure_is_final(queue):
+    job = queue.claim('w1', 1)[0]
+    assert queue.fail(job, 'Private video', 'permanent') is False
+    assert state(queue, 'vid0')[:2] == ('failed', 1)
+
+
+def test_expired_lease_counts_as_attempt(single):
+    for attempt in range(1, QUEUE_MAX_ATTEMPTS + 1):
+        stale = single.claim('w1', 1, lease=0.01)[0]
+        time.sleep(0.02)
+        assert single.requeue_expired(backoff=0) == 1
+        assert state(single, 'vid0')[:2] == ('failed' if attempt == QUEUE_MAX_ATTEMPTS else 'queued', attempt)
+    assert state(single, 'vid0')[3] == 'Bail expiré (worker arrêté ou bloqué)'
+    # Le worker bloqué se réveille : son bail est perdu, il ne peut plus rien écrire
+    assert single.complete(stale, '/lib/PL/a.mp3') is False
+    assert single.fail(stale, 'HTTP Error 429', 'transient') is None
+    assert state(single, 'vid0')[:2] == ('failed', QUEUE_MAX_ATTEMPTS)
+
+
+def test_stale_token_after_reclaim(single):
+    stale = single.claim('w1', 1, lease=0.01)[0]
+    time.sleep(0.02)
+    single.requeue_expired(backoff=0)
+    fresh = single.claim('w2', 1)[0]
+    assert fresh['video_id'] == stale['video_id'] and fresh['attempts'] == 1
+    assert single.complete(stale, '/lib/PL/old.mp3') is False
+    assert single.fail(stale, 'timed out', 'transient') is None
+    assert single.complete(fresh, '/lib/PL/a.mp3') is True
+    assert state(single, 'vid0')[0] == 'done'
+
+
+def test_heartbeat_keeps_lease_and_release_requeues(queue):
+    queue.claim('w1', 2, lease=0.01)
+    queue.heartbeat('w1', lease=60)
+    time.sleep(0.02)
+    assert queue.requeue_expired(backoff=0) == 0
+    queue.release('w1')
+    assert queue.counts() == {'queued': 3, 'leased': 0, 'done': 0, 'failed': 0}
+    assert state(queue, 'vid0')[1] == 0  # Arrêt propre : pas un essai raté
+
+
+def test_folder_for_is_stable_and_unique(queue):
+    assert queue.folder_for('PLid', 'Autre nom') == 'PL'
+    assert queue.folder_for('PLautre', 'PL') == 'PL_1'
@@ -5,39 +5,69 @@ Téléchargement simultané de plusieurs playlists avec multithreading par playl
 """
 
 import yt_dlp
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, Future, wait as wait_futures, FIRST_COMPLETED
 import os
+import shutil
 import logging
 import time
 import threading
 from pathlib import Path
 import sys
+import argparse
 from queue import Queue
+from collections import deque
 import json  # Pour la pause au début
-
-# Créer le dossier logs s'il n'existe pas
-Path("logs").mkdir(exist_ok=True)
+import sqlite3
+import subprocess
+import hashlib
+import tempfile
+import errno
+import random
+import re
+import socket
+import uuid
+import signal
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from yt_dlp.networking import Request
 
 # Configuration du logging avec fichier unique par session
 logger = logging.getLogger("yt_dlp_ultra")
 logger.setLevel(logging.INFO)
+# Rien n'est écrit (ni créé sur le disque) tant que setup_logging() n'a pas été appelé
+logger.addHandler(logging.NullHandler())
 
-# Créer un nom de fichier unique avec timestamp (format DD_MM_YY_HHh_MM_SS)
-session_timestamp = time.strftime("%d_%m_%y_%Hh_%M_%S")
-log_filename = f"logs/ultra_download_{session_timestamp}.log"
+# Logger pour yt-dlp (capture les erreurs internes)
+yt_dlp_logger = logging.getLogger("yt-dlp")
 
-# Handler pour fichier d'erreurs de cette session
-file_handler = logging.FileHandler(log_filename, encoding="utf-8")
-file_handler.setLevel(logging.ERROR)
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-logger.addHandler(file_handler)
+# Renseignés par setup_logging()
+session_timestamp = None
+log_filename = None
+file_handler = None
 
-# PAS de handler console - on veut seulement les logs dans le fichier
-# Les messages normaux seront affichés via print() pour un affichage propre
+def setup_logging():
+    """Crée le dossier logs/ et le fichier de log de la session (au premier appel seulement)"""
+    global session_timestamp, log_filename, file_handler
+    if file_handler is not None:
+        return log_filename
 
-# Logger pour yt-dlp (capture les erreurs internes)
-yt_dlp_logger = logging.getLogger("yt-dlp")
-yt_dlp_logger.addHandler(file_handler)
+    # Créer le dossier logs s'il n'existe pas
+    Path("logs").mkdir(exist_ok=True)
+
+    # Créer un nom de fichier unique avec timestamp (format DD_MM_YY_HHh_MM_SS)
+    session_timestamp = time.strftime("%d_%m_%y_%Hh_%M_%S")
+    log_filename = f"logs/ultra_download_{session_timestamp}.log"
+
+    # Handler pour fichier d'erreurs de cette session
+    file_handler = logging.FileHandler(log_filename, encoding="utf-8")
+    file_handler.setLevel(logging.INFO)  # INFO : décisions du contrôleur adaptatif + erreurs
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(file_handler)
+
+    # PAS de handler console - on veut seulement les logs dans le fichier
+    # Les messages normaux seront affichés via print() pour un affichage propre
+    yt_dlp_logger.addHandler(file_handler)
+    return log_filename
 
 # Logger silencieux pour yt-dlp (aucune sortie)
 class SilentLogger:
@@ -46,13 +76,91 @@ class SilentLogger:
     def error(self, msg): pass
     def info(self, msg): pass
 
+# Bibliothèque de téléchargement et manifeste persistant (clé = ID vidéo YouTube)
+LIBRARY_DIR = Path("downloads")
+MANIFEST_FILENAME = ".ultra_manifest.sqlite3"
+MP3_QUALITY = '320'
+FFMPEG_BIN = 'ffmpeg'
+FRAGMENT_DOWNLOADS = 16
+RATE_BURST = 0.25  # Limite de débit : rafale max tolérée au-dessus de la limite (secondes de débit)
+OUTPUT_TEMPLATE = '%(title).100s.%(ext)s'
+SCRATCH_DIR = None  # Dossier de travail (téléchargement + conversion) ; None = downloads/.staging
+PLAYLIST_CACHE_TTL = 900  # Validité du cache disque des playlists entre deux runs (secondes)
+PLAYLIST_CACHE_MAX_ENTRIES = 5000  # Playlists plus longues : jamais gardées en entier, relues en streaming au téléchargement
+PLAYLIST_CACHE_MEMORY_ENTRIES = 50000  # Titres de playlists gardés en mémoire au total (préchargement, vérification)
+METADATA_CONCURRENCY = 16  # Extractions à plat simultanées (vérification, préchargement, chaînes)
+RETRY_ROUNDS = 2  # Fin de run : nouveaux essais des échecs temporaires
+RETRY_BACKOFF = 30  # Délai avant le premier nouvel essai (secondes), doublé à chaque tour
+SUBMIT_WINDOW = 64  # Titres en vol max par playlist (en file, en téléchargement ou en conversion)
+FAILED_TITLES_KEPT = 100  # Stats finales : titres en échec gardés par playlist (le nombre reste exact)
+INDEX_THREADS = 8  # Commande index : fichiers lus en parallèle
+INDEX_BATCH = 1000  # Commande index : fichiers par lot (lecture puis une transaction SQLite)
+QUEUE_LEASE = 120  # Mode distribué : durée d'un bail sur un titre, prolongée par le heartbeat (secondes)
+QUEUE_POLL = 5  # Mode distribué : intervalle de surveillance de la file (secondes)
+QUEUE_MAX_ATTEMPTS = 3  # Mode distribué : essais d'un titre (tous workers confondus) avant l'échec définitif
+DAEMON_HOST = '127.0.0.1'  # Mode démon : adresse de l'API HTTP (locale seulement par défaut)
+DAEMON_PORT = 8770
+DAEMON_INTERVAL = 3600  # Mode démon : intervalle entre deux passages sur les playlists surveillées (secondes)
+DAEMON_JITTER = 0.1  # Mode démon : intervalle tiré au hasard à ± 10 % pour ne pas tomber toujours à la même seconde
+DAEMON_EVENT_INTERVAL = 1  # Mode démon : une mise à jour du flux de progression par seconde au plus tard
+DAEMON_JOBS_KEPT = 100  # Mode démon : lots terminés gardés pour /jobs
+
+METRICS_DIR = Path("logs")  # Rapport JSON de la session + fichier Prometheus (textfile collector)
+PROMETHEUS_FILENAME = "ultra_downloader.prom"
+METRICS_INTERVAL = 30  # Export des métriques pendant le run (secondes)
+STREAM_BLOCK_SIZE = 256 * 1024  # Mode pipe : taille des blocs envoyés à ffmpeg
+PROFILE_INTERVAL = 0.02  # Mode profilage : une photo des piles de tous les threads toutes les 20 ms
+PROGRESS_REFRESH = 0.5  # Rafraîchissement du tableau de progression en terminal (secondes)
+PROGRESS_PLAIN_INTERVAL = 10  # Hors terminal (cron, fichier) : une ligne de résumé toutes les N secondes
+
+class ConsoleLock:
+    """Verrou d'affichage : efface le tableau de progression avant chaque message"""
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        progress_board.erase()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
 # Verrous pour éviter les conflits
-print_lock = threading.Lock()
+print_lock = ConsoleLock()
 stats_lock = threading.Lock()
 
-# Dictionnaire pour stocker les lignes de progression actives
-active_downloads = {}
-download_lock = threading.Lock()
+class FailedTitles:
+    """Échecs d'une playlist : le nombre exact, mais seulement les FAILED_TITLES_KEPT premiers titres
+
+    La liste complète est dans le journal du manifeste (--retry-failed) ; ici on garde
+    de quoi l'afficher, sans grossir avec une playlist de 10 000 titres indisponibles.
+    """
+    __slots__ = ('titles', 'more')
+
+    def __init__(self):
+        self.titles = []
+        self.more = 0  # Échecs au-delà des titres gardés
+
+    def __len__(self):
+        return len(self.titles) + self.more
+
+    def add(self, title):
+        if len(self.titles) < FAILED_TITLES_KEPT:
+            self.titles.append(title)
+        else:
+            self.more += 1
+
+    def remove(self, title, counted=False):
+        """Retire un échec ; counted=True : l'appelant sait que ce titre a été ajouté
+
+        Un titre absent de la liste n'est décompté des échecs non gardés que dans ce cas :
+        sinon rien ne dit qu'il a été ajouté, et on fausserait le compte d'un autre titre.
+        """
+        if title in self.titles:
+            self.titles.remove(title)
+        elif counted and self.more:
+            self.more -= 1
 
 class GlobalStats:
     """Statistiques globales thread-safe"""
@@ -63,13 +171,18 @@ class GlobalStats:
         self.videos_completed = 0
         self.videos_failed = 0
         self.start_time = None
-        self.failed_videos_by_playlist = {}  # Dict: playlist_name -> [failed_videos]
+        self.failed_videos_by_playlist = {}  # Dict: playlist_name -> FailedTitles
 
     def add_playlist(self, video_count):
         with stats_lock:
             self.playlists_total += 1
             self.videos_total += video_count
 
+    def add_videos(self, video_count):
+        """Ajoute des vidéos au total (extraction en streaming)"""
+        with stats_lock:
+            self.videos_total += video_count
+
     def complete_playlist(self):
         with stats_lock:
             self.playlists_completed += 1
@@ -82,10 +195,28 @@ class GlobalStats:
         with stats_lock:
             self.videos_failed += 1
 
-    def add_failed_videos(self, playlist_name, failed_videos):
+    def add_failed_video(self, playlist_name, title):
+        with stats_lock:
+            failed_videos = self.failed_videos_by_playlist.get(playlist_name)
+            if failed_videos is None:
+                failed_videos = self.failed_videos_by_playlist[playlist_name] = FailedTitles()
+            failed_videos.add(title)
+
+    def requeue_failure(self):
+        """Échec temporaire remis dans la file partagée (jamais noté par add_failed_video)"""
         with stats_lock:
+            self.videos_failed = max(0, self.videos_failed - 1)
+
+    def reopen_failure(self, playlist_name, title, counted=False):
+        """Un échec repart dans la file d'attente : il n'est plus compté comme échec
+
+        counted=True si le titre a été noté par add_failed_video (voir FailedTitles.remove).
+        """
+        with stats_lock:
+            self.videos_failed = max(0, self.videos_failed - 1)
+            failed_videos = self.failed_videos_by_playlist.get(playlist_name)
             if failed_videos:
-                self.failed_videos_by_playlist[playlist_name] = failed_videos
+                failed_videos.remove(title, counted)
 
     def get_stats(self):
         with stats_lock:
@@ -94,6 +225,538 @@ class GlobalStats:
 
 global_stats = GlobalStats()
 
+class DownloadManifest:
+    """Manifeste SQLite des titres terminés : ID vidéo -> fichier final, taille, bitrate, date"""
+    def __init__(self, library_dir=LIBRARY_DIR):
+        self.library_dir = Path(library_dir)
+        self.library_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.library_dir / MANIFEST_FILENAME
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # En WAL, NORMAL reste cohérent après un crash (seul le dernier commit peut être perdu, et le
+            # journal des titres le rattrape) sans fsync à chaque commit
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    video_id TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    bitrate INTEGER,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, folder)
+                )""")
+            # Cache disque des métadonnées de playlists (extraction à plat)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlist_cache (
+                    url TEXT PRIMARY KEY,
+                    title TEXT,
+                    playlist_id TEXT,
+                    entries TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )""")
+            # Mode synchro : une playlist (par ID) = un dossier stable
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlists (
+                    playlist_id TEXT PRIMARY KEY,
+                    folder TEXT NOT NULL,
+                    title TEXT,
+                    synced_at REAL
+                )""")
+            # Journal des titres en cours (écrit AVANT chaque étape) : reprise après un crash
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    video_id TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    title TEXT,
+                    source_path TEXT,
+                    info TEXT,
+                    updated_at REAL NOT NULL,
+                    playlist TEXT,
+                    error TEXT,
+                    failure_class TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    final_path TEXT,
+                    bitrate INTEGER,
+                    PRIMARY KEY (video_id, folder)
+                )""")
+            # Journal créé par une version précédente : colonnes ajoutées à la volée
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column in ('playlist TEXT', 'error TEXT', 'failure_class TEXT',
+                           'attempts INTEGER NOT NULL DEFAULT 0', 'final_path TEXT', 'bitrate INTEGER'):
+                if column.split()[0] not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            # Index des fichiers de la bibliothèque (commande index) : relu seulement si taille ou date changent
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS library_files (
+                    path TEXT PRIMARY KEY,
+                    folder TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    video_id TEXT,
+                    title_key TEXT,
+                    indexed_at REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS library_files_title ON library_files (folder, title_key)")
+            # Dernier test Premium, valable pour une empreinte de cookies.txt donnée
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS premium_probe (
+                    cookies_key TEXT PRIMARY KEY,
+                    is_premium INTEGER NOT NULL,
+                    message TEXT NOT NULL,
+                    checked_at REAL NOT NULL
+                )""")
+
+    def _folder_key(self, folder):
+        """Nom du dossier relatif à la bibliothèque (clé stable même si on change de cwd)"""
+        folder = Path(folder)
+        try:
+            return folder.resolve().relative_to(self.library_dir.resolve()).as_posix()
+        except ValueError:
+            return folder.resolve().as_posix()
+
+    def _row_to_dict(self, row):
+        if not row:
+            return None
+        video_id, folder, path, size, bitrate, completed_at = row
+        return {
+            'video_id': video_id,
+            'folder': folder,
+            'path': self.library_dir / path,
+            'size': size,
+            'bitrate': bitrate,
+            'completed_at': completed_at,
+        }
+
+    def lookup(self, video_id, folder):
+        """Retourne l'entrée du manifeste pour cette vidéo dans ce dossier (ou None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT video_id, folder, path, size, bitrate, completed_at FROM tracks "
+                "WHERE video_id = ? AND folder = ?",
+                (video_id, self._folder_key(folder))).fetchone()
+        return self._row_to_dict(row)
+
+    def is_complete(self, video_id, folder):
+        """Vrai si la vidéo est dans le manifeste ET que le fichier est toujours là, intact"""
+        entry = self.lookup(video_id, folder)
+        if not entry:
+            return False
+        try:
+            if entry['path'].stat().st_size == entry['size']:
+                return True
+        except OSError:
+            pass
+        # Fichier supprimé ou modifié à la main : on l'oublie pour le retélécharger
+        self.forget(video_id, folder)
+        return False
+
+    def record(self, video_id, file_path, bitrate=None):
+        """Enregistre un fichier final validé (appelé uniquement après validation)"""
+        file_path = Path(file_path)
+        folder = self._folder_key(file_path.parent)
+        rel_path = f"{folder}/{file_path.name}"
+        size = file_path.stat().st_size
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tracks (video_id, folder, path, size, bitrate, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, folder, rel_path, size, bitrate, time.time()))
+            # Même transaction : le titre n'est jamais "fini" dans un fichier et "en cours" dans l'autre
+            self._conn.execute("UPDATE jobs SET state = 'done', final_path = NULL, updated_at = ? "
+                               "WHERE video_id = ? AND folder = ?", (time.time(), video_id, folder))
+
+    def set_final_path(self, video_id, folder, final_path, bitrate=None):
+        """Écrit dans le journal le nom final choisi, AVANT la publication du fichier"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET final_path = ?, bitrate = ?, updated_at = ? "
+                               "WHERE video_id = ? AND folder = ?",
+                               (str(final_path), bitrate, time.time(), video_id, self._folder_key(folder)))
+
+    def adopt_published_file(self, video_id, folder):
+        """Crash entre la publication et l'écriture du manifeste : le fichier noté dans le journal
+        est déjà en place, il est enregistré tel quel. Retourne son chemin, ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT final_path, bitrate FROM jobs WHERE video_id = ? AND folder = ? AND final_path IS NOT NULL",
+                (video_id, self._folder_key(folder))).fetchone()
+        if not row:
+            return None
+        final_path = Path(row[0])
+        # Nom choisi libre par final_path_for, puis publié d'un seul renommage : s'il existe, c'est ce titre
+        if not final_path.is_file() or not final_path.stat().st_size:
+            return None
+        self.record(video_id, final_path, bitrate=row[1])
+        return final_path
+
+    def forget(self, video_id, folder):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tracks WHERE video_id = ? AND folder = ?",
+                               (video_id, self._folder_key(folder)))
+
+    def lookup_any(self, video_id):
+        """Une copie intacte de cette vidéo n'importe où dans la bibliothèque (ou None)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, folder, path, size, bitrate, completed_at FROM tracks WHERE video_id = ?",
+                (video_id,)).fetchall()
+        for row in rows:
+            entry = self._row_to_dict(row)
+            try:
+                if entry['path'].stat().st_size == entry['size']:
+                    return entry
+            except OSError:
+                continue
+        return None
+
+    def tracks_in_folder(self, folder):
+        """Toutes les entrées du manifeste pour un dossier : {video_id: entrée}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, folder, path, size, bitrate, completed_at FROM tracks WHERE folder = ?",
+                (self._folder_key(folder),)).fetchall()
+        return {row[0]: self._row_to_dict(row) for row in rows}
+
+    def get_playlist_folder(self, playlist_id):
+        """Dossier associé à une playlist en mode synchro (ou None)"""
+        with self._lock:
+            row = self._conn.execute("SELECT folder FROM playlists WHERE playlist_id = ?",
+                                     (playlist_id,)).fetchone()
+        return self.library_dir / row[0] if row else None
+
+    def folder_owner(self, folder):
+        """ID de la playlist synchronisée dans ce dossier (ou None)"""
+        with self._lock:
+            row = self._conn.execute("SELECT playlist_id FROM playlists WHERE folder = ?",
+                                     (self._folder_key(folder),)).fetchone()
+        return row[0] if row else None
+
+    def set_playlist_folder(self, playlist_id, folder, title=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO playlists (playlist_id, folder, title, synced_at) VALUES (?, ?, ?, ?)",
+                (playlist_id, self._folder_key(folder), title, time.time()))
+
+    def load_playlist_cache(self, url, max_age):
+        """(fetched_at, titre, entrées, ID playlist) si le cache disque a moins de max_age secondes"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, playlist_id, entries, fetched_at FROM playlist_cache WHERE url = ? AND fetched_at >= ?",
+                (url, time.time() - max_age)).fetchone()
+        if not row:
+            return None
+        title, playlist_id, entries, fetched_at = row
+        return fetched_at, title, json.loads(entries), playlist_id
+
+    def save_playlist_cache(self, url, title, entries, playlist_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO playlist_cache (url, title, playlist_id, entries, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, title, playlist_id, json.dumps(entries, ensure_ascii=False), time.time()))
+
+    # Journal des titres : queued -> downloading -> transcoding -> done (ou failed)
+    JOB_STATES = ('queued', 'downloading', 'transcoding', 'done', 'failed')
+
+    def set_job_state(self, video_id, folder, state, title=None, source_path=None, info=None,
+                      error=None, failure_class=None):
+        """Écrit l'état d'un titre avant de lancer l'étape correspondante (un échec incrémente attempts)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (video_id, folder, state, title, source_path, info, updated_at, "
+                "error, failure_class, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (video_id, folder) DO UPDATE SET state = excluded.state, "
+                "title = COALESCE(excluded.title, title), source_path = COALESCE(excluded.source_path, source_path), "
+                "info = COALESCE(excluded.info, info), updated_at = excluded.updated_at, "
+                "error = COALESCE(excluded.error, error), failure_class = COALESCE(excluded.failure_class, failure_class), "
+                "attempts = attempts + excluded.attempts",
+                (video_id, self._folder_key(folder), state, title,
+                 str(source_path) if source_path else None,
+                 json.dumps(info, ensure_ascii=False) if info else None, time.time(),
+                 error, failure_class, 1 if state == 'failed' else 0))
+
+    def mark_done(self, video_id, folder):
+        """Titre trouvé déjà fini : passe son entrée du journal à 'done', sans écriture si elle l'est déjà"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET state = 'done', updated_at = ? "
+                               "WHERE video_id = ? AND folder = ? AND state != 'done'",
+                               (time.time(), video_id, self._folder_key(folder)))
+
+    def queue_job(self, video_id, folder, title=None, playlist=None):
+        """Met un titre en file sans écraser l'étape atteinte par un run interrompu"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (video_id, folder, state, title, playlist, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?) "
+                "ON CONFLICT (video_id, folder) DO UPDATE SET state = 'queued', playlist = excluded.playlist, "
+                "error = NULL, failure_class = NULL, attempts = 0, updated_at = excluded.updated_at "
+                "WHERE state IN ('done', 'failed')",
+                (video_id, self._folder_key(folder), title, playlist, time.time()))
+
+    def get_job(self, video_id, folder):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, title, source_path, info, error, failure_class FROM jobs "
+                "WHERE video_id = ? AND folder = ?",
+                (video_id, self._folder_key(folder))).fetchone()
+        if not row:
+            return None
+        state, title, source_path, info, error, failure_class = row
+        return {'state': state, 'title': title,
+                'source_path': Path(source_path) if source_path else None,
+                'info': json.loads(info) if info else None,
+                'error': error, 'failure_class': failure_class}
+
+    def pending_jobs(self):
+        """Titres interrompus (ni finis ni en échec) : {video_id: état}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, state FROM jobs WHERE state NOT IN ('done', 'failed')").fetchall()
+        return dict(rows)
+
+    def has_pending_jobs(self, folder):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM jobs WHERE folder = ? AND state NOT IN ('done', 'failed') LIMIT 1",
+                (self._folder_key(folder),)).fetchone() is not None
+
+    def prune_done_jobs(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE state = 'done'")
+
+    def failed_jobs(self, since=None, include_permanent=False):
+        """Titres en échec (depuis `since` si donné), du plus ancien au plus récent
+
+        Chaque entrée suffit à relancer le titre sans réextraire sa playlist.
+        """
+        query = ("SELECT video_id, folder, title, playlist, error, failure_class, attempts, updated_at "
+                 "FROM jobs WHERE state = 'failed'")
+        params = []
+        if since is not None:
+            query += " AND updated_at >= ?"
+            params.append(since)
+        if not include_permanent:
+            query += " AND COALESCE(failure_class, 'transient') != 'permanent'"
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY updated_at", params).fetchall()
+        return [{'video_id': video_id, 'folder': self.library_dir / folder, 'title': title,
+                 'playlist': playlist or Path(folder).name, 'error': error,
+                 'failure_class': failure_class or 'transient', 'attempts': attempts, 'failed_at': failed_at}
+                for video_id, folder, title, playlist, error, failure_class, attempts, failed_at in rows]
+
+    def unfinished_job_ids(self):
+        """IDs vidéo encore suivis par le journal (en cours ou en échec)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT video_id FROM jobs WHERE state != 'done'").fetchall()
+        return {row[0] for row in rows}
+
+    def indexed_files(self):
+        """Fichiers déjà indexés : {chemin relatif: (taille, mtime)}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, size, mtime FROM library_files").fetchall()
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def save_indexed_files(self, rows):
+        """Enregistre un lot de fichiers indexés (chemin, dossier, taille, mtime, ID vidéo, clé de titre)
+
+        Un fichier dont l'ID vidéo est connu entre directement dans le manifeste des titres
+        (sans remplacer un titre déjà suivi ailleurs dans ce dossier).
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO library_files (path, folder, size, mtime, video_id, title_key, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(path, folder, size, mtime, video_id, key, now) for path, folder, size, mtime, video_id, key in rows])
+            self._conn.executemany(
+                "INSERT INTO tracks (video_id, folder, path, size, bitrate, completed_at) VALUES (?, ?, ?, ?, NULL, ?) "
+                "ON CONFLICT (video_id, folder) DO UPDATE SET size = excluded.size WHERE tracks.path = excluded.path",
+                [(video_id, folder, path, size, mtime) for path, folder, size, mtime, video_id, _ in rows if video_id])
+
+    def forget_indexed_files(self, paths):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM library_files WHERE path = ?", [(path,) for path in paths])
+
+    def adopt_indexed_file(self, video_id, folder, title):
+        """Fichier indexé sans ID vidéo (bibliothèque d'avant le manifeste) dont le nom correspond au titre :
+        il est enregistré comme ce titre. Retourne son chemin, ou None"""
+        key = title_key(title)
+        if not key:
+            return None
+        folder_key = self._folder_key(folder)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size FROM library_files WHERE folder = ? AND title_key = ? AND video_id IS NULL LIMIT 1",
+                (folder_key, key)).fetchone()
+        if not row:
+            return None
+        path, size = row
+        try:
+            if (self.library_dir / path).stat().st_size != size:
+                return None
+        except OSError:
+            return None
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE library_files SET video_id = ? WHERE path = ?", (video_id, path))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tracks (video_id, folder, path, size, bitrate, completed_at) "
+                "VALUES (?, ?, ?, ?, NULL, ?)", (video_id, folder_key, path, size, time.time()))
+        return self.library_dir / path
+
+    def load_premium_probe(self, cookies_key, max_age):
+        """(checked_at, is_premium, message) si ces cookies ont été testés il y a moins de max_age secondes"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checked_at, is_premium, message FROM premium_probe WHERE cookies_key = ? AND checked_at >= ?",
+                (cookies_key, time.time() - max_age)).fetchone()
+        if not row:
+            return None
+        checked_at, is_premium, message = row
+        return checked_at, bool(is_premium), message
+
+    def save_premium_probe(self, cookies_key, is_premium, message):
+        """Garde seulement le dernier test : d'autres cookies = autre compte, ancien résultat inutile"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM premium_probe")
+            self._conn.execute(
+                "INSERT INTO premium_probe (cookies_key, is_premium, message, checked_at) VALUES (?, ?, ?, ?)",
+                (cookies_key, int(is_premium), message, time.time()))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest():
+    """Manifeste de la bibliothèque, ouvert à la première utilisation"""
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = DownloadManifest(LIBRARY_DIR)
+        return _manifest
+
+class TrackStore:
+    """Déduplication des téléchargements en cours à l'échelle de la bibliothèque (clé = ID vidéo)"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # Dict: video_id -> Future(chemin du MP3 ou None)
+
+    def claim(self, video_id):
+        """(True, future) si on doit télécharger nous-mêmes, (False, future) si quelqu'un s'en occupe déjà"""
+        with self._lock:
+            pending = self._in_flight.get(video_id)
+            if pending is not None:
+                return False, pending
+            pending = Future()
+            self._in_flight[video_id] = pending
+            return True, pending
+
+    def release(self, video_id, mp3_path):
+        """Publie le résultat du téléchargement aux playlists qui l'attendent"""
+        with self._lock:
+            pending = self._in_flight.pop(video_id, None)
+        if pending is not None:
+            pending.set_result(mp3_path)
+
+track_store = TrackStore()
+
+# Échecs qui ne changeront pas en réessayant (vérifiés après les motifs temporaires)
+PERMANENT_FAILURE_MARKERS = ('premium', 'private', 'unavailable', 'not available', 'removed', 'copyright',
+                             'confirm your age', 'members', 'does not exist', 'terminated')
+# "Service Unavailable", "temporarily unavailable"... : à retenter malgré le mot "unavailable".
+# Codes HTTP en motifs : un ID vidéo peut contenir "503" ou "429"
+TRANSIENT_FAILURE_RE = re.compile(r'http error (?:403|429)|\b50[0234]\b|too many requests|rate limit|forbidden|'
+                                  r'not a bot|service unavailable|temporar|timed out|timeout|connection|'
+                                  r'reset by peer|ssl|incomplete|network')
+# Préfixe "[youtube] <id>: " des messages yt-dlp, et URLs : ils portent l'ID vidéo, pas la cause
+FAILURE_CONTEXT_RE = re.compile(r'\[[\w:.-]+\] [\w-]+: |https?://\S+')
+
+def classify_failure(error):
+    """'transient' (réseau, throttling...) ou 'permanent' (Premium, privé, supprimé...)
+
+    Inconnu = temporaire : le nombre d'essais est borné de toute façon.
+    """
+    error = FAILURE_CONTEXT_RE.sub(' ', (error or '').lower())
+    if TRANSIENT_FAILURE_RE.search(error):
+        return 'transient'
+    if any(marker in error for marker in PERMANENT_FAILURE_MARKERS):
+        return 'permanent'
+    return 'transient'
+
+class FailureNotes:
+    """Dernière erreur de chaque vidéo en cours, lue quand son échec est écrit dans le journal"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._errors = {}  # Dict: video_id -> message d'erreur
+
+    def note(self, video_id, error):
+        with self._lock:
+            self._errors[video_id] = str(error)
+
+    def pop(self, video_id):
+        """(message, classe) de la dernière erreur notée"""
+        with self._lock:
+            error = self._errors.pop(video_id, None)
+        return error, classify_failure(error)
+
+failure_notes = FailureNotes()
+
+# ioctl FICLONE (Linux) : copie "reflink" instantanée sur btrfs/xfs
+FICLONE = 0x40049409
+
+def link_track(video_id, source_path, output_path):
+    """Place le fichier dans le dossier cible via hardlink, sinon reflink, sinon copie
+
+    Aucun fichier existant n'est jamais remplacé : si un autre titre porte déjà ce nom
+    dans la playlist, le lien est suffixé par l'ID vidéo (comme final_path_for).
+    """
+    source_path = Path(source_path)
+    target = Path(output_path) / source_path.name
+    if target.exists() and target.samefile(source_path):
+        return target
+    target = final_path_for(video_id, source_path, output_path)
+    if target.exists():
+        return target  # Déjà placé pour ce titre (nom suffixé par son ID, ou enregistré au manifeste)
+
+    try:
+        os.link(source_path, target)
+        return target
+    except OSError:
+        pass
+
+    part_path = part_path_for(target)
+    try:
+        try:
+            import fcntl
+            with open(source_path, 'rb') as src, open(part_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except (ImportError, OSError):
+            shutil.copy2(source_path, part_path)
+        os.replace(part_path, target)
+    except OSError:
+        part_path.unlink(missing_ok=True)
+        raise
+    return target
+
+def publish_shared_track(video_id, source_path, output_path, playlist_name):
+    """Rend disponible dans cette playlist un MP3 déjà téléchargé pour une autre"""
+    manifest = get_manifest()
+    try:
+        target = link_track(video_id, source_path, output_path)
+        source_entry = manifest.lookup_any(video_id)
+        manifest.record(video_id, target, bitrate=source_entry['bitrate'] if source_entry else None)
+        with print_lock:
+            print(f"🔗 Déjà dans la bibliothèque: {target.name[:50]}")
+        return True
+    except Exception as e:
+        logger.error(f"[{playlist_name}] Erreur lien {source_path}: {e}")
+        return False
+
 def safe_print(message):
     """Impression thread-safe avec horodatage"""
     with print_lock:
@@ -101,21 +764,584 @@ def safe_print(message):
         print(f"[{timestamp}] {message}")
 
 def progress_hook(d):
-    """Hook de progression simple - une ligne par téléchargement"""
+    """Hook de progression yt-dlp : enregistre l'état du thread, sans rien afficher ni verrouiller"""
+    slot = progress_board.slot()
     if d['status'] == 'downloading':
+        slot.downloaded = d.get('downloaded_bytes') or 0
+        slot.total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+    elif d['status'] == 'finished':
+        slot.downloaded = slot.total = d.get('downloaded_bytes') or d.get('total_bytes') or slot.downloaded
+
+class WorkerProgress:
+    """État de progression d'un thread de téléchargement (écrit par ce thread seulement)"""
+    __slots__ = ('playlist', 'downloaded', 'total', 'finished_bytes')
+
+    def __init__(self):
+        self.playlist = None
+        self.downloaded = 0
+        self.total = 0
+        self.finished_bytes = 0  # Octets des téléchargements terminés par ce thread
+
+class ProgressBoard:
+    """Tableau de progression agrégé, redessiné par un seul thread à fréquence fixe
+
+    Les threads de téléchargement écrivent seulement dans leur WorkerProgress
+    (pas de verrou, pas d'I/O terminal). Le thread d'affichage lit tous les
+    états et dessine une barre par playlist + débit total + ETA. Hors terminal,
+    une simple ligne de résumé est écrite de temps en temps.
+    """
+    MAX_PLAYLIST_LINES = 8
+    BAR_WIDTH = 24
+
+    def __init__(self):
+        self._local = threading.local()
+        self._slots = []
+        self._slots_lock = threading.Lock()  # Seulement à la création d'un slot (une fois par thread)
+        self._counts = {}  # Dict: playlist -> [total, terminés, échecs]
+        self._counts_lock = threading.Lock()
+        self._drawn_lines = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._rate_lock = threading.Lock()  # Débit lissé : lu par l'affichage et par l'API du démon
+        self._started_at = self._last_time = time.time()
+        self._last_bytes = 0
+        self._rate = 0.0
+        self.mode = 'off'
+
+    def slot(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            slot = self._local.slot = WorkerProgress()
+            with self._slots_lock:
+                self._slots.append(slot)
+        return slot
+
+    def start_track(self, playlist):
+        slot = self.slot()
+        slot.playlist = playlist
+        slot.downloaded = slot.total = 0
+
+    def end_track(self):
+        slot = self.slot()
+        slot.finished_bytes += slot.downloaded
+        slot.playlist = None
+        slot.downloaded = slot.total = 0
+
+    def add_tracks(self, playlist, count):
+        with self._counts_lock:
+            self._counts.setdefault(playlist, [0, 0, 0])[0] += count
+
+    def track_done(self, playlist, ok):
+        with self._counts_lock:
+            counts = self._counts.setdefault(playlist, [0, 0, 0])
+            counts[1] += 1
+            if not ok:
+                counts[2] += 1
+
+    def reset_counts(self):
+        """Repart d'un tableau vide (démon : nouveau lot de travail après une période d'inactivité)"""
+        with self._counts_lock:
+            self._counts = {}
+        self._started_at = time.time()
+
+    def start(self, mode='auto'):
+        """mode : 'live' (terminal), 'plain' (lignes de résumé), 'off', ou 'auto' selon stdout"""
+        if mode == 'auto':
+            mode = 'live' if sys.stdout.isatty() else 'plain'
+        self.mode = mode
+        self._started_at = time.time()
+        if mode == 'off' or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="progress-board", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self.mode == 'plain':
+            self._render_plain()
+        with print_lock:
+            self.erase()  # Les stats finales s'affichent sous les derniers messages, sans tableau
+        self.mode = 'off'
+
+    def _run(self):
+        interval = PROGRESS_REFRESH if self.mode == 'live' else PROGRESS_PLAIN_INTERVAL
+        while not self._stop.wait(interval):
+            try:
+                if self.mode == 'live':
+                    self._render_live()
+                else:
+                    self._render_plain()
+            except Exception as e:
+                logger.error(f"Erreur affichage progression: {e}")
+
+    def _snapshot(self):
+        """Compteurs par playlist + fraction en cours + débit lissé"""
+        with self._slots_lock:
+            slots = list(self._slots)
+        with self._counts_lock:
+            counts = {name: list(values) for name, values in self._counts.items()}
+
+        in_flight = {}
+        total_bytes = 0
+        active = 0
+        for slot in slots:
+            playlist, downloaded, total = slot.playlist, slot.downloaded, slot.total
+            total_bytes += slot.finished_bytes + downloaded
+            if playlist is not None:
+                active += 1
+                if total:
+                    in_flight[playlist] = in_flight.get(playlist, 0.0) + min(downloaded / total, 1.0)
+
+        now = time.time()
+        with self._rate_lock:
+            elapsed = now - self._last_time
+            if elapsed > 0:
+                instant = max(total_bytes - self._last_bytes, 0) / elapsed
+                self._rate = instant if not self._rate else 0.7 * self._rate + 0.3 * instant
+            self._last_bytes, self._last_time = total_bytes, now
+
+        tracks_total = sum(values[0] for values in counts.values())
+        tracks_done = sum(values[1] for values in counts.values())
+        eta = None
+        run_time = now - self._started_at
+        if tracks_done and tracks_total > tracks_done:
+            eta = (tracks_total - tracks_done) * run_time / tracks_done
+        return counts, in_flight, active, tracks_done, tracks_total, eta
+
+    def snapshot(self):
+        """Même état que le tableau, en dict (API du démon)"""
+        counts, in_flight, active, done, total, eta = self._snapshot()
+        return {
+            'tracks': {'done': done, 'failed': sum(values[2] for values in counts.values()), 'total': total},
+            'active': active,
+            'bytes_per_second': round(self._rate),
+            'eta_seconds': round(eta) if eta is not None else None,
+            'playlists': {name: {'done': playlist_done, 'failed': playlist_failed, 'total': playlist_total,
+                                 'in_flight': round(in_flight.get(name, 0.0), 3)}
+                          for name, (playlist_total, playlist_done, playlist_failed) in counts.items()},
+        }
+
+    @staticmethod
+    def _format_eta(eta):
+        if eta is None:
+            return "--:--"
+        minutes, seconds = divmod(int(eta), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}h{minutes:02d}m" if hours else f"{minutes:02d}:{seconds:02d}"
+
+    def _render_plain(self):
+        counts, _, active, done, total, eta = self._snapshot()
+        failed = sum(values[2] for values in counts.values())
+        safe_print(f"📊 {done}/{total} titres ({failed} échecs), {active} en cours, "
+                   f"{format_rate(self._rate)} ({network_budget.describe()}), ETA {self._format_eta(eta)}")
+
+    def _render_live(self):
+        counts, in_flight, active, done, total, eta = self._snapshot()
+        lines = []
+        pending = [(name, values) for name, values in counts.items() if values[1] < values[0]]
+        for name, (playlist_total, playlist_done, playlist_failed) in pending[:self.MAX_PLAYLIST_LINES]:
+            fraction = min((playlist_done + in_flight.get(name, 0.0)) / playlist_total, 1.0)
+            filled = int(fraction * self.BAR_WIDTH)
+            bar = '█' * filled + '░' * (self.BAR_WIDTH - filled)
+            failed = f" \033[91m{playlist_failed}✗\033[0m" if playlist_failed else ""
+            lines.append(f"  \033[94m{name[:30]:<30}\033[0m {bar} {playlist_done}/{playlist_total}{failed}")
+        if len(pending) > self.MAX_PLAYLIST_LINES:
+            lines.append(f"  … +{len(pending) - self.MAX_PLAYLIST_LINES} playlists")
+        lines.append(f"\033[95m📊 {done}/{total} titres, {active} en cours, "
+                     f"{format_rate(self._rate)} ({network_budget.describe()}), ETA {self._format_eta(eta)}\033[0m")
+
+        with print_lock:  # Efface l'ancien tableau puis dessine le nouveau d'un seul write
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+            self._drawn_lines = len(lines)
+
+    def erase(self):
+        """Efface le tableau dessiné (appelé avec print_lock déjà pris)"""
+        if self._drawn_lines:
+            sys.stdout.write(f"\033[{self._drawn_lines}A\r\033[J")
+            sys.stdout.flush()
+            self._drawn_lines = 0
+
+# Instance globale du tableau de progression
+progress_board = ProgressBoard()
+
+class StageTimer:
+    """Durées d'une étape : compteur, somme, min/max et histogramme cumulatif (style Prometheus)"""
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self, bounds):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * len(bounds)
+
+    def to_dict(self, bounds):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.total, 4),
+            'avg_seconds': round(self.total / self.count, 4) if self.count else None,
+            'min_seconds': round(self.min, 4) if self.min is not None else None,
+            'max_seconds': round(self.max, 4),
+            'buckets': {str(bound): count for bound, count in zip(bounds, self.buckets)},
+        }
+
+class RunMetrics:
+    """Mesures d'un run : durée de chaque étape d'un titre, octets, retries
+
+    Étapes : playlist_extract, queue_wait, manifest_lookup, extract, download,
+    transcode_wait, postprocess, validate, cleanup. Exportées en JSON et au format
+    texte Prometheus, à la fin du run et toutes les METRICS_INTERVAL secondes.
+    """
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+    STAGES = ('playlist_extract', 'queue_wait', 'manifest_lookup', 'extract', 'download',
+              'transcode_wait', 'postprocess', 'validate', 'cleanup')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {stage: StageTimer(self.BUCKETS) for stage in self.STAGES}
+            self.counters = {'bytes_downloaded': 0, 'retries_http': 0, 'retries_fragment': 0}
+            self.started_at = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            timer = self.stages.get(stage)
+            if timer is None:
+                timer = self.stages[stage] = StageTimer(self.BUCKETS)
+            timer.count += 1
+            timer.total += seconds
+            timer.max = max(timer.max, seconds)
+            timer.min = seconds if timer.min is None else min(timer.min, seconds)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    timer.buckets[i] += 1
+
+    def span(self, stage):
+        """with run_metrics.span('validate'): ... mesure la durée du bloc"""
+        return _Span(self, stage)
+
+    def add(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def snapshot(self):
+        playlists_done, playlists_total, videos_done, videos_failed, videos_total = global_stats.get_stats()
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'elapsed_seconds': round(time.time() - self.started_at, 3),
+                'playlists': {'completed': playlists_done, 'total': playlists_total},
+                'tracks': {'ok': videos_done, 'failed': videos_failed, 'total': videos_total},
+                'counters': dict(self.counters),
+                'network': network_budget.snapshot(),
+                'stages': {stage: timer.to_dict(self.BUCKETS) for stage, timer in self.stages.items()},
+            }
+
+    def to_prometheus(self, report):
+        """Format texte Prometheus (à déposer dans le dossier du textfile collector de node_exporter)"""
+        lines = [
+            "# HELP ultra_stage_duration_seconds Durée des étapes de traitement d'un titre",
+            "# TYPE ultra_stage_duration_seconds histogram",
+        ]
+        for stage, timer in report['stages'].items():
+            for bound, count in timer['buckets'].items():
+                lines.append(f'ultra_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'ultra_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {timer["count"]}')
+            lines.append(f'ultra_stage_duration_seconds_sum{{stage="{stage}"}} {timer["sum_seconds"]}')
+            lines.append(f'ultra_stage_duration_seconds_count{{stage="{stage}"}} {timer["count"]}')
+        counters = report['counters']
+        network = report['network']
+        lines += [
+            "# TYPE ultra_bytes_downloaded_total counter",
+            f"ultra_bytes_downloaded_total {counters.get('bytes_downloaded', 0)}",
+            "# TYPE ultra_retries_total counter",
+            f'ultra_retries_total{{kind="http"}} {counters.get("retries_http", 0)}',
+            f'ultra_retries_total{{kind="fragment"}} {counters.get("retries_fragment", 0)}',
+            "# TYPE ultra_connections gauge",
+            f'ultra_connections{{kind="in_use"}} {network["connections_in_use"]}',
+            f'ultra_connections{{kind="peak"}} {network["peak_connections"]}',
+            f'ultra_connections{{kind="limit"}} {network["max_connections"] or 0}',
+            "# TYPE ultra_rate_limit_bytes_per_second gauge",
+            f"ultra_rate_limit_bytes_per_second {network['max_rate'] or 0}",
+            "# TYPE ultra_rate_limit_wait_seconds_total counter",
+            f"ultra_rate_limit_wait_seconds_total {network['rate_wait_seconds']}",
+            "# TYPE ultra_tracks_total counter",
+            f'ultra_tracks_total{{result="ok"}} {report["tracks"]["ok"]}',
+            f'ultra_tracks_total{{result="failed"}} {report["tracks"]["failed"]}',
+            "# TYPE ultra_run_elapsed_seconds gauge",
+            f"ultra_run_elapsed_seconds {report['elapsed_seconds']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Écrit le rapport JSON de la session et le fichier Prometheus (renommage atomique)"""
+        report = self.snapshot()
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        timestamp = session_timestamp or time.strftime("%d_%m_%y_%Hh_%M_%S", time.localtime(self.started_at))
+        json_path = METRICS_DIR / f"ultra_metrics_{timestamp}.json"
+        for path, content in ((json_path, json.dumps(report, indent=2, ensure_ascii=False)),
+                              (METRICS_DIR / PROMETHEUS_FILENAME, self.to_prometheus(report))):
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_text(content, encoding='utf-8')
+            os.replace(tmp_path, path)
+        return json_path
+
+    def start(self, interval=METRICS_INTERVAL):
+        """Remet les compteurs à zéro et lance l'export périodique"""
+        self.reset()
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="metrics-export", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arrête l'export périodique et écrit le rapport final"""
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
         try:
-            percent = d.get('_percent_str', 'N/A').strip()
-            speed = d.get('_speed_str', 'N/A').strip()
-            filename = os.path.basename(d.get('filename', 'Unknown'))[:40]
-
-            # Afficher uniquement toutes les 5% pour éviter spam
-            if percent != 'N/A':
-                percent_num = float(percent.replace('%', ''))
-                if int(percent_num) % 5 == 0:
-                    with print_lock:
-                        print(f"📥 {filename}... {percent:>6} à {speed:>12}")
-        except:
-            pass
+            return self.export()
+        except OSError as e:
+            logger.error(f"Export des métriques impossible: {e}")
+            return None
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.export()
+            except OSError as e:
+                logger.error(f"Export des métriques impossible: {e}")
+
+class _Span:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+class YtDlpLogger:
+    """Logger donné à yt-dlp : messages vers le log de session, retries comptés au passage
+
+    Les retries du téléchargement ("Got error: ... Retrying (1/3)...", "Retrying fragment 3
+    (1/3)...") passent par to_screen, donc par debug() ; ceux des extracteurs par warning().
+    Les niveaux écrits dans le log ne changent pas (debug reste filtré par `logger`).
+    """
+    def debug(self, msg):
+        self._count_retry(msg)
+        logger.debug(msg)
+
+    def info(self, msg):
+        logger.info(msg)
+
+    def warning(self, msg):
+        self._count_retry(msg)
+        logger.warning(msg)
+
+    def error(self, msg):
+        logger.error(msg)
+
+    @staticmethod
+    def _count_retry(msg):
+        if 'Retrying' in msg:
+            run_metrics.add('retries_fragment' if 'Retrying fragment' in msg else 'retries_http')
+            adaptive_controller.record_retry(msg)
+
+# Instance globale des métriques du run
+run_metrics = RunMetrics()
+
+class InstrumentedLock:
+    """Verrou qui mesure les attentes (mode profilage) : même interface que threading.Lock"""
+    def __init__(self, name, lock):
+        self.name = name
+        self.lock = lock
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.acquisitions += 1  # Compteurs mis à jour verrou tenu : pas besoin d'un 2e verrou
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        if not self.lock.acquire(True, timeout):
+            return False
+        waited = time.perf_counter() - start
+        self.acquisitions += 1
+        self.contended += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class SamplingProfiler:
+    """Profilage opt-in d'un run : piles échantillonnées de tous les threads + attentes sur les verrous
+
+    Profil "wall-clock" : les threads qui attendent (réseau, ffmpeg, file vide) apparaissent
+    aussi, c'est voulu. Écrit un rapport texte et un fichier de piles repliées (.folded,
+    lisible par flamegraph.pl, speedscope ou inferno) à côté du log de session.
+    """
+    TOP_FUNCTIONS = 25
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._stacks = {}  # Dict: (groupe de threads, codes de la racine à la feuille) -> échantillons
+        self._samples = 0
+        self._locks = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+    @staticmethod
+    def _thread_group(name):
+        """download-3 -> download, transcode_0 -> transcode : une ligne par rôle dans le flamegraph"""
+        return name.rstrip('0123456789-_') or name
+
+    def _instrument_locks(self, conditions=()):
+        """Remplace les verrous partagés par des versions instrumentées (restaurés à l'arrêt)"""
+        global stats_lock
+        targets = [(print_lock, '_lock', 'print_lock'), (run_metrics, '_lock', 'run_metrics'),
+                   (adaptive_controller, '_lock', 'adaptive_controller'), (track_store, '_lock', 'track_store'),
+                   (playlist_cache, '_lock', 'playlist_cache'), (progress_board, '_counts_lock', 'progress_board'),
+                   (get_manifest(), '_lock', 'manifest'), (network_budget, '_lock', 'network_budget')]
+        for owner, attribute, name in targets:
+            original = getattr(owner, attribute)
+            wrapped = InstrumentedLock(name, original)
+            setattr(owner, attribute, wrapped)
+            self._locks.append((owner, attribute, wrapped))
+        stats_lock = InstrumentedLock('stats_lock', stats_lock)
+        self._locks.append((None, 'stats_lock', stats_lock))
+        # Conditions : le verrou interne est remplacé en place ; les threads déjà en attente dans
+        # wait() le reprennent sans instrumentation (même verrou sous-jacent, aucun réveil perdu)
+        for condition, name in [(network_budget._connections_changed, 'network_connections'), *conditions]:
+            wrapped = InstrumentedLock(name, condition._lock)
+            condition._lock, condition.acquire, condition.release = wrapped, wrapped.acquire, wrapped.release
+            self._locks.append((condition, '_lock', wrapped))
+
+    def _restore_locks(self):
+        global stats_lock
+        for owner, attribute, wrapped in self._locks:
+            if owner is None:
+                stats_lock = wrapped.lock
+            elif isinstance(owner, threading.Condition):
+                owner._lock, owner.acquire, owner.release = wrapped.lock, wrapped.lock.acquire, wrapped.lock.release
+            else:
+                setattr(owner, attribute, wrapped.lock)
+
+    def start(self, conditions=()):
+        """conditions : [(threading.Condition, nom)] du run à instrumenter en plus (ex: file du scheduler)"""
+        self._instrument_locks(conditions)
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                key = (self._thread_group(names.get(thread_id, 'thread')), tuple(reversed(codes)))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+            self._samples += 1
+
+    @staticmethod
+    def _label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def stop(self, base_path):
+        """Arrête l'échantillonnage, écrit <base>.folded et <base>.txt, retourne le chemin du rapport"""
+        self._stop.set()
+        self._thread.join()
+        self._restore_locks()
+        elapsed = time.time() - self._started_at
+
+        folded_path = base_path.with_suffix('.folded')
+        report_path = base_path.with_suffix('.txt')
+        base_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self_counts, total_counts, group_counts = {}, {}, {}
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for (group, codes), count in sorted(self._stacks.items(), key=lambda item: -item[1]):
+                f.write(';'.join([group] + [self._label(code).replace(';', ':') for code in codes]) + f" {count}\n")
+                group_counts[group] = group_counts.get(group, 0) + count
+                if codes:
+                    self_counts[codes[-1]] = self_counts.get(codes[-1], 0) + count
+                for code in set(codes):
+                    total_counts[code] = total_counts.get(code, 0) + count
+
+        total_samples = sum(group_counts.values()) or 1
+        lines = [
+            f"Profil du run : {elapsed:.0f}s, {self._samples} photos toutes les {self.interval * 1000:.0f} ms, "
+            f"{total_samples} piles de threads",
+            "Profil wall-clock : les attentes (réseau, ffmpeg, file vide) comptent aussi.",
+            "",
+            "== Échantillons par groupe de threads ==",
+        ]
+        for group, count in sorted(group_counts.items(), key=lambda item: -item[1]):
+            lines.append(f"  {group:<20} {count:>8}  {count / total_samples:6.1%}")
+
+        for title, counts in (("== Fonctions : temps propre (feuille de la pile) ==", self_counts),
+                              ("== Fonctions : temps inclusif ==", total_counts)):
+            lines += ["", title]
+            for code, count in sorted(counts.items(), key=lambda item: -item[1])[:self.TOP_FUNCTIONS]:
+                lines.append(f"  {count / total_samples:6.1%} {count:>8}  {self._label(code)}")
+
+        lines += ["", "== Verrous : attentes ==",
+                  f"  {'verrou':<20} {'acquis':>9} {'contendus':>10} {'attente totale':>15} {'attente max':>12}"]
+        for _, _, lock in sorted(self._locks, key=lambda item: -item[2].wait_total):
+            lines.append(f"  {lock.name:<20} {lock.acquisitions:>9} {lock.contended:>10} "
+                         f"{lock.wait_total:>14.3f}s {lock.wait_max * 1000:>10.1f}ms")
+        lines += ["  Conditions (scheduler, network_connections) : attente pour prendre le verrou seulement ; le temps",
+                  "  passé dans wait() (file vide, connexions épuisées) apparaît dans les piles, pas ici."]
+        lines += ["", f"Flamegraph : flamegraph.pl {folded_path.name} > profil.svg (ou ouvrir le .folded dans speedscope)"]
+        report_path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+        return report_path
+
+def profile_base_path():
+    """logs/ultra_profile_<session> : même horodatage que le log de la session"""
+    timestamp = session_timestamp or time.strftime("%d_%m_%y_%Hh_%M_%S")
+    directory = Path(log_filename).parent if log_filename else METRICS_DIR
+    return directory / f"ultra_profile_{timestamp}"
 
 def clean_filename(title):
     """Nettoie un titre pour en faire un nom de fichier sûr"""
@@ -136,54 +1362,25 @@ def clean_filename(title):
     
     return cleaned.strip()
 
-def cleanup_temp_files(output_path, mp3_filename):
-    """Supprime les fichiers temporaires .m4a qui correspondent au MP3"""
-    if not mp3_filename:
-        return
-        
-    # Nom de base sans extension
-    base_name = Path(mp3_filename).stem
-    
-    try:
-        # Chercher les fichiers .m4a qui ont le même nom de base
-        for temp_file in output_path.glob("*.m4a"):
-            temp_base = temp_file.stem
-            
-            # Si le nom correspond (même titre)
-            if (base_name.lower() in temp_base.lower() or 
-                temp_base.lower() in base_name.lower() or
-                base_name.lower()[:20] == temp_base.lower()[:20]):
-                
-                try:
-                    temp_file.unlink()  # Supprimer le fichier silencieusement
-                except Exception as e:
-                    logger.error(f"Erreur suppression {temp_file}: {e}")
-                    
-    except Exception as e:
-        logger.error(f"Erreur nettoyage temporaires: {e}")
-
 def get_ultra_ydl_opts(output_dir):
     """Configuration ultra-optimisée pour yt-dlp - VITESSE MAXIMALE"""
     opts = {
         # Format audio optimal - préférer m4a (plus rapide, pas de réencodage nécessaire)
         'format': 'bestaudio[ext=m4a]/bestaudio/best',
 
-        # Post-processing pour MP3 320kbps ULTRA-RAPIDE
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '320',
-        }],
+        # Pas de post-processing ici : la conversion MP3 320kbps est faite par le pool
+        # de transcodage (étage séparé) pour ne pas bloquer un thread réseau pendant ffmpeg
+        'postprocessors': [],
 
         # Supprimer les fichiers temporaires après conversion
         'keepvideo': False,
         'keep_video': False,
 
         # Template de sortie standard (yt-dlp gère les caractères interdits automatiquement)
-        'outtmpl': os.path.join(output_dir, '%(title).100s.%(ext)s'),
+        'outtmpl': os.path.join(output_dir, OUTPUT_TEMPLATE),
 
         # Options de performance MAXIMALES - TURBO MODE
-        'concurrent_fragment_downloads': 16,  # 16 fragments parallèles (doublé!)
+        'concurrent_fragment_downloads': adaptive_controller.fragments,  # 16 max, réduit si YouTube limite
         'fragment_retries': 3,  # Réduit de 5 à 3 pour ne pas perdre de temps
         'retries': 3,  # Réduit de 5 à 3
         'file_access_retries': 3,  # Réduit de 5 à 3
@@ -200,7 +1397,7 @@ def get_ultra_ydl_opts(output_dir):
         'extract_flat': False,
 
         # Logger personnalisé pour capturer toutes les erreurs
-        'logger': logger,
+        'logger': YtDlpLogger(),  # Log de session + comptage des retries
 
         # Hook de progression pour afficher les pourcentages
         'progress_hooks': [progress_hook],
@@ -213,10 +1410,286 @@ def get_ultra_ydl_opts(output_dir):
     
     return opts
 
-def test_premium_access():
+def parse_rate(value):
+    """'800K', '5M', '1.5G' ou un nombre d'octets -> octets/s (0 ou vide = illimité)"""
+    text = str(value or '0').strip().upper().removesuffix('/S').rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    multiplier = units.get(text[-1:], 1)
+    if text[-1:] in units:
+        text = text[:-1]
+    rate = float(text) * multiplier
+    if rate < 0:
+        raise ValueError(f"débit négatif: {value}")
+    return int(rate)
+
+def format_rate(rate):
+    return f"{rate / (1024 * 1024):.1f} MB/s"
+
+class NetworkBudget:
+    """Budget réseau du processus, partagé par tous les téléchargements (playlists et threads confondus)
+
+    Débit : seau à jetons global. Chaque bloc reçu est pris au seau ; à découvert,
+    le thread qui l'a reçu dort le temps de rembourser. Le débit total reste sous
+    la limite, avec au plus RATE_BURST secondes de rafale.
+    Connexions : chaque transfert réserve les siennes avant de commencer (1 pour un
+    flux HTTP simple, jusqu'aux fragments parallèles pour du DASH/HLS) et attend
+    s'il n'en reste plus.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections_changed = threading.Condition()
+        self.connections = 0
+        self.configure()
+
+    def configure(self, max_rate=None, max_connections=None):
+        """Fixe les limites (None ou 0 = illimité) et remet les compteurs à zéro (début de run)"""
+        with self._lock:
+            self.max_rate = max_rate or None
+            self._burst = max(self.max_rate * RATE_BURST, STREAM_BLOCK_SIZE) if self.max_rate else 0
+            self._tokens = self._burst
+            self._refilled = time.monotonic()
+            self.rate_wait = 0.0  # Secondes passées à attendre le seau, tous threads confondus
+        with self._connections_changed:
+            self.max_connections = max_connections or None
+            self.peak_connections = self.connections
+            self.connection_waits = 0  # Transferts qui ont dû attendre une connexion libre
+            self._connections_changed.notify_all()
+
+    @property
+    def limited(self):
+        return bool(self.max_rate or self.max_connections)
+
+    def consume(self, nbytes):
+        """Prend nbytes au seau ; dort si le débit max est dépassé"""
+        if not self.max_rate or nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._refilled) * self.max_rate)
+            self._refilled = now
+            self._tokens -= nbytes
+            delay = -self._tokens / self.max_rate if self._tokens < 0 else 0.0
+            self.rate_wait += delay
+        if delay:
+            time.sleep(delay)
+
+    def acquire_connections(self, wanted):
+        """Réserve jusqu'à `wanted` connexions (au moins 1, attend s'il n'en reste aucune), retourne le nombre obtenu"""
+        wanted = max(1, wanted)
+        with self._connections_changed:
+            if self.max_connections:
+                if self.connections >= self.max_connections:
+                    self.connection_waits += 1
+                while self.connections >= self.max_connections:
+                    self._connections_changed.wait()
+                wanted = min(wanted, self.max_connections - self.connections)
+            self.connections += wanted
+            self.peak_connections = max(self.peak_connections, self.connections)
+            return wanted
+
+    def release_connections(self, count):
+        with self._connections_changed:
+            self.connections -= count
+            self._connections_changed.notify_all()
+
+    def describe(self):
+        """Utilisation courante, pour le tableau de progression"""
+        usage = f"{self.connections}/{self.max_connections or '∞'} connexions"
+        if self.max_rate:
+            usage += f", limite {format_rate(self.max_rate)}"
+        return usage
+
+    def snapshot(self):
+        return {
+            'max_rate': self.max_rate,
+            'max_connections': self.max_connections,
+            'connections_in_use': self.connections,
+            'peak_connections': self.peak_connections,
+            'connection_waits': self.connection_waits,
+            'rate_wait_seconds': round(self.rate_wait, 3),
+        }
+
+# Instance globale du budget réseau
+network_budget = NetworkBudget()
+
+class WorkerContext:
+    """Contexte yt-dlp long-vivant d'un thread de téléchargement
+
+    Un seul YoutubeDL par thread : extracteurs, cookies, session HTTP et connexions
+    keep-alive sont réutilisés d'une vidéo à l'autre. Seuls le dossier de sortie,
+    les fragments parallèles et les hooks propres à la vidéo changent.
+    """
+    def __init__(self):
+        opts = get_ultra_ydl_opts('.')
+        opts['outtmpl'] = OUTPUT_TEMPLATE
+        opts['paths'] = {'home': '.'}
+        # Une seule vidéo à la fois : on veut l'exception (et son message 429/403/Premium) plutôt qu'un None silencieux
+        opts['ignoreerrors'] = False
+        opts['progress_hooks'] = [self._dispatch_progress]
+        self.ydl = yt_dlp.YoutubeDL(opts)
+        # Chaque transfert (un par format) réserve ses connexions dans le budget réseau global
+        self._transfer = self.ydl.dl
+        self.ydl.dl = self._budgeted_transfer
+        self.video_hooks = []
+        self._metered = {}  # Fichier -> octets déjà pris au seau à jetons
+        self._metered_lock = threading.Lock()  # Les fragments parallèles appellent le hook depuis leurs threads
+        self.closed = False
+
+    def _dispatch_progress(self, d):
+        progress_hook(d)
+        if d['status'] == 'downloading':
+            self._meter(d)
+        for hook in self.video_hooks:
+            hook(d)
+
+    def _meter(self, d):
+        """Octets reçus depuis le dernier appel, pris au seau global (le thread dort si la limite est atteinte)"""
+        key = d.get('tmpfilename') or d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        with self._metered_lock:
+            previous = self._metered.get(key)
+            if previous is not None and downloaded <= previous:
+                return
+            self._metered[key] = downloaded
+        if previous is not None:  # Premier appel : point de départ (un .part repris n'est pas recompté)
+            network_budget.consume(downloaded - previous)
+
+    def _budgeted_transfer(self, name, info, *args, **kwargs):
+        """YoutubeDL.dl avec réservation de connexions : 1 pour un flux HTTP simple,
+        jusqu'aux fragments parallèles pour un format fragmenté (DASH/HLS)"""
+        wanted = 1 if info.get('protocol') in ('http', 'https') else adaptive_controller.fragments
+        granted = network_budget.acquire_connections(wanted)
+        self.ydl.params['concurrent_fragment_downloads'] = granted
+        # Sous limite de débit : blocs de taille fixe (buffersize) pour un débit lisse, pas des lectures de plusieurs MB
+        self.ydl.params['noresizebuffer'] = bool(network_budget.max_rate)
+        try:
+            return self._transfer(name, info, *args, **kwargs)
+        finally:
+            network_budget.release_connections(granted)
+
+    def download(self, url, output_path, hooks=(), info=None):
+        """Télécharge une vidéo dans output_path avec ce contexte, retourne l'info dict
+
+        info : résultat déjà extrait par extract() (repli du mode pipe), téléchargé sans réextraction.
+        """
+        self.ydl.params['paths'] = {'home': str(output_path)}
+        self._metered = {}
+        # Le premier hook de progression marque la fin de l'extraction et le début du transfert
+        first_hook = []
+        self.partial_files = set()
+        def mark_transfer_start(d):
+            if not first_hook:
+                first_hook.append(time.perf_counter())
+            # Chemins exacts écrits par yt-dlp pour cette vidéo (nettoyés en cas d'échec, sans glob)
+            for key in ('tmpfilename', 'filename'):
+                if d.get(key):
+                    self.partial_files.add(Path(d[key]))
+        self.video_hooks = [mark_transfer_start, *hooks]
+        start = time.perf_counter()
+        try:
+            if info is not None:
+                return self.ydl.process_ie_result(info, download=True)
+            return self.ydl.extract_info(url, download=True)
+        finally:
+            self.video_hooks = []
+            end = time.perf_counter()
+            transfer_start = first_hook[0] if first_hook else end
+            run_metrics.observe('extract', transfer_start - start)
+            if first_hook:
+                run_metrics.observe('download', end - transfer_start)
+
+    def extract(self, url, output_path):
+        """Extraction + choix du format sans téléchargement (mode pipe), retourne l'info dict"""
+        self.ydl.params['paths'] = {'home': str(output_path)}
+        with run_metrics.span('extract'):
+            return self.ydl.extract_info(url, download=False)
+
+    def open_stream(self, info):
+        """Lit le flux du format choisi par blocs, via la session HTTP du contexte (cookies, keep-alive)
+
+        Requêtes Range de http_chunk_size octets comme yt-dlp (YouTube bride les grosses
+        requêtes d'un seul tenant). Un serveur qui ignore Range renvoie tout d'un coup.
+        """
+        headers = dict(info.get('http_headers') or {})
+        chunk_size = ((info.get('downloader_options') or {}).get('http_chunk_size')
+                      or self.ydl.params.get('http_chunk_size') or 0)
+        filesize = info.get('filesize') or info.get('filesize_approx')
+        start = 0
+        while True:
+            request_headers = dict(headers)
+            if chunk_size:
+                request_headers['Range'] = f"bytes={start}-{start + chunk_size - 1}"
+            response = self.ydl.urlopen(Request(info['url'], headers=request_headers))
+            received = 0
+            try:
+                while True:
+                    block = response.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    received += len(block)
+                    yield block
+            finally:
+                response.close()
+            start += received
+            if (not chunk_size or response.status != 206 or received < chunk_size
+                    or (filesize and start >= filesize)):
+                return
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.ydl.close()
+
+_worker_local = threading.local()
+
+def get_worker_context():
+    """Contexte yt-dlp du thread courant (créé à la première vidéo)"""
+    context = getattr(_worker_local, 'context', None)
+    if context is None or context.closed:
+        context = WorkerContext()
+        _worker_local.context = context
+    return context
+
+def release_worker_context():
+    """Ferme le contexte yt-dlp du thread courant (fin du thread)"""
+    context = getattr(_worker_local, 'context', None)
+    if context is not None:
+        _worker_local.context = None
+        try:
+            context.close()
+        except Exception as e:
+            logger.error(f"Erreur fermeture contexte yt-dlp: {e}")
+
+# Résultat du test Premium gardé tant que cookies.txt ne change pas (6 heures max)
+PREMIUM_PROBE_TTL = 6 * 3600
+# Messages yt-dlp qui veulent dire "contenu réservé" (et pas "problème réseau")
+PREMIUM_BLOCKED_MARKERS = ('premium', 'members', 'sign in', 'login required')
+
+def cookies_fingerprint(cookie_path='cookies.txt'):
+    """Empreinte du fichier de cookies : hash du contenu + date de modification"""
+    cookie_path = Path(cookie_path)
+    stat = cookie_path.stat()
+    digest = hashlib.sha256(cookie_path.read_bytes()).hexdigest()
+    return f"{digest}:{stat.st_mtime_ns}"
+
+def probe_premium_url(test_url, probe_opts):
+    """Sonde une URL Premium-only sans rien télécharger : True (formats dispo), False (bloqué), None (réseau)"""
+    try:
+        with yt_dlp.YoutubeDL(probe_opts) as ydl:
+            info = ydl.extract_info(test_url, download=False)
+        if info and (info.get('url') or info.get('requested_formats')):
+            return True
+        return False
+    except Exception as e:
+        error_msg = str(e).lower()
+        if any(marker in error_msg for marker in PREMIUM_BLOCKED_MARKERS):
+            return False
+        return None  # Timeout, DNS... on ne peut pas conclure
+
+def test_premium_access(max_age=PREMIUM_PROBE_TTL):
     """
     Teste si l'utilisateur connecté avec les cookies a un accès Premium
-    en téléchargeant la DAUBE de Slimane (on déteste ce qu'on fait mais c'est efficace)
+    en demandant les formats de la DAUBE de Slimane (on déteste ce qu'on fait mais c'est efficace)
     
     IMPORTANT: Slimane c'est les SEULES musiques qu'on a trouvées en Premium-only 
     parce que... je sais pas, il est chiant ? 🤡 Après même s'il est chiant, au moins 
@@ -228,19 +1701,28 @@ def test_premium_access():
     (AUTRE que cette daube de Slimane), MERCI d'ouvrir une issue GitHub ou une pull request 
     avec GRAND PLAISIR ! On sera ravis de remplacer cette merde par autre chose ! 🙏
     
-    On télécharge juste pour tester puis à la MILLISECONDE où on a le résultat 
-    on supprime cette MERDE ! 🔥💀 Pas question de garder Slimane une seconde de plus !
-    SLIMANE = NECESSARY EVIL pour tester Premium. Désolé pas désolé.
+    Bonne nouvelle : on ne télécharge PLUS RIEN ! 🎉 On demande juste à YouTube quels formats
+    il nous donne : si on a des formats, c'est Premium. Pas un octet de Slimane sur le disque.
+    Le résultat est gardé dans le manifeste tant que cookies.txt ne change pas (hash + date)
+    et au maximum `max_age` secondes.
     """
     if not Path('cookies.txt').exists():
         return False, "❌ Aucun fichier cookies.txt trouvé"
     
-    
+    try:
+        fingerprint = cookies_fingerprint()
+        manifest = get_manifest()
+        cached = manifest.load_premium_probe(fingerprint, max_age)
+        if cached:
+            checked_at, is_premium, message = cached
+            minutes = int((time.time() - checked_at) // 60)
+            return is_premium, f"{message} (résultat en cache, testé il y a {minutes} min)"
+    except Exception as e:
+        return False, f"❌ Erreur critique lors du test: {str(e)[:50]}..."
     
     # URLs de test Premium-only - ATTENTION : C'EST DU SLIMANE ! 🤮
     # JE DÉTESTE cette merde de Slimane mais c'est le seul moyen de tester Premium
     # Toutes ses musiques sont Premium-only,il nous force à utiliser ses daubes
-    # On télécharge juste pour tester puis on supprime immédiatement cette merde
     premium_test_urls = [
         "https://music.youtube.com/watch?v=2TaiYw83ZgQ",  # Slimane - Mise à jour (JE DÉTESTE CETTE MERDE)
         "https://music.youtube.com/watch?v=_sUak2xdxWQ",  # Slimane - La vie est belle (QUEL TITRE IRONIQUE)
@@ -248,337 +1730,1872 @@ def test_premium_access():
         "https://music.youtube.com/watch?v=9oDnPZV7nYc",  # Slimane - Bye Bye (OUI BYE BYE SLIMANE !)
     ]
     
-    # Créer un dossier temporaire pour le test
-    test_dir = Path("temp_premium_test")
-    test_dir.mkdir(exist_ok=True)
+    # Extraction seule (download=False) : yt-dlp choisit un format mais ne télécharge rien
+    probe_opts = get_ultra_ydl_opts(".")
+    probe_opts.update({
+        'format': 'bestaudio/best',
+        'ignoreerrors': False,  # IMPORTANT: Ne pas ignorer les erreurs Premium !
+        'progress_hooks': [],
+        'socket_timeout': 10,
+        'retries': 1,
+        'extractor_retries': 1,
+        'logger': SilentLogger(),  # Désactive tous les logs yt-dlp pendant le test
+    })
+    
+    print("  \033[96m🔍 Test de l'accès Premium en cours (sans téléchargement)...\033[0m")
     
+    # Sondes en parallèle, on s'arrête dès qu'une confirme le Premium
+    results = []
+    executor = ThreadPoolExecutor(max_workers=len(premium_test_urls))
     try:
-        # Hook de progression silencieux pour le test (on veut pas voir le nom de Slimane !)
-        def silent_progress_hook(d):
-            pass  # On affiche rien, on veut pas voir cette merde de Slimane !
-        
-        # Configuration pour téléchargement RÉEL mais rapide et SILENCIEUX
-        test_opts = get_ultra_ydl_opts(str(test_dir))
-        test_opts.update({
-            'format': 'worst[ext=m4a]/worst[filesize<2M]/worst',  # Format encore plus petit
-            'postprocessors': [],  # Pas de conversion MP3 pour le test
-            'quiet': False,  # Voir les erreurs mais pas la progression
-            'ignoreerrors': False,  # IMPORTANT: Ne pas ignorer les erreurs Premium !
-            'progress_hooks': [silent_progress_hook],  # Hook silencieux pour masquer Slimane
-            # Timeouts ultra courts pour test rapide
-            'socket_timeout': 15,  # 15s au lieu de 60s
-            'fragment_retries': 2,  # 2 au lieu de 5
-            'retries': 2,  # 2 au lieu de 5
-            'file_access_retries': 2,  # 2 au lieu de 5
-            'logger': SilentLogger(),  # Désactive tous les logs yt-dlp pendant le test
-        })
-        
-        # Variables partagées pour les threads
-        premium_success_count = 0
-        premium_blocked_count = 0
-        test_lock = threading.Lock()
-        completed_tests = 0
-        
-        def test_single_url(test_url, test_num):
-            """Teste une seule URL Premium en thread séparé"""
-            nonlocal premium_success_count, premium_blocked_count, completed_tests
-            
-            try:
-                with yt_dlp.YoutubeDL(test_opts) as ydl:
-                    # VRAIMENT télécharger cette merde de Slimane (désolé mais c'est le seul moyen de tester Premium)
-                    # On déteste ce qu'on fait mais c'est pour la science !
-                    ydl.download([test_url])
-                    
-                    # Vérifier si un fichier a été téléchargé = Premium confirmé
-                    downloaded_files = list(test_dir.glob("*"))
-                    if downloaded_files:
-                        with test_lock:
-                            premium_success_count += 1
-                        
-                        # Supprimer ce fichier de merde immédiatement - on ne garde pas Slimane !
-                        for file in downloaded_files:
-                            try:
-                                file.unlink()  # BURN SLIMANE BURN! 🔥
-                            except:
-                                pass
-                        return True
-                    else:
-                        with test_lock:
-                            premium_blocked_count += 1
-                        return False
-                        
-            except:
-                # Toute erreur = pas Premium
-                with test_lock:
-                    premium_blocked_count += 1
-                return False
+        futures = [executor.submit(probe_premium_url, url, probe_opts) for url in premium_test_urls]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    premium_success_count = results.count(True)
+    premium_blocked_count = results.count(False)
+    
+    # Analyse des résultats (avec la daube de Slimane malheureusement)
+    if premium_success_count > 0:
+        is_premium, message = True, "✅ PREMIUM CONFIRMÉ ! Formats Premium accessibles"
+    elif premium_blocked_count > 0:
+        is_premium, message = False, f"❌ PAS DE PREMIUM ! Contenu bloqué {premium_blocked_count}/{len(premium_test_urls)} fois"
+    else:
+        # Pas de cache : le prochain lancement retentera
+        return False, "❌ Test impossible - Erreur de connexion"
+    
+    try:
+        manifest.save_premium_probe(fingerprint, is_premium, message)
+    except Exception as e:
+        logger.warning(f"Cache du test Premium non enregistré: {str(e)}")
+    return is_premium, message
 
-        # Lancer les tests en parallèle avec ThreadPoolExecutor
-        # Affichage coloré sans horodatage pour les tests Premium
-        print(f"\033[92m🚀 Lancement de {len(premium_test_urls)} tests simultanés...\033[0m")
-        print("  \033[96m🔍 Test de l'accès Premium en cours...\033[0m")
+class FairScheduler:
+    """File de téléchargement globale : une seule limite de concurrence pour toutes les playlists
 
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # Lancer tous les tests en parallèle
-            futures = []
-            for i, test_url in enumerate(premium_test_urls, 1):
-                future = executor.submit(test_single_url, test_url, i)
-                futures.append(future)
-
-            # Afficher la progression en temps réel
-            while completed_tests < len(premium_test_urls):
-                time.sleep(0.1)  # Check toutes les 100ms
-                current_completed = sum(1 for f in futures if f.done())
-                if current_completed > completed_tests:
-                    completed_tests = current_completed
-                    progress = (completed_tests / len(premium_test_urls)) * 100
-                    print(f"\r   📊 Progression: {completed_tests}/{len(premium_test_urls)} ({progress:.0f}%)", end='', flush=True)
-
-            print()  # Nouvelle ligne après la progression
-
-            # Collecter les résultats
-            results = []
-            for future in futures:
-                try:
-                    results.append(future.result())
-                except Exception:
-                    results.append(False)
+    Chaque playlist a sa propre file d'attente ; les threads servent les playlists
+    à tour de rôle (round-robin pondéré par `weight`). Un thread libéré par une
+    playlist terminée passe directement à celles qui ont encore du travail.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max(1, max_workers)
+        self._cond = threading.Condition()
+        self._queues = {}  # Dict: playlist -> deque[(future, fn, args)]
+        self._weights = {}
+        self._credits = {}
+        self._running = {}
+        self._rotation = deque()  # Playlists ayant du travail en attente, dans l'ordre de passage
+        self._active_limit = self.max_workers  # Réglé à chaud par le contrôleur adaptatif
+        self._busy = 0
+        self._shutdown = False
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"download-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def register(self, playlist, weight=1):
+        """Déclare une playlist (poids = nombre de titres servis d'affilée à son tour)"""
+        with self._cond:
+            self._weights[playlist] = max(1, int(weight))
+            self._queues.setdefault(playlist, deque())
+            self._running.setdefault(playlist, 0)
+
+    def submit(self, playlist, fn, *args):
+        """Ajoute un travail dans la file de la playlist, retourne un Future"""
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Scheduler arrêté")
+            queue = self._queues.setdefault(playlist, deque())
+            self._running.setdefault(playlist, 0)
+            if not queue:
+                self._rotation.append(playlist)
+                self._credits[playlist] = self._weights.get(playlist, 1)
+            queue.append((future, fn, args, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def queue_depths(self):
+        """Profondeur de file par playlist : {playlist: (en attente, en cours)}"""
+        with self._cond:
+            return {playlist: (len(queue), self._running.get(playlist, 0))
+                    for playlist, queue in self._queues.items()
+                    if queue or self._running.get(playlist, 0)}
+
+    @property
+    def active_limit(self):
+        return self._active_limit
+
+    def set_active_limit(self, limit):
+        """Change le nombre de threads autorisés à télécharger en même temps (≤ max_workers)"""
+        with self._cond:
+            self._active_limit = max(1, min(self.max_workers, int(limit)))
+            self._cond.notify_all()
+        return self._active_limit
+
+    def is_saturated(self):
+        """Vrai si tous les threads actifs sont occupés et qu'il reste du travail en attente"""
+        with self._cond:
+            return bool(self._rotation) and self._busy >= self._active_limit
 
-        # Nettoyer le dossier de test
+    def _next_job(self):
+        """Choisit le prochain travail (appelé avec le verrou)"""
+        playlist = self._rotation[0]
+        queue = self._queues[playlist]
+        job = queue.popleft()
+        self._credits[playlist] -= 1
+        if not queue:
+            self._rotation.popleft()
+        elif self._credits[playlist] <= 0:
+            # Tour terminé : la playlist repasse en fin de rotation
+            self._rotation.rotate(-1)
+            self._credits[playlist] = self._weights.get(playlist, 1)
+        self._running[playlist] += 1
+        self._busy += 1
+        return playlist, job
+
+    def _worker(self):
         try:
-            for file in test_dir.glob("*"):
-                file.unlink()
-            test_dir.rmdir()
-        except:
-            pass
-        
-        # Plus d'explications dans les commentaires du code si besoin
-        
-        # Analyse des résultats RÉELS (avec la daube de Slimane malheureusement)
-        if premium_success_count > 0:
-            return True, f"✅ PREMIUM CONFIRMÉ ! Test réussi {premium_success_count}/{len(premium_test_urls)} fois"
-        
-        elif premium_blocked_count > 0:
-            return False, f"❌ PAS DE PREMIUM ! Contenu bloqué {premium_blocked_count}/{len(premium_test_urls)} fois"
-        
+            self._work_loop()
+        finally:
+            release_worker_context()
+
+    def _work_loop(self):
+        while True:
+            with self._cond:
+                while not (self._rotation and self._busy < self._active_limit):
+                    if self._shutdown and not self._rotation:
+                        self._cond.notify_all()  # Réveille les autres threads pour qu'ils s'arrêtent aussi
+                        return
+                    self._cond.wait()
+                playlist, (future, fn, args, queued_at) = self._next_job()
+
+            run_metrics.observe('queue_wait', time.perf_counter() - queued_at)
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[playlist] -= 1
+                    self._busy -= 1
+                    self._cond.notify()
+
+    def shutdown(self, wait=True):
+        """Arrête les threads une fois les files vidées"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+class AdaptiveController:
+    """Contrôleur AIMD : réduit la concurrence quand YouTube limite, l'augmente s'il reste de la marge
+
+    Toutes les `interval` secondes, il regarde la fenêtre écoulée :
+    - erreurs 429/403 (throttling) -> divise par 2 threads actifs et fragments parallèles
+    - taux d'erreurs élevé -> retire 1 thread
+    - file saturée et débit par thread stable -> ajoute 1 thread et 1 fragment
+    Chaque décision est affichée et écrite dans le log de session.
+    """
+    THROTTLE_MARKERS = ('429', 'too many requests', '403', 'forbidden', 'rate limit', 'rate-limit')
+
+    def __init__(self, interval=5.0, max_fragments=FRAGMENT_DOWNLOADS):
+        self.interval = interval
+        self.max_fragments = max_fragments
+        self.fragments = max_fragments
+        self.scheduler = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset_window()
+        self._hold_until = 0.0
+        self._last_increase = False
+        self._per_worker_before = 0.0
+
+    def _reset_window(self):
+        self._successes = 0
+        self._errors = 0
+        self._throttled = 0
+        self._bytes = 0
+
+    def record_success(self, nbytes):
+        with self._lock:
+            self._successes += 1
+            self._bytes += nbytes
+
+    def record_failure(self, error_str):
+        """Compte un échec ; les erreurs 429/403 sont comptées comme du throttling"""
+        error_str = (error_str or '').lower()
+        with self._lock:
+            if any(marker in error_str for marker in self.THROTTLE_MARKERS):
+                self._throttled += 1
+            else:
+                self._errors += 1
+
+    def record_retry(self, message):
+        """Retry annoncé par yt-dlp : un 429/403 retenté compte déjà comme du throttling"""
+        message = message.lower()
+        if any(marker in message for marker in self.THROTTLE_MARKERS):
+            with self._lock:
+                self._throttled += 1
+
+    def start(self, scheduler):
+        """Branche le contrôleur sur le scheduler et démarre à mi-capacité"""
+        self.scheduler = scheduler
+        self.fragments = self.max_fragments
+        scheduler.set_active_limit(max(1, scheduler.max_workers // 2))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="adaptive-controller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+        self.scheduler = None
+        self.fragments = self.max_fragments
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.tick()
+
+    def _decide(self, message):
+        safe_print(f"\033[96m🎛️  {message}\033[0m")
+        logger.info(f"[Contrôleur] {message}")
+
+    def tick(self):
+        """Une décision AIMD sur la fenêtre écoulée"""
+        scheduler = self.scheduler
+        if scheduler is None:
+            return
+        with self._lock:
+            successes, errors, throttled, nbytes = self._successes, self._errors, self._throttled, self._bytes
+            self._reset_window()
+
+        now = time.time()
+        limit = scheduler.active_limit
+        per_worker = nbytes / self.interval / max(1, limit)
+        attempts = successes + errors
+
+        if throttled:
+            # Diminution multiplicative + pause avant de remonter
+            new_limit = scheduler.set_active_limit(limit // 2)
+            self.fragments = max(1, self.fragments // 2)
+            self._hold_until = now + self.interval * 6
+            self._last_increase = False
+            self._decide(f"Throttling détecté ({throttled} erreurs 429/403) → {new_limit} threads, "
+                         f"{self.fragments} fragments")
+        elif attempts >= 3 and errors / attempts > 0.3:
+            new_limit = scheduler.set_active_limit(limit - 1)
+            self._last_increase = False
+            if new_limit != limit:
+                self._decide(f"Taux d'erreurs {errors}/{attempts} → {new_limit} threads")
+        elif successes and now >= self._hold_until and scheduler.is_saturated():
+            if self._last_increase and per_worker < self._per_worker_before * 0.7:
+                # Le thread ajouté a surtout dilué le débit : on est au bord, on recule d'un cran
+                new_limit = scheduler.set_active_limit(limit - 1)
+                self._hold_until = now + self.interval * 12
+                self._last_increase = False
+                self._decide(f"Débit par thread en baisse ({per_worker / 1024:.0f} KB/s) → {new_limit} threads")
+            elif limit < scheduler.max_workers or self.fragments < self.max_fragments:
+                new_limit = scheduler.set_active_limit(limit + 1)
+                self.fragments = min(self.max_fragments, self.fragments + 1)
+                self._per_worker_before = per_worker
+                self._last_increase = True
+                self._decide(f"Marge disponible ({per_worker / 1024:.0f} KB/s par thread) → {new_limit} threads, "
+                             f"{self.fragments} fragments")
         else:
-            return False, "❌ Test impossible - Erreur de connexion"
-            
-    except Exception as e:
-        # Nettoyer en cas d'erreur
+            self._last_increase = False
+
+adaptive_controller = AdaptiveController()
+
+# Extensions de fichiers finaux reconnues (validation, skip, indexation)
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.opus', '.ogg')
+
+# Famille de codec yt-dlp (acodec) -> extension du fichier final en mode natif
+NATIVE_CODEC_EXTENSIONS = {
+    'aac': '.m4a',
+    'opus': '.opus',
+    'vorbis': '.ogg',
+    'mp3': '.mp3',
+}
+
+def codec_family(acodec):
+    """'mp4a.40.2' -> 'aac', 'opus' -> 'opus', ... (None si inconnu)"""
+    acodec = (acodec or '').lower()
+    if acodec.startswith('mp4a') or acodec == 'aac':
+        return 'aac'
+    for family in ('opus', 'vorbis', 'mp3'):
+        if acodec.startswith(family):
+            return family
+    return None
+
+class OutputPolicy:
+    """Politique de sortie audio
+
+    - 'mp3'    : toujours réencoder en MP3 320kbps (comportement historique)
+    - 'native' : garder le codec source (m4a/opus), simple remux + tags, sans réencodage
+    - 'auto'   : garder le codec source s'il est dans allowed_codecs, sinon MP3
+    """
+    MODES = ('mp3', 'native', 'auto')
+
+    def __init__(self, mode='mp3', allowed_codecs=('aac', 'opus'), pipe=False):
+        if mode not in self.MODES:
+            raise ValueError(f"Politique de sortie inconnue: {mode} (choix: {', '.join(self.MODES)})")
+        self.mode = mode
+        self.allowed_codecs = tuple(allowed_codecs)
+        # pipe=True : le flux téléchargé va directement dans ffmpeg, sans fichier intermédiaire
+        self.pipe = pipe
+
+    def plan(self, source_path, acodec):
+        """Retourne (fichier final, réencodage MP3 nécessaire ?)"""
+        family = codec_family(acodec)
+        if family is None and source_path.suffix.lower() in AUDIO_EXTENSIONS:
+            family = {'.m4a': 'aac', '.opus': 'opus', '.ogg': 'vorbis', '.mp3': 'mp3'}[source_path.suffix.lower()]
+
+        keep = (family == 'mp3'
+                or (self.mode == 'native' and family in NATIVE_CODEC_EXTENSIONS)
+                or (self.mode == 'auto' and family in self.allowed_codecs))
+        if keep:
+            return source_path.with_suffix(NATIVE_CODEC_EXTENSIONS[family]), False
+        return source_path.with_suffix('.mp3'), True
+
+    def __str__(self):
+        if self.mode == 'auto':
+            description = f"auto (garde {', '.join(self.allowed_codecs)}, sinon MP3 {MP3_QUALITY}k)"
+        else:
+            description = {'mp3': f"MP3 {MP3_QUALITY}kbps", 'native': "codec natif (remux, sans réencodage)"}[self.mode]
+        return f"{description}, flux direct vers ffmpeg" if self.pipe else description
+
+DEFAULT_OUTPUT_POLICY = OutputPolicy()
+
+class TranscodePool:
+    """Étage de transcodage borné : un ffmpeg par cœur CPU, avec contre-pression sur l'étage réseau"""
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 2
+        # Fichiers en attente de ffmpeg au maximum avant de bloquer les threads réseau
+        self.max_pending = max_pending or self.workers * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcode")
+
+    def submit(self, source_path, target_path, transcode=True, tags=None):
+        """Met un fichier en file de conversion (bloque si la file est pleine)"""
+        self._slots.acquire()
         try:
-            for file in test_dir.glob("*"):
-                file.unlink()
-            test_dir.rmdir()
-        except:
+            future = self._executor.submit(self._run, time.perf_counter(), source_path, target_path, transcode, tags)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    @staticmethod
+    def _run(queued_at, *args):
+        run_metrics.observe('transcode_wait', time.perf_counter() - queued_at)
+        return convert_audio(*args)
+
+_transcode_pool = None
+_transcode_pool_lock = threading.Lock()
+
+def get_transcode_pool():
+    """Pool de transcodage partagé par toutes les playlists"""
+    global _transcode_pool
+    with _transcode_pool_lock:
+        if _transcode_pool is None:
+            _transcode_pool = TranscodePool()
+        return _transcode_pool
+
+def ffmpeg_command(source, part_path, transcode, tags):
+    """Commande ffmpeg : MP3 320kbps ou copie du codec, tags, sortie dans le fichier .part"""
+    cmd = [FFMPEG_BIN, '-y', '-loglevel', 'error', '-i', source, '-vn']
+    if transcode:
+        cmd += ['-codec:a', 'libmp3lame', '-b:a', f'{MP3_QUALITY}k']
+    else:
+        cmd += ['-codec:a', 'copy']
+    for key, value in (tags or {}).items():
+        if value:
+            cmd += ['-metadata', f'{key}={value}']
+    cmd.append(str(part_path))
+    return cmd
+
+def part_path_for(target_path):
+    # Écriture dans un fichier temporaire puis renommage : le fichier final n'est jamais à moitié écrit
+    return target_path.with_name(f"{target_path.stem}.part{target_path.suffix}")
+
+def convert_audio(source_path, target_path, transcode=True, tags=None):
+    """Réencode en MP3 320kbps (ou remuxe sans réencodage), ajoute les tags, supprime l'intermédiaire"""
+    part_path = part_path_for(target_path)
+    cmd = ffmpeg_command(str(source_path), part_path, transcode, tags)
+
+    with run_metrics.span('postprocess'):
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        try:
+            part_path.unlink()
+        except FileNotFoundError:
             pass
-        return False, f"❌ Erreur critique lors du test: {str(e)[:50]}..."
+        error = result.stderr.decode('utf-8', 'replace').strip()
+        raise RuntimeError(f"ffmpeg ({result.returncode}): {error[-200:]}")
+
+    with run_metrics.span('cleanup'):
+        os.replace(part_path, target_path)
+        # On connaît le chemin exact du fichier intermédiaire : pas de nettoyage "au flair"
+        if source_path != target_path:
+            try:
+                source_path.unlink()
+            except FileNotFoundError:
+                pass
+    return target_path
+
+def convert_stream(chunks, target_path, transcode=True, tags=None, on_block=None):
+    """Mode pipe : envoie le flux téléchargé sur l'entrée de ffmpeg, seul le .part final touche le disque"""
+    part_path = part_path_for(target_path)
+    cmd = ffmpeg_command('pipe:0', part_path, transcode, tags)
+    # stderr dans un fichier temporaire : pas de blocage si ffmpeg parle beaucoup pendant qu'on écrit
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            with run_metrics.span('download'):
+                try:
+                    for block in chunks:
+                        process.stdin.write(block)
+                        if on_block:
+                            on_block(len(block))
+                except BrokenPipeError:
+                    pass  # ffmpeg s'est arrêté : son code de retour dit pourquoi
+                finally:
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
+            with run_metrics.span('postprocess'):
+                returncode = process.wait()
+        except BaseException:
+            process.kill()
+            process.wait()
+            part_path.unlink(missing_ok=True)
+            raise
+        if returncode != 0:
+            part_path.unlink(missing_ok=True)
+            stderr.seek(0)
+            error = stderr.read().decode('utf-8', 'replace').strip()
+            raise RuntimeError(f"ffmpeg ({returncode}): {error[-200:]}")
+    os.replace(part_path, target_path)
+    return target_path
+
+class StreamFallback(Exception):
+    """Format choisi non lisible en flux simple (fragments, fusion audio+vidéo) : repli en mode fichier
+
+    Porte l'info dict déjà extraite, pour que le mode fichier ne réextraie pas la vidéo.
+    """
+    def __init__(self, info):
+        super().__init__("format non lisible en flux")
+        self.info = info
 
-def download_single_video(video_info, output_dir, playlist_name):
-    """Télécharge une seule vidéo avec gestion d'erreur optimisée et vérification ultra-rapide du MP3 généré"""
-    video_id = video_info.get('id')
-    title = video_info.get('title', 'Unknown')[:50]
+def stream_source_audio(video_id, title, output_path, playlist_name, output_policy, work_dir=None):
+    """Mode pipe : extraction puis flux HTTP -> ffmpeg -> fichier converti, sans intermédiaire
+
+    Le fichier converti est écrit dans work_dir (défaut : output_path).
+    Retourne (chemin converti ou None si échec, bitrate). Lève StreamFallback si le
+    format choisi n'est pas un flux HTTP simple : l'appelant repasse en mode fichier.
+    """
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    context = get_worker_context()
+    try:
+        info = context.extract(url, work_dir or output_path)
+    except Exception as e:
+        adaptive_controller.record_failure(str(e))
+        failure_notes.note(video_id, e)
+        logger.error(f"[{playlist_name}] ERREUR: {title} - {str(e)}")
+        return None, None
+    if not info:
+        adaptive_controller.record_failure(None)
+        failure_notes.note(video_id, "audio non trouvé")
+        logger.error(f"[{playlist_name}] Audio non trouvé: {title}")
+        return None, None
+    if info.get('requested_formats') or info.get('protocol') not in ('http', 'https'):
+        raise StreamFallback(info)
+
+    # Même nom de fichier que le mode fichier, sans jamais l'écrire
+    source_name = Path(context.ydl.prepare_filename(info))
+    target_path, transcode = output_policy.plan(source_name, info.get('acodec'))
+    bitrate = int(MP3_QUALITY) if transcode else (int(info['abr']) if info.get('abr') else None)
+    tags = {
+        'title': info.get('track') or info.get('title'),
+        'artist': info.get('artist') or info.get('uploader'),
+        'album': info.get('album'),
+        'comment': url,  # URL source : permet de retrouver l'ID vidéo depuis le fichier
+    }
+
+    slot = progress_board.slot()
+    progress_board.start_track(Path(output_path).name)
+    slot.total = info.get('filesize') or info.get('filesize_approx') or 0
+    def on_block(size):
+        slot.downloaded += size
+        network_budget.consume(size)
+    connections = network_budget.acquire_connections(1)
+    try:
+        file_path = convert_stream(context.open_stream(info), target_path, transcode, tags, on_block)
+    except Exception as e:
+        adaptive_controller.record_failure(str(e))
+        failure_notes.note(video_id, e)
+        logger.error(f"[{playlist_name}] ERREUR flux: {title} - {str(e)}")
+        return None, None
+    finally:
+        network_budget.release_connections(connections)
+        streamed = slot.downloaded
+        progress_board.end_track()
+    adaptive_controller.record_success(streamed)
+    run_metrics.add('bytes_downloaded', streamed)
+    return file_path, bitrate
+
+def discard_partial_files(paths):
+    """Supprime les fichiers intermédiaires d'un téléchargement échoué (chemins exacts seulement)"""
+    for path in paths:
+        for candidate in (path, path.with_name(path.name + '.ytdl')):
+            try:
+                candidate.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Nettoyage impossible: {candidate} - {e}")
+
+def fetch_source_audio(video_id, title, output_path, playlist_name, work_dir=None, info=None):
+    """Étage réseau : télécharge le flux audio brut dans work_dir (défaut : output_path), sans conversion
+
+    info : extraction déjà faite par le mode pipe (StreamFallback), réutilisée telle quelle.
+    Retourne (chemin, infos audio) ou (None, None) en cas d'échec.
+    """
     url = f"https://www.youtube.com/watch?v={video_id}"
 
+    try:
+        # YoutubeDL du thread réutilisé (pas de nouvelle session HTTP / handshake TLS par vidéo)
+        progress_board.start_track(Path(output_path).name)
+        context = get_worker_context()
+        try:
+            info = context.download(url, work_dir or output_path, info=info)
+        except Exception:
+            discard_partial_files(context.partial_files)
+            raise
+        finally:
+            progress_board.end_track()
+
+        source_path = None
+        if info:
+            requested = info.get('requested_downloads') or [{}]
+            source_path = requested[0].get('filepath') or info.get('filepath')
+
+        if source_path and Path(source_path).exists():
+            source_size = Path(source_path).stat().st_size
+            adaptive_controller.record_success(source_size)
+            run_metrics.add('bytes_downloaded', source_size)
+            audio_info = {
+                'acodec': info.get('acodec'),
+                'abr': info.get('abr'),
+                'title': info.get('track') or info.get('title'),
+                'artist': info.get('artist') or info.get('uploader'),
+                'album': info.get('album'),
+                'url': url,
+            }
+            return Path(source_path), audio_info
+
+        adaptive_controller.record_failure(None)
+        failure_notes.note(video_id, "audio non trouvé")
+        with print_lock:
+            print(f"❌ Échec téléchargement: {title[:50]}")
+        logger.error(f"[{playlist_name}] Audio non trouvé: {title}")
+        return None, None
+
+    except Exception as e:
+        adaptive_controller.record_failure(str(e))
+        failure_notes.note(video_id, e)
+        error_str = str(e).lower()
+        if "music premium members" in error_str or "premium members" in error_str:
+            logger.error(f"[{playlist_name}] PREMIUM REQUIS: {title}")
+        elif classify_failure(error_str) == 'permanent':
+            logger.error(f"[{playlist_name}] INDISPONIBLE: {title}")
+        else:
+            logger.error(f"[{playlist_name}] ERREUR: {title} - {str(e)}")
+        return None, None
+
+def get_scratch_dir():
+    """Dossier de travail : SCRATCH_DIR (tmpfs, SSD rapide...) ou downloads/.staging"""
+    return Path(SCRATCH_DIR) if SCRATCH_DIR else LIBRARY_DIR / ".staging"
+
+def job_scratch_dir(video_id):
+    """Dossier de travail d'un titre : stable d'un run à l'autre, pour reprendre un .part"""
+    return get_scratch_dir() / video_id
+
+def remove_scratch_dir(video_id):
+    shutil.rmtree(job_scratch_dir(video_id), ignore_errors=True)
+
+def publish_file(staged_path, final_path):
+    """Déplace un fichier validé dans la bibliothèque par renommage atomique
+
+    Même disque : un simple os.replace. Autre disque (tmpfs...) : copie vers un
+    .part à côté de la destination, fsync, puis os.replace.
+    """
+    try:
+        os.replace(staged_path, final_path)
+        return final_path
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    part_path = part_path_for(final_path)
+    try:
+        with open(staged_path, 'rb') as source, open(part_path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(part_path, final_path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    staged_path.unlink()
+    return final_path
+
+def final_path_for(video_id, staged_path, output_dir):
+    """Nom final dans la playlist ; suffixé par l'ID si un autre titre porte déjà ce nom"""
+    final_path = Path(output_dir) / staged_path.name
+    if final_path.exists():
+        entry = get_manifest().lookup(video_id, output_dir)
+        if not entry or entry['path'] != final_path:
+            final_path = final_path.with_name(f"{final_path.stem} [{video_id}]{final_path.suffix}")
+    return final_path
+
+def resume_interrupted_jobs():
+    """Au démarrage : purge le journal et les dossiers de travail orphelins
+
+    Retourne le nombre de titres interrompus au dernier run ; ils repartent de
+    leur dernière étape quand leur playlist est relancée (.part repris, ou
+    conversion directe si le téléchargement était fini).
+    """
+    manifest = get_manifest()
+    manifest.prune_done_jobs()
+    interrupted = len(manifest.pending_jobs())
+    scratch_dir = get_scratch_dir()
+    if scratch_dir.is_dir():
+        keep = manifest.unfinished_job_ids()
+        for job_dir in scratch_dir.iterdir():
+            if job_dir.is_dir() and job_dir.name not in keep:
+                shutil.rmtree(job_dir, ignore_errors=True)
+    return interrupted
+
+def finish_track(video_id, title, file_path, playlist_name, bitrate=None, output_dir=None):
+    """Valide le fichier audio, le publie dans output_dir et l'enregistre dans le manifeste
+
+    Retourne le chemin final dans la bibliothèque, ou None si le fichier est invalide.
+    """
+    with run_metrics.span('validate'):
+        return _finish_track(video_id, title, file_path, playlist_name, bitrate, output_dir)
+
+def _finish_track(video_id, title, file_path, playlist_name, bitrate, output_dir):
+    if (file_path and file_path.suffix.lower() in AUDIO_EXTENSIONS
+            and file_path.exists() and file_path.stat().st_size > 0):
+        # Fichier validé : il n'arrive dans la playlist qu'à ce moment, d'un seul renommage
+        if output_dir is not None and file_path.parent != Path(output_dir):
+            try:
+                final_path = final_path_for(video_id, file_path, output_dir)
+                # Journal d'abord : un crash juste après la publication ne laisse pas le fichier orphelin
+                get_manifest().set_final_path(video_id, output_dir, final_path, bitrate)
+                file_path = publish_file(file_path, final_path)
+            except (OSError, sqlite3.Error) as e:
+                global_stats.add_video_failure()
+                failure_notes.note(video_id, f"publication: {e}")
+                logger.error(f"[{playlist_name}] Publication impossible: {title} - {e}")
+                return None
+        file_size = file_path.stat().st_size / (1024 * 1024)
+        with print_lock:
+            print(f"✅ {file_path.suffix[1:].upper()} validé: {file_path.name[:50]} ({file_size:.1f} MB)")
+
+        # Le manifeste n'est écrit qu'une fois le fichier validé
+        try:
+            get_manifest().record(video_id, file_path, bitrate=bitrate)
+        except Exception as e:
+            logger.error(f"[{playlist_name}] Erreur écriture manifeste: {title} - {e}")
+        global_stats.add_video_success()
+        return file_path
+
+    global_stats.add_video_failure()
+    failure_notes.note(video_id, "validation audio")
+    with print_lock:
+        print(f"❌ Échec validation audio: {title[:50]}")
+    logger.error(f"[{playlist_name}] Fichier audio non trouvé: {title}")
+    return None
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+def submit_single_video(video_info, output_dir, playlist_name, output_policy=None):
+    """Étage réseau d'une vidéo, à lancer dans un thread de téléchargement
+
+    Télécharge le flux audio puis confie la conversion au pool de transcodage,
+    sans l'attendre : le thread réseau peut enchaîner sur la vidéo suivante.
+    Retourne un Future(bool) résolu quand le fichier final est prêt (ou a échoué).
+
+    Une vidéo présente dans plusieurs playlists n'est téléchargée qu'une fois :
+    les autres playlists attendent le résultat et reçoivent un lien vers le fichier.
+    """
+    output_policy = output_policy or DEFAULT_OUTPUT_POLICY
+    video_id = video_info.id
+    title = (video_info.title or 'Unknown')[:50]
+
     output_path = Path(output_dir)
-    # Vérifier si le fichier existe déjà (méthode sécurisée sans glob)
-    if output_path.exists():
-        # Créer plusieurs variantes du titre pour la correspondance
-        title_variants = [
-            title,  # Titre original
-            clean_filename(title),  # Version avec X au lieu de *
-            title.replace('***', 'XXX').replace('**', 'XX').replace('*', 'X'),  # Astérisques remplacées par X
-            title.replace('*', ''),  # Sans astérisques
-            title.replace('*', '_'),  # Astérisques remplacées par underscore
-            "".join(c for c in title if c.isalnum() or c in (' ', '-', '_', '.')).strip()  # Complètement sanitizé
-        ]
-        for existing_file in output_path.iterdir():
-            if existing_file.suffix.lower() == '.mp3':
-                file_stem_lower = existing_file.stem.lower()
-                for variant in title_variants:
-                    if variant and file_stem_lower.startswith(variant.lower()[:30]):
-                        global_stats.add_video_success()
-                        return True
+    manifest = get_manifest()
+    # Déjà téléchargé ? Lookup O(1) dans le manifeste par ID (plus de scan du dossier par titre)
+    with run_metrics.span('manifest_lookup'):
+        # Sinon, un ancien fichier indexé (commande index) au nom de ce titre fait l'affaire
+        already_complete = (manifest.is_complete(video_id, output_path)
+                            or manifest.adopt_published_file(video_id, output_path) is not None
+                            or manifest.adopt_indexed_file(video_id, output_path, video_info.title) is not None)
+    if already_complete:
+        # Dossier repris après un crash : le titre était fini, le journal le suit
+        manifest.mark_done(video_id, output_path)
+        global_stats.add_video_success()
+        return _resolved(True)
+
+    result = Future()
+    is_owner, shared_result = track_store.claim(video_id)
+    if not is_owner:
+        # Même vidéo en cours de téléchargement pour une autre playlist : on attend son fichier
+        def on_shared(shared):
+            ok = False
+            try:
+                source_path = shared.result()
+                ok = bool(source_path) and publish_shared_track(video_id, source_path, output_path, playlist_name)
+            finally:
+                if ok:
+                    global_stats.add_video_success()
+                else:
+                    global_stats.add_video_failure()
+                    logger.error(f"[{playlist_name}] ÉCHEC PARTAGÉ: {title}")
+                    try:
+                        manifest.set_job_state(video_id, output_path, 'failed', error="échec partagé",
+                                               failure_class='transient')
+                    except sqlite3.Error as e:
+                        logger.error(f"[{playlist_name}] Erreur journal: {title} - {e}")
+                result.set_result(ok)
+        shared_result.add_done_callback(on_shared)
+        return result
+
+    work_dir = job_scratch_dir(video_id)
+
+    def complete(file_path):
+        # Réveiller les playlists qui attendent cette vidéo (None = échec)
+        track_store.release(video_id, file_path)
+        try:
+            if file_path is None:
+                error, failure_class = failure_notes.pop(video_id)
+                manifest.set_job_state(video_id, output_path, 'failed', error=error, failure_class=failure_class)
+            # Seul un crash laisse un dossier de travail derrière lui (et donc un .part à reprendre)
+            remove_scratch_dir(video_id)
+        except Exception as e:
+            logger.error(f"[{playlist_name}] Erreur journal: {title} - {e}")
+        result.set_result(file_path is not None)
+
+    source_path = None
+    try:
+        # Déjà dans la bibliothèque pour une autre playlist : lien au lieu d'un 2e téléchargement
+        existing = manifest.lookup_any(video_id)
+        if existing and publish_shared_track(video_id, existing['path'], output_path, playlist_name):
+            global_stats.add_video_success()
+            complete(existing['path'])
+            return result
+
+        work_dir.mkdir(parents=True, exist_ok=True)
+        job = manifest.get_job(video_id, output_path)
+        if (job and job['state'] == 'transcoding' and job['info']
+                and job['source_path'] and job['source_path'].exists()):
+            # Reprise après crash : le téléchargement était fini, on repart de la conversion
+            source_path, audio_info = job['source_path'], job['info']
+            logger.info(f"[{playlist_name}] Reprise conversion: {title}")
+        else:
+            manifest.set_job_state(video_id, output_path, 'downloading', title=title)
+            extracted = None
+            if output_policy.pipe:
+                try:
+                    staged_path, bitrate = stream_source_audio(video_id, title, output_path, playlist_name,
+                                                               output_policy, work_dir)
+                except StreamFallback as fallback:
+                    extracted = fallback.info
+                else:
+                    file_path = None
+                    if staged_path:
+                        file_path = finish_track(video_id, title, staged_path, playlist_name, bitrate, output_path)
+                    else:
+                        global_stats.add_video_failure()
+                    complete(file_path)
+                    return result
+
+            source_path, audio_info = fetch_source_audio(video_id, title, output_path, playlist_name, work_dir,
+                                                         extracted)
+            if not source_path:
+                global_stats.add_video_failure()
+                complete(None)
+                return result
+            manifest.set_job_state(video_id, output_path, 'transcoding', source_path=source_path, info=audio_info)
+
+        target_path, transcode = output_policy.plan(source_path, audio_info['acodec'])
+        bitrate = int(MP3_QUALITY) if transcode else (int(audio_info['abr']) if audio_info['abr'] else None)
+        tags = {
+            'title': audio_info['title'],
+            'artist': audio_info['artist'],
+            'album': audio_info['album'],
+            'comment': audio_info['url'],  # URL source : permet de retrouver l'ID vidéo depuis le fichier
+        }
+        conversion = get_transcode_pool().submit(source_path, target_path, transcode, tags)
+    except Exception as e:
+        if source_path:
+            discard_partial_files([source_path])
+        logger.error(f"[{playlist_name}] ERREUR: {title} - {str(e)}")
+        failure_notes.note(video_id, e)
+        global_stats.add_video_failure()
+        complete(None)
+        return result
+
+    def on_converted(future):
+        file_path = None
+        try:
+            file_path = future.result()
+        except Exception as e:
+            logger.error(f"[{playlist_name}] ERREUR conversion: {title} - {str(e)}")
+            failure_notes.note(video_id, f"conversion: {e}")
+            # Conversion ratée : on sait exactement quel fichier source supprimer
+            discard_partial_files([source_path])
+        published = None
+        try:
+            published = finish_track(video_id, title, file_path, playlist_name, bitrate, output_path)
+        finally:
+            complete(published)
+
+    conversion.add_done_callback(on_converted)
+    return result
+
+def download_single_video(video_info, output_dir, playlist_name, output_policy=None):
+    """Télécharge une seule vidéo avec gestion d'erreur optimisée et vérification ultra-rapide du fichier généré"""
+    return submit_single_video(video_info, output_dir, playlist_name, output_policy).result()
+
+# Champs gardés pour chaque entrée de playlist (le reste de l'extraction à plat est inutile ici)
+class PlaylistEntry:
+    """Titre d'une playlist gardé pendant le run (cache, synchro) : ID, titre et durée seulement"""
+    __slots__ = ('id', 'title', 'duration')
+
+    def __init__(self, video_id, title=None, duration=None):
+        self.id = video_id
+        self.title = title
+        self.duration = duration
+
+    @classmethod
+    def from_info(cls, entry):
+        """Entrée à plat de yt-dlp (dict complet) -> PlaylistEntry"""
+        return cls(entry['id'], entry.get('title'), entry.get('duration'))
+
+    @classmethod
+    def from_cache(cls, item):
+        """Ligne du cache disque : [id, titre, durée], ou dict écrit par une version précédente"""
+        if isinstance(item, dict):
+            return cls.from_info(item)
+        return cls(*item)
+
+    def to_cache(self):
+        return [self.id, self.title, self.duration]
+
+def _clean_playlist_title(title):
+    """Nettoyer le nom du dossier"""
+    title = title or f'Playlist_{int(time.time())}'
+    return "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
+
+def get_flat_ydl_opts():
+    """Options yt-dlp de l'extraction à plat (métadonnées seulement)"""
+    return {
+        'quiet': True,
+        'extract_flat': True,
+        'dump_single_json': False,
+        'socket_timeout': 30,
+        'logger': SilentLogger(),
+    }
+
+def _extract_flat_info(ydl, url):
+    # process=False : yt-dlp ne consomme pas les entrées, elles restent un générateur paginé
+    info = ydl.extract_info(url, download=False, process=False)
+    for _ in range(5):  # Suivre les redirections (ex: watch?v=...&list=... -> playlist)
+        if not info or info.get('_type') not in ('url', 'url_transparent'):
+            break
+        info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+    return info
+
+def stream_playlist_info(playlist_url, ydl=None):
+    """Extraction à plat paresseuse -> (titre, ID playlist, générateur d'entrées)
+
+    Les entrées sont produites au fur et à mesure que yt-dlp pagine la playlist :
+    on peut commencer à télécharger avant la fin de l'extraction. Une erreur de
+    pagination est levée par le générateur. Retourne (None, None, None) si la
+    playlist est inaccessible. `ydl` : YoutubeDL à plat réutilisé (non fermé ici).
+    """
+    own_ydl = ydl is None
+    if own_ydl:
+        ydl = yt_dlp.YoutubeDL(get_flat_ydl_opts())
+    try:
+        info = _extract_flat_info(ydl, playlist_url)
+    except Exception as e:
+        if own_ydl:
+            ydl.close()
+        logger.error(f"Erreur extraction playlist {playlist_url}: {str(e)}")
+        return None, None, None
+
+    playlist_title = _clean_playlist_title(info.get('title'))
+    # ID stable de la playlist (sert au mode synchro pour retrouver son dossier)
+    playlist_id = info.get('id') or playlist_title
+
+    def entries():
+        try:
+            raw_entries = info.get('entries')
+            if raw_entries is None:
+                raw_entries = [info]  # URL d'une vidéo seule
+            for entry in raw_entries:
+                if entry and entry.get('id'):
+                    yield PlaylistEntry.from_info(entry)
+        finally:
+            if own_ydl:
+                ydl.close()
+
+    return playlist_title, playlist_id, entries()
+
+def fetch_playlist_info(playlist_url, ydl=None, max_entries=None, count_all=True):
+    """Extraction à plat d'une playlist, sans cache -> (titre, entrées, ID playlist, nombre de titres)
+
+    Au-delà de max_entries titres, les entrées ne sont plus gardées (entrées = None) : la
+    playlist sera relue en streaming au téléchargement. count_all=False arrête alors la
+    pagination (préchargement), sinon elle continue pour compter les titres (vérification).
+    """
+    playlist_title, playlist_id, entries = stream_playlist_info(playlist_url, ydl)
+    if playlist_title is None:
+        return None, [], None, 0
+    kept = []
+    count = 0
+    try:
+        for entry in entries:
+            count += 1
+            if kept is None:
+                continue
+            if max_entries is not None and count > max_entries:
+                kept = None
+                if not count_all:
+                    break
+            else:
+                kept.append(entry)
+    except Exception as e:
+        logger.error(f"Erreur extraction playlist {playlist_url}: {str(e)}")
+        return None, [], None, 0
+    return playlist_title, kept, playlist_id, count
+
+class PlaylistCache:
+    """Cache des métadonnées de playlists : en mémoire pour le run, sur disque (TTL) entre les runs"""
+    def __init__(self, ttl=PLAYLIST_CACHE_TTL):
+        self.ttl = ttl  # 0 = pas de cache disque
+        self.memory_ttl = None  # Validité du cache mémoire (secondes) ; None = tout le run (le démon la fixe)
+        self._memory = {}  # Dict: url -> (résultat, time.monotonic() à l'écriture)
+        self._memory_entries = 0  # Titres gardés en mémoire, plafonnés à PLAYLIST_CACHE_MEMORY_ENTRIES
+        self._taken = {}  # Dict: url -> time.monotonic() de sa prise en main par un téléchargement
+        self._lock = threading.Lock()
+        self._in_flight = {}  # Dict: url -> Event levé quand l'extraction en cours se termine
+
+    def claim(self, url, prefetch=False):
+        """True si l'appelant doit extraire l'URL lui-même (ni en cache, ni déjà en cours ailleurs)
+
+        prefetch=True : False aussi pour une playlist déjà prise par un téléchargement.
+        """
+        if not prefetch and self.get(url):
+            return False
+        with self._lock:
+            if prefetch and url in self._taken:
+                if self.memory_ttl is None or time.monotonic() - self._taken[url] <= self.memory_ttl:
+                    return False
+            if url in self._memory or url in self._in_flight:
+                return False
+            self._in_flight[url] = threading.Event()
+        if prefetch and self.get(url):
+            self.abandon(url)  # Cache disque : rien à extraire
+            return False
+        return True
+
+    def wait(self, url):
+        """Attend l'extraction en cours de cette URL, puis retourne le cache (None si elle a échoué)"""
+        with self._lock:
+            pending = self._in_flight.get(url)
+        if pending is not None:
+            pending.wait()
+        return self.get(url)
+
+    def abandon(self, url):
+        """Extraction ratée : libère les threads qui attendaient cette URL"""
+        with self._lock:
+            pending = self._in_flight.pop(url, None)
+        if pending is not None:
+            pending.set()
+
+    def get(self, url):
+        with self._lock:
+            cached = self._memory.get(url)
+            if cached and self.memory_ttl is not None and time.monotonic() - cached[1] > self.memory_ttl:
+                self._forget(url)
+                cached = None
+        if cached:
+            return cached[0]
+        if self.ttl <= 0:
+            return None
+        try:
+            row = get_manifest().load_playlist_cache(url, self.ttl)
+        except Exception as e:
+            logger.error(f"Erreur lecture cache playlist {url}: {e}")
+            return None
+        if not row:
+            return None
+        _, title, entries, playlist_id = row
+        cached = (title, [PlaylistEntry.from_cache(item) for item in entries], playlist_id)
+        with self._lock:
+            self._remember(url, cached)
+        return cached
+
+    def put(self, url, result, memory=True):
+        """Garde une extraction complète ; memory=False : seulement sur disque (déjà consommée)
+
+        Une playlist de plus de PLAYLIST_CACHE_MAX_ENTRIES titres n'est gardée nulle part.
+        """
+        title, entries, playlist_id = result
+        keep = len(entries) <= PLAYLIST_CACHE_MAX_ENTRIES
+        with self._lock:
+            if memory and keep:
+                self._remember(url, result)
+            pending = self._in_flight.pop(url, None)
+        if pending is not None:
+            pending.set()
+        if self.ttl > 0 and keep:
+            try:
+                get_manifest().save_playlist_cache(url, title, [entry.to_cache() for entry in entries], playlist_id)
+            except Exception as e:
+                logger.error(f"Erreur écriture cache playlist {url}: {e}")
+
+    def _remember(self, url, result):
+        """Cache mémoire, dans la limite de PLAYLIST_CACHE_MEMORY_ENTRIES titres (appelé avec le verrou)
+
+        Au-delà, la playlist reste sur disque (ou sera réextraite) : le préchargement de
+        centaines de playlists ne les garde pas toutes en mémoire jusqu'à leur tour.
+        """
+        self._forget(url)
+        if self._memory_entries + len(result[1]) > PLAYLIST_CACHE_MEMORY_ENTRIES:
+            return
+        self._memory[url] = (result, time.monotonic())
+        self._memory_entries += len(result[1])
+
+    def _forget(self, url):
+        cached = self._memory.pop(url, None)
+        if cached:
+            self._memory_entries -= len(cached[0][1])
+
+    def take(self, url):
+        """Playlist passée au téléchargement : libère sa copie en mémoire (le disque la garde)
+
+        Le préchargement ne la réextrait plus, pour la même durée que le cache mémoire.
+        """
+        with self._lock:
+            self._forget(url)
+            self._taken[url] = time.monotonic()
+
+    def invalidate(self, url=None):
+        """Oublie le cache mémoire (d'une URL ou de tout) pour forcer une nouvelle extraction"""
+        with self._lock:
+            if url is None:
+                self._memory.clear()
+                self._memory_entries = 0
+                self._taken.clear()
+            else:
+                self._forget(url)
+                self._taken.pop(url, None)
+
+playlist_cache = PlaylistCache()
+
+def extract_playlist_info_fast(playlist_url, ydl=None, prefetch=False):
+    """Extraction rapide des informations de playlist -> (titre, entrées, ID playlist, nombre de titres)
+
+    Une playlist n'est paginée qu'une fois par run (vérification puis téléchargement
+    réutilisent le même résultat, une extraction déjà en cours est attendue), et le
+    cache disque évite de la repaginer entre deux runs rapprochés (voir PLAYLIST_CACHE_TTL).
+    Entrées = None pour une playlist trop longue pour être gardée (voir fetch_playlist_info).
+    prefetch=True (préchargement) : ne fait rien si la playlist est déjà en cache, en cours
+    d'extraction ou de téléchargement, et ne pagine pas jusqu'au bout une playlist trop longue.
+    """
+    if not playlist_cache.claim(playlist_url, prefetch):
+        if prefetch:
+            return None, [], None, 0
+        cached = playlist_cache.wait(playlist_url)
+        if cached:
+            return cached + (len(cached[1]),)
+        return None, [], None, 0
+    result = (None, [], None, 0)
+    try:
+        start = time.perf_counter()
+        result = fetch_playlist_info(playlist_url, ydl, PLAYLIST_CACHE_MAX_ENTRIES, not prefetch)
+        run_metrics.observe('playlist_extract', time.perf_counter() - start)
+    finally:
+        if result[1]:
+            playlist_cache.put(playlist_url, result[:3])
+        else:
+            playlist_cache.abandon(playlist_url)
+    return result
+
+# URL de chaîne ou d'artiste (youtube.com ou music.youtube.com), onglet facultatif
+CHANNEL_URL_RE = re.compile(r'^(?:https?://)?(?:www\.|m\.|music\.)?youtube\.com/'
+                            r'(@[^/?#]+|channel/[\w-]+|c/[^/?#]+|user/[^/?#]+)/?([^/?#]*)')
+CHANNEL_PLAYLIST_TABS = ('releases', 'playlists')  # Albums/singles, puis playlists de la chaîne
+
+def channel_tab_urls(url):
+    """Onglets où chercher les playlists d'une chaîne/artiste ; None si l'URL n'en est pas une
+
+    Un onglet de vidéos (/videos, /streams...) reste une playlist ordinaire.
+    """
+    match = CHANNEL_URL_RE.match(url.strip())
+    if not match:
+        return None
+    base = f"https://www.youtube.com/{match.group(1)}"
+    if match.group(2) in CHANNEL_PLAYLIST_TABS:
+        return [f"{base}/{match.group(2)}"]
+    if match.group(2) in ('', 'featured'):
+        return [f"{base}/{tab}" for tab in CHANNEL_PLAYLIST_TABS]
+    return None
+
+def _playlist_entry_url(entry):
+    """URL de playlist d'une entrée d'onglet de chaîne (None pour une vidéo ou une autre chaîne)"""
+    url = entry.get('url') or ''
+    if 'list=' in url:
+        return url
+    if entry.get('ie_key') == 'YoutubeTab' and entry.get('id') and not CHANNEL_URL_RE.match(url):
+        return f"https://www.youtube.com/playlist?list={entry['id']}"
+    return None
+
+class MetadataEngine:
+    """Extraction à plat en masse : un pool de `concurrency` threads pour toutes les playlists et chaînes
+
+    yt-dlp est bloquant : chaque extraction occupe un thread du pool (un YoutubeDL à plat
+    réutilisé par thread), la taille du pool est donc la limite de concurrence. Le thread
+    appelant développe les chaînes en playlists, rend les résultats dans l'ordre saisi et
+    lance le préchargement dans playlist_cache, qu'il y ait 3 URLs ou 300.
+    """
+    def __init__(self, concurrency=None):
+        self.concurrency = max(1, int(concurrency or METADATA_CONCURRENCY))
+        self.prefetch = False  # Vrai pour stream : les résultats restent en cache, sans attendre ni tout paginer
+        self._local = threading.local()
+        self._ydls = []
+        self._ydls_lock = threading.Lock()
+
+    def _ydl(self):
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            ydl = self._local.ydl = yt_dlp.YoutubeDL(get_flat_ydl_opts())
+            with self._ydls_lock:
+                self._ydls.append(ydl)
+        return ydl
+
+    def _close(self):
+        with self._ydls_lock:
+            ydls, self._ydls = self._ydls, []
+        for ydl in ydls:
+            ydl.close()
+
+    def expand_channel(self, tab_urls):
+        """Onglets d'une chaîne -> URLs de ses playlists (sans doublons, dans l'ordre de la chaîne)"""
+        playlist_urls = []
+        for tab_url in tab_urls:
+            try:
+                info = _extract_flat_info(self._ydl(), tab_url)
+                for entry in (info or {}).get('entries') or []:
+                    playlist_url = _playlist_entry_url(entry) if entry else None
+                    if playlist_url:
+                        playlist_urls.append(playlist_url)
+            except Exception as e:
+                # Ex: chaîne sans onglet "releases" (pas une page d'artiste)
+                logger.info(f"Onglet de chaîne ignoré {tab_url}: {str(e)}")
+        return list(dict.fromkeys(playlist_urls))
+
+    def fetch(self, playlist_url, on_result=None):
+        result = extract_playlist_info_fast(playlist_url, self._ydl(), self.prefetch)
+        if on_result:
+            on_result(playlist_url, result)
+        return result
+
+    def _run(self, urls, emit, on_result=None, skip=0):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='metadata') as pool:
+            fetches = []
+            prefetched = set()
+            def prefetch(playlist_url):
+                if playlist_url in prefetched:
+                    return
+                prefetched.add(playlist_url)
+                fetches.append(pool.submit(self.fetch, playlist_url, on_result))
+
+            # Tout part dans le pool ensemble, dans l'ordre saisi : chaînes à développer et playlists simples
+            expansions = []
+            plain = 0
+            for url in urls:
+                tabs = channel_tab_urls(url)
+                expansions.append(pool.submit(self.expand_channel, tabs) if tabs else None)
+                if not tabs:
+                    if plain >= skip:
+                        prefetch(url)
+                    plain += 1
+
+            # Résultats dans l'ordre saisi, chaque chaîne remplacée par ses playlists (sans doublons)
+            emitted = set()
+            for url, expansion in zip(urls, expansions):
+                if expansion is None:
+                    playlist_urls = [url]
+                else:
+                    playlist_urls = expansion.result()
+                    safe_print(f"📺 {url[:60]} → {len(playlist_urls)} playlists")
+                for playlist_url in playlist_urls:
+                    if playlist_url in emitted:
+                        continue
+                    emitted.add(playlist_url)
+                    if expansion is not None:
+                        prefetch(playlist_url)
+                    emit(playlist_url)
+
+            for future in fetches:
+                if future.exception():
+                    logger.error(f"Erreur extraction playlist: {str(future.exception())}")
+        self._close()
+
+    def resolve(self, urls, on_result=None):
+        """Extrait toutes les URLs (chaînes développées)
+        -> [(url playlist, (titre, entrées, ID, nombre de titres) ou None)]
+
+        Entrées = None pour une playlist trop longue pour être gardée : à relire avec
+        stream_playlist_info. on_result(url, résultat) est appelé à chaque playlist
+        extraite, depuis un thread d'extraction.
+        """
+        playlist_urls = []
+        results = {}
+        def collect(playlist_url, result):
+            results[playlist_url] = result if result[0] and result[3] else None
+            if on_result:
+                on_result(playlist_url, result)
+        self._run(urls, playlist_urls.append, collect)
+        return [(url, results.get(url)) for url in playlist_urls]
+
+    def stream(self, urls, skip=0):
+        """Générateur des URLs de playlists dans l'ordre saisi, chaînes développées au fil de l'eau
+
+        Les métadonnées sont préchargées en arrière-plan dans playlist_cache, sauf pour
+        les `skip` premières URLs simples : leurs threads de téléchargement les extraient
+        en streaming et commencent avant la fin de la pagination. Une playlist trop longue
+        pour le cache n'est pas paginée jusqu'au bout ici : elle le sera à son tour, en streaming.
+        """
+        self.prefetch = True
+        results = Queue()
+        def run():
+            try:
+                self._run(urls, results.put, skip=skip)
+            except Exception as e:
+                logger.error(f"Erreur moteur de métadonnées: {str(e)}")
+            finally:
+                results.put(None)
+        threading.Thread(target=run, name='metadata-loop', daemon=True).start()
+        while True:
+            playlist_url = results.get()
+            if playlist_url is None:
+                return
+            yield playlist_url
+
+def resolve_sync_folder(playlist_id, playlist_name):
+    """Dossier stable d'une playlist en mode synchro (réutilisé d'un run à l'autre)"""
+    manifest = get_manifest()
+    output_dir = manifest.get_playlist_folder(playlist_id)
+    if output_dir:
+        return output_dir
+
+    # Première synchro : on prend le dossier au nom de la playlist, sauf s'il appartient déjà à une autre
+    output_dir = LIBRARY_DIR / playlist_name
+    counter = 1
+    while manifest.folder_owner(output_dir) not in (None, playlist_id):
+        output_dir = LIBRARY_DIR / f"{playlist_name}_{counter}"
+        counter += 1
+    return output_dir
+
+# === Indexation d'une bibliothèque existante (fichiers d'avant le manifeste) ===
+
+YOUTUBE_URL_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:\S*?&)?v=|shorts/|embed/)|youtu\.be/)([A-Za-z0-9_-]{11})')
+FILENAME_ID_RE = re.compile(r' \[([A-Za-z0-9_-]{11})\]$')  # Suffixe " [id]" des doublons (final_path_for)
+ID3_TEXT_FRAMES = {'TIT2': 'title', 'TT2': 'title', 'TPE1': 'artist', 'TP1': 'artist'}
+ID3_SOURCE_FRAMES = ('COMM', 'COM', 'TXXX', 'TXX', 'WXXX', 'WXX', 'WOAS', 'WAS', 'WOAF', 'WAF')
+ID3_ENCODINGS = {0: ('latin-1', b'\0'), 1: ('utf-16', b'\0\0'), 2: ('utf-16-be', b'\0\0'), 3: ('utf-8', b'\0')}
+
+def title_key(title):
+    """Clé de comparaison d'un titre et d'un nom de fichier : lettres et chiffres en minuscules,
+    40 premiers seulement (les noms de fichiers sont tronqués, la ponctuation remplacée)"""
+    return ''.join(c for c in (title or '').casefold() if c.isalnum())[:40]
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def _split_id3_text(body, encoding):
+    """(premier texte terminé par un zéro, reste) dans l'encodage ID3 donné"""
+    codec, terminator = ID3_ENCODINGS.get(encoding, ID3_ENCODINGS[0])
+    index = body.find(terminator)
+    while len(terminator) == 2 and index != -1 and index % 2:
+        index = body.find(terminator, index + 1)  # UTF-16 : terminateur aligné sur 2 octets
+    if index == -1:
+        return body.decode(codec, 'replace'), b''
+    return body[:index].decode(codec, 'replace'), body[index + len(terminator):]
+
+def _decode_id3_frame(frame_id, body):
+    """Texte utile d'une frame texte, commentaire ou URL"""
+    if not body:
+        return ''
+    if frame_id.startswith('W') and frame_id not in ('WXXX', 'WXX'):
+        return body.decode('latin-1', 'replace').strip('\0')  # URL simple, toujours en latin-1
+    encoding, body = body[0], body[1:]
+    if frame_id in ('COMM', 'COM'):
+        body = body[3:]  # Langue
+    if frame_id in ('COMM', 'COM', 'TXXX', 'TXX', 'WXXX', 'WXX'):
+        description, body = _split_id3_text(body, encoding)
+        if frame_id in ('WXXX', 'WXX'):
+            value = body.decode('latin-1', 'replace').strip('\0')  # L'URL elle-même est toujours en latin-1
+        else:
+            value = _split_id3_text(body, encoding)[0]
+        return f"{description} {value}"
+    return _split_id3_text(body, encoding)[0]
+
+def read_id3_tags(path):
+    """Lecteur ID3v2 minimal (v2.2 à v2.4) : titre, artiste et textes pouvant contenir l'URL source
+
+    Seuls l'en-tête et les frames utiles sont lus ; les grosses frames (pochette)
+    sont sautées sans être chargées. Retourne {'title', 'artist', 'sources'}.
+    """
+    tags = {'title': None, 'artist': None, 'sources': []}
+    with open(path, 'rb') as f:
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            return tags
+        major, flags = header[3], header[5]
+        if major not in (2, 3, 4) or flags & 0x80:
+            return tags  # Version inconnue, ou désynchronisation globale (rare, non gérée)
+        end = 10 + _syncsafe(header[6:10])
+        if flags & 0x40 and major > 2:  # En-tête étendu
+            size = f.read(4)
+            f.seek(_syncsafe(size) - 4 if major == 4 else int.from_bytes(size, 'big'), 1)
+        id_length, header_length = (3, 6) if major == 2 else (4, 10)
+        while f.tell() + header_length <= end:
+            frame_header = f.read(header_length)
+            frame_id = frame_header[:id_length]
+            if len(frame_header) < header_length or not frame_id.isalnum():
+                break  # Remplissage (zéros) : fin des frames
+            if major == 2:
+                size = int.from_bytes(frame_header[3:6], 'big')
+            elif major == 4:
+                size = _syncsafe(frame_header[4:8])
+            else:
+                size = int.from_bytes(frame_header[4:8], 'big')
+            frame_id = frame_id.decode('latin-1')
+            if frame_id in ID3_TEXT_FRAMES or frame_id in ID3_SOURCE_FRAMES:
+                text = _decode_id3_frame(frame_id, f.read(min(size, 4096))).strip()
+                f.seek(max(0, size - 4096), 1)
+                if frame_id in ID3_TEXT_FRAMES:
+                    tags[ID3_TEXT_FRAMES[frame_id]] = text
+                elif text:
+                    tags['sources'].append(text)
+            else:
+                f.seek(size, 1)
+    return tags
+
+def index_audio_file(path):
+    """(ID vidéo ou None, clé de titre) d'un fichier audio : tags ID3 (URL source en commentaire),
+    puis suffixe " [id]" du nom ; la clé de titre vient du nom du fichier, comme le nomme yt-dlp"""
+    stem = path.stem
+    match = FILENAME_ID_RE.search(stem)
+    video_id = match.group(1) if match else None
+    if match:
+        stem = stem[:match.start()]
+    if path.suffix.lower() == '.mp3':
+        try:
+            tags = read_id3_tags(path)
+        except (OSError, ValueError, IndexError) as e:  # Fichier illisible ou tag tronqué : le nom suffira
+            logger.error(f"Lecture des tags impossible: {path} - {e}")
+            tags = {'sources': []}
+        for text in tags['sources']:
+            found = YOUTUBE_URL_ID_RE.search(text)
+            if found:
+                video_id = found.group(1)
+                break
+    return video_id, title_key(stem)
+
+def iter_library_files(library_dir):
+    """Fichiers audio de la bibliothèque (dossiers cachés, dont .staging, exclus) -> (chemin, os.stat_result)"""
+    pending = [Path(library_dir)]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as scanner:
+                for item in scanner:
+                    if item.name.startswith('.'):
+                        continue
+                    if item.is_dir(follow_symlinks=False):
+                        pending.append(Path(item.path))
+                    elif item.name.lower().endswith(AUDIO_EXTENSIONS):
+                        yield Path(item.path), item.stat()
+        except OSError as e:
+            logger.error(f"Dossier illisible: {directory} - {e}")
+
+def index_library(library_dir=LIBRARY_DIR, threads=INDEX_THREADS, full=False):
+    """Indexe les fichiers audio déjà présents : ID vidéo (tags) ou clé de titre (nom), dans le manifeste
+
+    Incrémental : un fichier de même taille et même date qu'à l'indexation précédente
+    n'est pas relu (full=True relit tout). Les fichiers lus par lots de INDEX_BATCH, en
+    parallèle, et chaque lot est écrit en une transaction. Retourne les compteurs.
+    """
+    library_dir = Path(library_dir)
+    manifest = get_manifest()
+    known = manifest.indexed_files()
+    counts = {'files': 0, 'unchanged': 0, 'read': 0, 'with_id': 0, 'by_title': 0, 'removed': 0}
+
+    def read_batch(executor, batch):
+        rows = []
+        for (path, stat, folder, rel_path), (video_id, key) in zip(
+                batch, executor.map(index_audio_file, [item[0] for item in batch])):
+            rows.append((rel_path, folder, stat.st_size, stat.st_mtime, video_id, key))
+            counts['with_id' if video_id else 'by_title'] += 1
+        manifest.save_indexed_files(rows)
+        counts['read'] += len(rows)
+        safe_print(f"📚 {counts['read']} fichiers lus ({counts['unchanged']} inchangés)")
+
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='index') as executor:
+        batch = []
+        for path, stat in iter_library_files(library_dir):
+            counts['files'] += 1
+            folder = path.parent.relative_to(library_dir).as_posix()
+            rel_path = f"{folder}/{path.name}"
+            previous = known.pop(rel_path, None)
+            if not full and previous == (stat.st_size, stat.st_mtime):
+                counts['unchanged'] += 1
+                continue
+            batch.append((path, stat, folder, rel_path))
+            if len(batch) >= INDEX_BATCH:
+                read_batch(executor, batch)
+                batch = []
+        if batch:
+            read_batch(executor, batch)
+
+    # Ce qui reste de l'ancien index n'existe plus sur le disque
+    manifest.forget_indexed_files(known)
+    counts['removed'] = len(known)
+    return counts
 
-    # Utiliser un hook pour récupérer le nom du fichier MP3 final
-    final_mp3 = {'filename': None}
+def prune_removed_tracks(output_dir, current_ids, playlist_name):
+    """Supprime les titres retirés de la playlist (présents dans le manifeste mais plus en ligne)"""
+    manifest = get_manifest()
+    removed = 0
+    for video_id, entry in manifest.tracks_in_folder(output_dir).items():
+        if video_id in current_ids:
+            continue
+        try:
+            entry['path'].unlink()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"[{playlist_name}] Erreur suppression {entry['path']}: {e}")
+            continue
+        manifest.forget(video_id, output_dir)
+        removed += 1
+    return removed
 
-    def mp3_postprocessor_hook(d):
-        """Hook appelé après la conversion MP3"""
-        if d['status'] == 'finished':
-            final_mp3['filename'] = d.get('info_dict', {}).get('filepath') or d.get('filepath')
+def _report_track_done(playlist):
+    """Callback du Future réseau : compte le titre dans le tableau une fois le fichier final prêt"""
+    def on_fetched(future):
+        if future.exception():
+            progress_board.track_done(playlist, False)
+            return
+        future.result().add_done_callback(
+            lambda converted: progress_board.track_done(playlist, not converted.exception() and converted.result()))
+    return on_fetched
 
-    def progress_final_hook(d):
-        """Hook pour capturer le fichier final téléchargé"""
-        if d['status'] == 'finished':
-            if not final_mp3['filename']:
-                final_mp3['filename'] = d.get('filename')
+def _final_result(outer, playlist_name=None):
+    """Future réseau (-> Future de conversion) -> un seul Future(bool) résolu à la fin du titre"""
+    done = Future()
+    def on_converted(converted):
+        if converted.exception():
+            logger.error(f"[{playlist_name}] Exception: {converted.exception()}")
+            done.set_result(False)
+        else:
+            done.set_result(bool(converted.result()))
+    def on_fetched(future):
+        if future.exception():
+            logger.error(f"[{playlist_name}] Exception: {future.exception()}")
+            done.set_result(False)
+            return
+        future.result().add_done_callback(on_converted)
+    outer.add_done_callback(on_fetched)
+    return done
 
-    ydl_opts = get_ultra_ydl_opts(output_dir)
-    ydl_opts = dict(ydl_opts)  # Copie défensive
-    ydl_opts['postprocessor_hooks'] = [mp3_postprocessor_hook]
-    # Garder le progress_hook d'origine + ajouter progress_final_hook
-    ydl_opts['progress_hooks'] = [progress_hook, progress_final_hook]
+class SubmissionWindow:
+    """Titres soumis et pas encore finis (fichier final prêt ou échec), en nombre borné
 
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+    Une playlist de 10 000 titres ne crée pas 10 000 Futures d'un coup : au-delà de
+    `size` titres en vol, add() attend qu'un titre se termine avant de rendre la main
+    (la pagination de la playlist attend avec lui). La mémoire reste la même quelle
+    que soit la taille de la playlist.
+    """
+    def __init__(self, size, on_done):
+        self.size = max(1, size)
+        self.on_done = on_done  # on_done(label, ok), appelé dans le thread qui soumet
+        self.submitted = 0
+        self.waited = 0.0  # Secondes passées à attendre de la place
+        self._in_flight = {}
 
-        mp3_file_path = None
-        if final_mp3['filename']:
-            mp3_file_path = Path(final_mp3['filename'])
-        else:
-            # Fallback : essayer de retrouver le fichier par titre si le hook n'a pas marché
-            for mp3_file in output_path.glob("*.mp3"):
-                if clean_filename(title).lower() in mp3_file.stem.lower():
-                    mp3_file_path = mp3_file
-                    break
+    def add(self, future, label):
+        """future : Future réseau renvoyé par scheduler.submit(submit_single_video, ...)"""
+        self._in_flight[_final_result(future, label[0])] = label
+        self.submitted += 1
+        if len(self._in_flight) >= self.size:
+            start = time.perf_counter()
+            while len(self._in_flight) >= self.size:
+                self._collect()
+            self.waited += time.perf_counter() - start
 
-        if mp3_file_path and mp3_file_path.exists():
-            # MP3 validé
-            file_size = mp3_file_path.stat().st_size / (1024 * 1024)
-            with print_lock:
-                print(f"✅ MP3 validé: {mp3_file_path.name[:50]} ({file_size:.1f} MB)")
+    def drain(self):
+        """Attend tous les titres encore en vol"""
+        while self._in_flight:
+            self._collect()
 
-            try:
-                cleanup_temp_files(output_path, mp3_file_path.name)
-            except:
-                pass
-            global_stats.add_video_success()
-            return True
-        else:
-            global_stats.add_video_failure()
-            with print_lock:
-                print(f"❌ Échec validation MP3: {title[:50]}")
-            logger.error(f"[{playlist_name}] MP3 non trouvé: {title}")
-            return False
+    def _collect(self):
+        finished, _ = wait_futures(self._in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            self.on_done(self._in_flight.pop(future), future.result())
 
-    except Exception as e:
-        global_stats.add_video_failure()
-        error_str = str(e).lower()
-        if "music premium members" in error_str or "premium members" in error_str:
-            logger.error(f"[{playlist_name}] PREMIUM REQUIS: {title}")
-        elif "private" in error_str or "unavailable" in error_str:
-            logger.error(f"[{playlist_name}] INDISPONIBLE: {title}")
-        else:
-            logger.error(f"[{playlist_name}] ERREUR: {title} - {str(e)}")
-        return False
+def download_playlist_ultra_fast(playlist_url, video_threads=8, sync=False, prune=False, scheduler=None,
+                                 output_policy=None):
+    """Télécharge une playlist avec multithreading optimisé
 
-def extract_playlist_info_fast(playlist_url):
-    """Extraction rapide des informations de playlist"""
-    ydl_opts = {
-        'quiet': True,
-        'extract_flat': True,
-        'dump_single_json': False,
-        'socket_timeout': 30,
-    }
-    
+    En mode synchro, la playlist garde toujours le même dossier et seuls les
+    nouveaux titres sont téléchargés (prune=True supprime aussi les titres retirés).
+
+    Les titres passent par `scheduler` (file globale partagée entre playlists) ;
+    sans scheduler, la playlist a sa propre file de `video_threads` threads.
+    Si la playlist n'est pas en cache, ses titres sont envoyés en téléchargement
+    au fil de la pagination, sans attendre la fin de l'extraction.
+    """
+    cached = playlist_cache.get(playlist_url)
+    owns_extraction = False
+    if not cached:
+        owns_extraction = playlist_cache.claim(playlist_url)
+        if not owns_extraction:
+            # Préchargement en cours (moteur de métadonnées) : on attend son résultat plutôt que de repaginer
+            cached = playlist_cache.wait(playlist_url)
+    # Sa copie en mémoire n'a plus d'usage, et un préchargement en retard ne la repaginera pas
+    playlist_cache.take(playlist_url)
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(playlist_url, download=False)
-        
-        playlist_title = info.get('title', f'Playlist_{int(time.time())}')
-        # Nettoyer le nom du dossier
-        playlist_title = "".join(c for c in playlist_title if c.isalnum() or c in (' ', '-', '_')).strip()
-        
-        entries = [entry for entry in info.get('entries', []) if entry and entry.get('id')]
-        
-        return playlist_title, entries
-        
-    except Exception as e:
-        logger.error(f"Erreur extraction playlist {playlist_url}: {str(e)}")
-        return None, []
+        return _download_playlist(playlist_url, cached, video_threads, sync, prune, scheduler, output_policy)
+    finally:
+        if owns_extraction:
+            playlist_cache.abandon(playlist_url)  # Sans effet si l'extraction a été mise en cache
 
-def download_playlist_ultra_fast(playlist_url, video_threads=8):
-    """Télécharge une playlist avec multithreading optimisé"""
-    playlist_name, entries = extract_playlist_info_fast(playlist_url)
+def _download_playlist(playlist_url, cached, video_threads, sync, prune, scheduler, output_policy):
+    if cached:
+        playlist_name, entries, playlist_id = cached
+        entry_stream = iter(entries)
+    else:
+        playlist_name, playlist_id, entry_stream = stream_playlist_info(playlist_url)
     
-    if not entries:
+    if playlist_name is None or (cached and not cached[1]):
         safe_print(f"❌ Aucune vidéo trouvée: {playlist_url}")
         return False
     
     # Création du dossier downloads s'il n'existe pas
-    downloads_path = Path("downloads")
+    downloads_path = LIBRARY_DIR
     downloads_path.mkdir(exist_ok=True)
+    manifest = get_manifest()
     
-    # Création du dossier playlist avec gestion des conflits
-    output_dir = downloads_path / playlist_name
-    counter = 1
-    while output_dir.exists() and any(output_dir.iterdir()):
-        output_dir = downloads_path / f"{playlist_name}_{counter}"
-        counter += 1
+    if sync:
+        output_dir = resolve_sync_folder(playlist_id, playlist_name)
+    else:
+        # Création du dossier playlist avec gestion des conflits
+        output_dir = downloads_path / playlist_name
+        counter = 1
+        # Un dossier dont des titres étaient en cours au dernier run est repris, pas dupliqué
+        while (output_dir.exists() and any(output_dir.iterdir())
+               and not manifest.has_pending_jobs(output_dir)):
+            output_dir = downloads_path / f"{playlist_name}_{counter}"
+            counter += 1
     
+    output_dir_existed = output_dir.exists()
     output_dir.mkdir(exist_ok=True)
+
+    if sync:
+        manifest.set_playlist_folder(playlist_id, output_dir, playlist_name)
     
-    global_stats.add_playlist(len(entries))
-    safe_print(f"🎵 [{playlist_name}] Démarrage: {len(entries)} titres, {video_threads} threads")
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = FairScheduler(video_threads)
+    queue_key = output_dir.name
+    scheduler.register(queue_key)
+
+    # Le total de vidéos est incrémenté au fil de l'extraction
+    global_stats.add_playlist(0)
+    if cached:
+        safe_print(f"🎵 [{playlist_name}] Démarrage: {len(entries)} titres, {scheduler.max_workers} threads"
+                   f"{' partagés' if not own_scheduler else ''}")
+    else:
+        safe_print(f"🎵 [{playlist_name}] Démarrage pendant l'extraction, {scheduler.max_workers} threads"
+                   f"{' partagés' if not own_scheduler else ''}")
 
     success_count = 0
-    completed_count = 0
+    def on_track_done(label, ok):
+        nonlocal success_count
+        if ok:
+            success_count += 1
+        else:
+            global_stats.add_failed_video(*label)  # Stats finales
 
-    # Téléchargement parallèle - seulement barres individuelles
-    with ThreadPoolExecutor(max_workers=video_threads) as executor:
-        futures = {}
-        for video_info in entries:
-            future = executor.submit(download_single_video, video_info, output_dir, playlist_name)
-            futures[future] = video_info.get('title', 'Unknown')[:50]
+    # Étage réseau via la file globale - la conversion MP3 se fait dans le pool de transcodage partagé.
+    # Fenêtre bornée : jamais plus de titres en vol que ce que les threads peuvent traiter sous peu
+    window = SubmissionWindow(max(SUBMIT_WINDOW, scheduler.max_workers * 2), on_track_done)
+    # Rien n'est gardé par titre sauf si un usage le demande : cache disque des playlists (jusqu'à
+    # PLAYLIST_CACHE_MAX_ENTRIES titres), nettoyage de la synchro
+    kept_entries = [] if not cached and playlist_cache.ttl > 0 else None
+    current_ids = set() if sync and prune else None
+    entry_count = 0
+    already_done = 0
+    extraction_ok = True
+    try:
+        extract_start = time.perf_counter()
+        try:
+            for video_info in entry_stream:
+                entry_count += 1
+                if kept_entries is not None:
+                    kept_entries.append(video_info)
+                    if len(kept_entries) > PLAYLIST_CACHE_MAX_ENTRIES:
+                        kept_entries = None  # Trop longue pour le cache : plus rien n'est gardé
+                if current_ids is not None:
+                    current_ids.add(video_info.id)
+                # Diff au fil de l'eau avec ce qui est déjà sur le disque, avant toute écriture dans le journal
+                if manifest.is_complete(video_info.id, output_dir):
+                    already_done += 1
+                    if not sync:
+                        # Dossier repris : le titre compte comme réussi, comme avant le crash
+                        global_stats.add_videos(1)
+                        global_stats.add_video_success()
+                        progress_board.add_tracks(queue_key, 1)
+                        progress_board.track_done(queue_key, True)
+                        success_count += 1
+                    continue
+                global_stats.add_videos(1)
+                progress_board.add_tracks(queue_key, 1)
+                manifest.queue_job(video_info.id, output_dir, video_info.title, playlist_name)
+                future = scheduler.submit(queue_key, submit_single_video, video_info, output_dir, playlist_name,
+                                          output_policy)
+                future.add_done_callback(_report_track_done(queue_key))
+                window.add(future, (playlist_name, (video_info.title or 'Unknown')[:50]))
+        except Exception as e:
+            extraction_ok = False
+            logger.error(f"Erreur extraction playlist {playlist_url}: {str(e)}")
+            safe_print(f"⚠️  [{playlist_name}] Extraction interrompue après {entry_count} titres")
 
-        # Collecter les résultats silencieusement
-        failed_videos = []
-        for future in as_completed(futures):
-            video_title = futures[future]
-            try:
-                if future.result():
-                    success_count += 1
-                else:
-                    failed_videos.append(video_title)
-            except Exception as e:
-                failed_videos.append(video_title)
-                logger.error(f"[{playlist_name}] Exception: {str(e)}")
+        if not cached:
+            # Temps d'attente de la fenêtre exclu : seulement la pagination
+            run_metrics.observe('playlist_extract', time.perf_counter() - extract_start - window.waited)
+            if extraction_ok and kept_entries:
+                playlist_cache.put(playlist_url, (playlist_name, kept_entries, playlist_id), memory=False)
+            safe_print(f"📜 [{playlist_name}] Extraction terminée: {entry_count} titres")
+        if sync:
+            safe_print(f"🔄 [{playlist_name}] Synchro: {already_done} déjà présents, {window.submitted} nouveaux")
+            # Nettoyage seulement avec la liste complète, sinon on supprimerait des titres encore en ligne
+            if prune and extraction_ok and current_ids:
+                removed = prune_removed_tracks(output_dir, current_ids, playlist_name)
+                if removed:
+                    safe_print(f"🧹 [{playlist_name}] {removed} titres retirés de la playlist supprimés")
 
-    print()  # Saut de ligne après les téléchargements
+        window.drain()
+    finally:
+        if own_scheduler:
+            scheduler.shutdown()
 
-    # Vérifier RÉELLEMENT les MP3 dans le dossier
-    actual_mp3_files = list(output_dir.glob("*.mp3"))
-    actual_mp3_count = len(actual_mp3_files)
+    if not entry_count:
+        safe_print(f"❌ Aucune vidéo trouvée: {playlist_url}")
+        if not output_dir_existed:
+            try:
+                output_dir.rmdir()
+            except OSError:
+                pass
+        return False
 
     global_stats.complete_playlist()
+    return True
 
-    # Sauvegarder les infos pour les stats finales
-    global_stats.add_failed_videos(playlist_name, failed_videos)
+def retry_failed_tracks(scheduler, output_policy=None, since=None, include_permanent=False, rounds=RETRY_ROUNDS):
+    """File différée : relance les titres en échec du journal, sans réextraire leurs playlists
 
-    return True
+    Fin de run (since = début du run) : les échecs temporaires du run sont retentés
+    après un délai qui double à chaque tour. Mode "retenter les échecs" (since=None) :
+    tous les échecs enregistrés, premier tour immédiat ; include_permanent retente
+    aussi les titres Premium/privés (ex: après avoir ajouté cookies.txt).
+    Retourne le nombre de titres récupérés.
+    """
+    manifest = get_manifest()
+    recovered = 0
+    def on_track_done(label, ok):
+        nonlocal recovered
+        if ok:
+            recovered += 1
+        else:
+            global_stats.add_failed_video(*label)
+    counted = since is not None  # Échecs déjà comptés dans les stats de ce run
+    for attempt in range(rounds):
+        jobs = manifest.failed_jobs(since, include_permanent and attempt == 0)
+        if not jobs:
+            break
+        if counted:
+            # Délai croissant avec un peu d'aléa : les titres ne repartent pas tous à la même seconde
+            delay = RETRY_BACKOFF * 2 ** attempt * random.uniform(0.8, 1.2)
+            safe_print(f"\033[93m⏳ {len(jobs)} échecs temporaires, nouvel essai {attempt + 1}/{rounds} "
+                       f"dans {delay:.0f}s\033[0m")
+            time.sleep(delay)
+        else:
+            safe_print(f"\033[93m🔁 {len(jobs)} titres en échec à retenter\033[0m")
+
+        since = time.time()
+        window = SubmissionWindow(max(SUBMIT_WINDOW, scheduler.max_workers * 2), on_track_done)
+        for job in jobs:
+            title = (job['title'] or 'Unknown')[:50]
+            if counted:
+                global_stats.reopen_failure(job['playlist'], title, counted=True)  # Noté par la fenêtre du run
+            else:
+                global_stats.add_videos(1)
+            queue_key = job['folder'].name
+            job['folder'].mkdir(parents=True, exist_ok=True)
+            scheduler.register(queue_key)
+            progress_board.add_tracks(queue_key, 1)
+            video_info = PlaylistEntry(job['video_id'], job['title'])
+            future = scheduler.submit(queue_key, submit_single_video, video_info, job['folder'],
+                                      job['playlist'], output_policy)
+            future.add_done_callback(_report_track_done(queue_key))
+            window.add(future, (job['playlist'], title))
+        window.drain()
+        counted = True
+
+    if recovered:
+        safe_print(f"\033[92m♻️  {recovered} titres récupérés au nouvel essai\033[0m")
+    return recovered
 
-def download_all_playlists_parallel(playlist_urls, playlist_threads=3, video_threads_per_playlist=6):
-    """Télécharge toutes les playlists en parallèle"""
+def download_all_playlists_parallel(playlist_urls, playlist_threads=3, video_threads_per_playlist=6,
+                                   sync=False, prune=False, adaptive=True, output_policy=None, progress='auto',
+                                   profile=False, retry_rounds=RETRY_ROUNDS, retry_failed=False,
+                                   include_permanent=False):
+    """Télécharge toutes les playlists en parallèle (progress : 'auto', 'live', 'plain' ou 'off')
+
+    Les URLs de chaînes/artistes sont développées en playlists. Retourne le nombre de
+    playlists échouées.
+
+    profile=True : échantillonne les piles de tous les threads et les attentes sur les
+    verrous pendant le run, rapport + .folded (flamegraph) écrits à côté du log de session.
+    En fin de run, les échecs temporaires sont retentés retry_rounds fois (0 = jamais).
+    retry_failed=True : retente d'abord, sans attendre, les échecs enregistrés par les runs précédents
+    (playlist_urls peut alors être vide).
+    """
     with print_lock:
         print(f"\033[92m🚀 DÉMARRAGE ULTRA-OPTIMISÉ\033[0m")
         print(f"\033[94m📊 {len(playlist_urls)} playlists, {playlist_threads} playlists simultanées\033[0m")
-        print(f"\033[95m⚙️  {video_threads_per_playlist} threads vidéo par playlist\033[0m")
+        print(f"\033[95m⚙️  {video_threads_per_playlist} threads vidéo par playlist "
+              f"→ {playlist_threads * video_threads_per_playlist} threads partagés (file globale équitable)\033[0m")
+        if sync:
+            print(f"\033[96m🔄 Mode synchro{' + nettoyage des titres retirés' if prune else ''}\033[0m")
+        if retry_failed:
+            print(f"\033[96m🔁 Échecs des runs précédents retentés"
+                  f"{' (Premium/privés compris)' if include_permanent else ''}\033[0m")
+        print(f"\033[96m🎧 Sortie: {output_policy or DEFAULT_OUTPUT_POLICY}\033[0m")
+        if network_budget.limited:
+            print(f"\033[96m🔌 Budget réseau: {network_budget.describe()}\033[0m")
     
     global_stats.start_time = time.time()
-    
-    # Téléchargement parallèle des playlists
-    with ThreadPoolExecutor(max_workers=playlist_threads) as executor:
-        futures = []
-        for i, playlist_url in enumerate(playlist_urls):
-            future = executor.submit(download_playlist_ultra_fast, playlist_url, video_threads_per_playlist)
-            futures.append((future, playlist_url, i+1))
+    try:
+        interrupted = resume_interrupted_jobs()
+        if interrupted:
+            safe_print(f"\033[93m♻️  {interrupted} titres interrompus au dernier run, reprise\033[0m")
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Lecture du journal impossible: {e}")
+    # Une seule file de téléchargement pour toutes les playlists : la capacité totale
+    # est plafonnée, et les threads libres vont aux playlists qui ont encore du travail
+    scheduler = FairScheduler(playlist_threads * video_threads_per_playlist)
+    profiler = None
+    if profile:
+        profiler = SamplingProfiler()
+        profiler.start([(scheduler._cond, 'scheduler')])
+    if adaptive:
+        # Ajuste à chaud threads actifs et fragments parallèles selon le throttling observé
+        adaptive_controller.start(scheduler)
+    progress_board.start(progress)
+    run_metrics.start()
+
+    failed_playlists = 0
+    try:
+        if retry_failed:
+            # Seulement les titres du journal : aucune playlist réextraite
+            retry_failed_tracks(scheduler, output_policy, None, include_permanent, rounds=1)
+
+        # Préparation parallèle des playlists (extraction, dossier) - le téléchargement passe par la file globale
+        # Les métadonnées des playlists suivantes (et des chaînes) sont extraites en masse en arrière-plan
+        with ThreadPoolExecutor(max_workers=playlist_threads) as executor:
+            futures = []
+            for i, playlist_url in enumerate(MetadataEngine().stream(playlist_urls, skip=playlist_threads)):
+                future = executor.submit(download_playlist_ultra_fast, playlist_url, video_threads_per_playlist,
+                                         sync, prune, scheduler, output_policy)
+                futures.append((future, playlist_url, i+1))
         
-        # Traiter les résultats
-        for future, playlist_url, playlist_num in futures:
-            try:
-                result = future.result()
-                if result:
-                    with print_lock:
-                        print(f"\033[92m🎉 Playlist {playlist_num}/{len(playlist_urls)} terminée avec succès\033[0m")
-                else:
+            # Traiter les résultats
+            for future, playlist_url, playlist_num in futures:
+                try:
+                    result = future.result()
+                    if result:
+                        with print_lock:
+                            print(f"\033[92m🎉 Playlist {playlist_num}/{len(futures)} terminée avec succès\033[0m")
+                    else:
+                        failed_playlists += 1
+                        with print_lock:
+                            print(f"\033[91m❌ Playlist {playlist_num}/{len(futures)} échouée\033[0m")
+                except Exception as e:
+                    failed_playlists += 1
                     with print_lock:
-                        print(f"\033[91m❌ Playlist {playlist_num}/{len(playlist_urls)} échouée\033[0m")
-            except Exception as e:
-                with print_lock:
-                    print(f"\033[91m❌ Erreur critique playlist {playlist_num}: {str(e)}\033[0m")
-                logger.error(f"Erreur critique playlist {playlist_url}: {str(e)}")
+                        print(f"\033[91m❌ Erreur critique playlist {playlist_num}: {str(e)}\033[0m")
+                    logger.error(f"Erreur critique playlist {playlist_url}: {str(e)}")
+
+        # File différée : les échecs temporaires repassent une fois toutes les playlists terminées
+        if retry_rounds:
+            retry_failed_tracks(scheduler, output_policy, global_stats.start_time, rounds=retry_rounds)
+    finally:
+        # Ctrl+C compris : plus de tableau redessiné par-dessus les stats finales
+        progress_board.stop()
+        metrics_path = run_metrics.stop()
+        if metrics_path:
+            safe_print(f"\033[96m📈 Métriques: {metrics_path} + {METRICS_DIR / PROMETHEUS_FILENAME}\033[0m")
+        if profiler:
+            try:
+                safe_print(f"\033[96m🔬 Profil: {profiler.stop(profile_base_path())}\033[0m")
+            except OSError as e:
+                logger.error(f"Écriture du profil impossible: {e}")
+    if adaptive:
+        adaptive_controller.stop()
+    scheduler.shutdown()
+    return failed_playlists
 
 def print_final_stats():
     """Affiche les statistiques finales avec musiques manquantes"""
@@ -592,19 +3609,39 @@ def print_final_stats():
     safe_print(f"\033[92m🎵 Vidéos: {videos_done}/{videos_total} réussies\033[0m")
     safe_print(f"\033[91m❌ Échecs: {videos_failed}\033[0m")
     safe_print(f"\033[94m⏱️  Temps total: {elapsed:.1f}s\033[0m")
-    safe_print(f"\033[95m🚀 Vitesse: {videos_done/elapsed:.2f} vidéos/seconde\033[0m")
-    safe_print(f"\033[92m💪 Efficacité: {(videos_done/videos_total)*100:.1f}%\033[0m")
+    safe_print(f"\033[95m🚀 Vitesse: {videos_done/max(elapsed, 0.001):.2f} vidéos/seconde\033[0m")
+    if videos_total:
+        safe_print(f"\033[92m💪 Efficacité: {(videos_done/videos_total)*100:.1f}%\033[0m")
+
+    # Où est passé le temps : moyenne / max par étape
+    report = run_metrics.snapshot()
+    timed_stages = [(stage, timer) for stage, timer in report['stages'].items() if timer['count']]
+    if timed_stages:
+        safe_print(f"\033[96m⏱️  Étapes (moyenne / max, nombre):\033[0m")
+        for stage, timer in timed_stages:
+            safe_print(f"   {stage:<17} {timer['avg_seconds']:8.2f}s / {timer['max_seconds']:8.2f}s  ×{timer['count']}")
+        counters = report['counters']
+        safe_print(f"\033[96m📦 {counters['bytes_downloaded'] / (1024 * 1024):.1f} MB téléchargés, "
+                   f"{counters['retries_http']} retries HTTP, {counters['retries_fragment']} retries fragments\033[0m")
+        network = report['network']
+        if network_budget.limited:
+            safe_print(f"\033[96m🔌 Pic: {network['peak_connections']}/{network['max_connections'] or '∞'} connexions, "
+                       f"{network['connection_waits']} attentes de connexion, "
+                       f"{network['rate_wait_seconds']:.1f}s de freinage pour la limite de débit\033[0m")
 
     # Afficher les musiques manquantes par playlist
-    if global_stats.failed_videos_by_playlist:
+    if any(global_stats.failed_videos_by_playlist.values()):
         safe_print(f"\n\033[91m📋 Musiques manquantes:\033[0m")
         for playlist_name, failed_videos in global_stats.failed_videos_by_playlist.items():
             if failed_videos:
                 safe_print(f"\033[93m[{playlist_name}]\033[0m")
-                for i, failed_title in enumerate(failed_videos, 1):
+                for i, failed_title in enumerate(failed_videos.titles, 1):
                     safe_print(f"\033[91m  {i}. {failed_title}\033[0m")
+                if failed_videos.more:
+                    safe_print(f"\033[91m  … et {failed_videos.more} autres\033[0m")
                 safe_print("")
-        safe_print(f"\033[96m💡 Détails des erreurs dans: logs/{log_filename}\033[0m")
+        if log_filename:
+            safe_print(f"\033[96m💡 Détails des erreurs dans: {log_filename}\033[0m")
 
     safe_print(f"\033[95m{'='*60}\033[0m")
 
@@ -612,24 +3649,30 @@ def verify_playlists(playlist_urls):
     """Vérifie et affiche les informations des playlists avant téléchargement"""
     print(f"\n\033[95m🔍 === VÉRIFICATION DES PLAYLISTS ===\033[0m")
     
-    playlist_infos = []
-    for i, url in enumerate(playlist_urls, 1):
-        print(f"\033[93m📋 [{i}/{len(playlist_urls)}] Vérification en cours...\033[0m")
-        
-        try:
-            playlist_name, entries = extract_playlist_info_fast(url)
-            if playlist_name and entries:
-                playlist_infos.append({
-                    'url': url,
-                    'name': playlist_name,
-                    'count': len(entries)
-                })
-                print(f"\033[92m✅ {playlist_name} ({len(entries)} vidéos)\033[0m")
+    print(f"\033[93m📋 Vérification de {len(playlist_urls)} URLs en parallèle...\033[0m")
+    
+    # Extraction simultanée (chaînes développées) ; le résultat est mis en cache et réutilisé par le téléchargement
+    checked = []
+    def on_result(url, result):
+        playlist_name, _, _, count = result
+        with print_lock:
+            checked.append(url)
+            if playlist_name and count:
+                print(f"\033[92m✅ [{len(checked)}] {playlist_name} ({count} vidéos)\033[0m")
             else:
-                print(f"\033[91m❌ Playlist invalide ou vide: {url[:50]}...\033[0m")
-                
-        except Exception as e:
-            print(f"\033[91m❌ Erreur lors de la vérification: {str(e)[:50]}...\033[0m")
+                print(f"\033[91m❌ [{len(checked)}] Playlist invalide ou vide: {url[:50]}...\033[0m")
+
+    results = {}
+    for i, (url, result) in enumerate(MetadataEngine().resolve(playlist_urls, on_result)):
+        if result:
+            results[i] = {
+                'url': url,
+                'name': result[0],
+                'count': result[3]
+            }
+    
+    # Garder l'ordre saisi par l'utilisateur
+    playlist_infos = [results[i] for i in sorted(results)]
     
     if not playlist_infos:
         print("\033[91m❌ Aucune playlist valide trouvée.\033[0m")
@@ -659,6 +3702,15 @@ def cleanup_old_logs():
         if not logs_path.exists():
             return
             
+        # Les rapports de métriques et de profilage suivent les logs : même rotation
+        for pattern in ("ultra_metrics_*.json", "ultra_profile_*.txt", "ultra_profile_*.folded"):
+            metric_files = sorted(logs_path.glob(pattern), key=lambda f: f.stat().st_mtime, reverse=True)
+            for metric_file in metric_files[5:]:
+                try:
+                    metric_file.unlink()
+                except Exception:
+                    pass
+
         # Récupérer tous les logs ultra_download avec le nouveau format
         log_files = list(logs_path.glob("ultra_download_*.log"))
         
@@ -688,6 +3740,7 @@ def cleanup_old_logs():
 
 def main():
     """Fonction principale ultra-optimisée"""
+    setup_logging()
     # Écran de démarrage ULTRA STYLÉ
     print("\033[95m" + "=" * 80)
     print("██╗   ██╗██╗  ████████╗██████╗  █████╗     ██████╗  ██████╗ ██╗    ██╗███╗   ██╗██╗      ██████╗  █████╗ ██████╗ ███████╗██████╗ ")
@@ -739,32 +3792,47 @@ def main():
         #logger.info("ℹ️  Aucun fichier cookies.txt trouvé - Mode public uniquement")
     print()
     
+    # Échecs des runs précédents : on peut ne retenter qu'eux, sans réextraire les playlists
+    try:
+        failed_count = len(get_manifest().failed_jobs())
+    except sqlite3.Error:
+        failed_count = 0
+    if failed_count:
+        print(f"\033[93m🔁 {failed_count} titres en échec temporaire aux runs précédents - tapez R pour ne retenter qu'eux\033[0m")
+
     # Saisie des URLs
     print("\033[93m📝 Collez vos URLs de playlists YouTube Music (séparées par des virgules):\033[0m")
     raw_input = input("\033[95m🔗 URLs: \033[0m").strip()
+    retry_only = failed_count > 0 and raw_input.lower() in ('r', 'retry')
     
-    if not raw_input:
-        print("\033[91m❌ Aucune URL fournie.\033[0m")
-        return
+    if retry_only:
+        validated_urls = []
+    else:
+        if not raw_input:
+            print("\033[91m❌ Aucune URL fournie.\033[0m")
+            return
     
-    playlist_urls = [url.strip() for url in raw_input.split(',') if url.strip()]
+        playlist_urls = [url.strip() for url in raw_input.split(',') if url.strip()]
     
-    if not playlist_urls:
-        print("\033[91m❌ Aucune URL valide.\033[0m")
-        return
+        if not playlist_urls:
+            print("\033[91m❌ Aucune URL valide.\033[0m")
+            return
     
-    # Vérification des playlists avec confirmation
-    should_continue, validated_urls = verify_playlists(playlist_urls)
+        # Vérification des playlists avec confirmation
+        should_continue, validated_urls = verify_playlists(playlist_urls)
     
-    if not should_continue:
-        print("\033[93m⏹️  Téléchargement annulé.\033[0m")
-        return
+        if not should_continue:
+            print("\033[93m⏹️  Téléchargement annulé.\033[0m")
+            return
     
-    if not validated_urls:
-        print("\033[91m❌ Aucune playlist valide à télécharger.\033[0m")
-        return
+        if not validated_urls:
+            print("\033[91m❌ Aucune playlist valide à télécharger.\033[0m")
+            return
     
-    print(f"\n\033[92m📊 {len(validated_urls)} playlists validées\033[0m")
+    if retry_only:
+        print(f"\n\033[92m🔁 {failed_count} titres en échec à retenter\033[0m")
+    else:
+        print(f"\n\033[92m📊 {len(validated_urls)} playlists validées\033[0m")
     
     # Configuration avancée
     try:
@@ -779,16 +3847,39 @@ def main():
     except ValueError:
         video_threads = 6
     
+    # Mode synchro : même dossier à chaque fois, seuls les nouveaux titres sont téléchargés
+    sync = not retry_only and input("\033[95m🔄 Mode synchro (réutiliser le dossier existant) ? (O/N): \033[0m").strip().lower() in ['o', 'oui', 'y', 'yes']
+    prune = False
+    if sync:
+        prune = input("\033[95m🧹 Supprimer les titres retirés des playlists ? (O/N): \033[0m").strip().lower() in ['o', 'oui', 'y', 'yes']
+    
+    # Format de sortie : le réencodage MP3 est l'étape la plus coûteuse en CPU
+    output_choice = input("\033[95m🎧 Format de sortie - mp3 / natif (m4a/opus sans réencodage) / auto [mp3]: \033[0m").strip().lower()
+    output_mode = {'natif': 'native', 'native': 'native', 'auto': 'auto'}.get(output_choice, 'mp3')
+    # Flux direct : pas de fichier intermédiaire, deux fois moins d'écritures disque par titre
+    pipe = input("\033[95m🚰 Flux direct vers ffmpeg (sans fichier intermédiaire) ? (O/N): \033[0m").strip().lower() in ['o', 'oui', 'y', 'yes']
+    output_policy = OutputPolicy(output_mode, pipe=pipe)
+    
     print(f"\n\033[93m🎯 Configuration finale:\033[0m")
-    print(f"\033[94m   - {len(validated_urls)} playlists\033[0m")
+    if retry_only:
+        print(f"\033[94m   - {failed_count} titres en échec, sans réextraction des playlists\033[0m")
+    else:
+        print(f"\033[94m   - {len(validated_urls)} playlists\033[0m")
     print(f"\033[94m   - {playlist_threads} playlists simultanées\033[0m")
     print(f"\033[94m   - {video_threads} threads vidéo par playlist\033[0m")
     print(f"\033[92m   - Capacité théorique: {playlist_threads * video_threads} téléchargements simultanés\033[0m")
+    if sync:
+        print(f"\033[94m   - Mode synchro{' avec nettoyage' if prune else ''}\033[0m")
+    print(f"\033[94m   - Sortie: {output_policy}\033[0m")
     
     input("\033[95m⏯️  Appuyez sur Entrée pour lancer l'ultra-téléchargement...\033[0m")
     
     try:
-        download_all_playlists_parallel(validated_urls, playlist_threads, video_threads)
+        # ULTRA_PROFILE=1 : profilage du run sans toucher au script
+        download_all_playlists_parallel(validated_urls, playlist_threads, video_threads, sync, prune,
+                                        output_policy=output_policy,
+                                        profile=os.environ.get('ULTRA_PROFILE') == '1',
+                                        retry_failed=retry_only)
         print_final_stats()
         
     except KeyboardInterrupt:
@@ -799,5 +3890,1071 @@ def main():
         logger.error(f"Erreur critique main: {str(e)}")
         print_final_stats()
 
+# Codes de sortie du mode non-interactif
+EXIT_OK = 0          # Tout a été téléchargé
+EXIT_PARTIAL = 1     # Certains titres ou playlists ont échoué
+EXIT_USAGE = 2       # Arguments / fichier de config invalides (comme argparse)
+EXIT_FAILED = 3      # Aucune playlist n'a pu être traitée
+EXIT_INTERRUPTED = 130
+
+class JobQueue:
+    """File de titres partagée entre plusieurs machines (fichier SQLite sur un stockage commun)
+
+    Un coordinateur y met les titres des playlists ; chaque worker en prend un lot
+    avec un bail (lease) qu'il prolonge tant qu'il travaille. Un bail expiré (worker
+    planté, machine coupée) est remis en file par le coordinateur. Journal SQLite
+    classique (pas de WAL) : le WAL ne fonctionne pas sur un partage réseau.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue_jobs (
+                    video_id TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    title TEXT,
+                    playlist TEXT,
+                    playlist_id TEXT,
+                    state TEXT NOT NULL,
+                    worker TEXT,
+                    claim_token TEXT,
+                    lease_until REAL,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    failure_class TEXT,
+                    result_path TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, folder)
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS queue_jobs_state ON queue_jobs (state, available_at)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def folder_for(self, playlist_id, playlist_name):
+        """Dossier d'une playlist : le même à chaque passage du coordinateur, jamais partagé avec une autre"""
+        with self._lock:
+            row = self._conn.execute("SELECT folder FROM queue_jobs WHERE playlist_id = ? LIMIT 1",
+                                     (playlist_id,)).fetchone()
+            if row:
+                return row[0]
+            folder, counter = playlist_name, 1
+            while self._conn.execute("SELECT 1 FROM queue_jobs WHERE folder = ? AND playlist_id != ? LIMIT 1",
+                                     (folder, playlist_id)).fetchone():
+                folder = f"{playlist_name}_{counter}"
+                counter += 1
+            return folder
+
+    def enqueue(self, entries, folder, playlist_name, playlist_id):
+        """Ajoute les titres d'une playlist ; les titres finis restent finis, les échecs repartent"""
+        now = time.time()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT INTO queue_jobs (video_id, folder, title, playlist, playlist_id, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?) "
+                "ON CONFLICT (video_id, folder) DO UPDATE SET state = 'queued', attempts = 0, error = NULL, "
+                "failure_class = NULL, available_at = 0, updated_at = excluded.updated_at WHERE state = 'failed'",
+                ((entry.id, folder, entry.title, playlist_name, playlist_id, now) for entry in entries))
+            return self._conn.total_changes - before
+
+    def claim(self, worker, count, lease=None):
+        """Prend jusqu'à `count` titres disponibles ; une seule requête UPDATE, donc atomique entre machines"""
+        lease = QUEUE_LEASE if lease is None else lease
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE queue_jobs SET state = 'leased', worker = ?, claim_token = ?, lease_until = ?, updated_at = ? "
+                "WHERE rowid IN (SELECT rowid FROM queue_jobs WHERE state = 'queued' AND available_at <= ? "
+                "ORDER BY available_at, rowid LIMIT ?)",
+                (worker, token, now + lease, now, now, count))
+            rows = self._conn.execute(
+                "SELECT video_id, folder, title, playlist, attempts FROM queue_jobs WHERE claim_token = ?",
+                (token,)).fetchall()
+        return [{'video_id': video_id, 'folder': folder, 'title': title or 'Unknown',
+                 'playlist': playlist or folder, 'attempts': attempts, 'claim_token': token}
+                for video_id, folder, title, playlist, attempts in rows]
+
+    def heartbeat(self, worker, lease=None):
+        """Prolonge les baux de tous les titres en cours de ce worker"""
+        lease = QUEUE_LEASE if lease is None else lease
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE queue_jobs SET lease_until = ?, updated_at = ? "
+                               "WHERE worker = ? AND state = 'leased'", (now + lease, now, worker))
+
+    def complete(self, job, result_path):
+        """Titre terminé ; retourne False si le bail a été perdu (expiré, titre repris ailleurs ou ici)"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE queue_jobs SET state = 'done', result_path = ?, lease_until = NULL, error = NULL, "
+                "updated_at = ? WHERE video_id = ? AND folder = ? AND claim_token = ? AND state = 'leased'",
+                (result_path, time.time(), job['video_id'], job['folder'], job['claim_token'])).rowcount > 0
+
+    def fail(self, job, error, failure_class, backoff=None):
+        """Échec temporaire : remis en file après un délai croissant (un autre worker, une autre IP
+        pourra le prendre) ; définitif ou trop d'essais : échec.
+
+        Retourne True si remis en file, False si en échec, None si le bail a été perdu.
+        """
+        backoff = RETRY_BACKOFF if backoff is None else backoff
+        attempts = job['attempts'] + 1
+        retry = failure_class != 'permanent' and attempts < QUEUE_MAX_ATTEMPTS
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE queue_jobs SET state = ?, attempts = ?, error = ?, failure_class = ?, lease_until = NULL, "
+                "available_at = ?, updated_at = ? WHERE video_id = ? AND folder = ? AND claim_token = ? "
+                "AND state = 'leased'",
+                ('queued' if retry else 'failed', attempts, error, failure_class,
+                 time.time() + backoff * 2 ** (attempts - 1) if retry else 0, time.time(),
+                 job['video_id'], job['folder'], job['claim_token'])).rowcount
+        return retry if updated else None
+
+    def release(self, worker):
+        """Arrêt propre d'un worker : ses titres en cours repartent tout de suite dans la file"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE queue_jobs SET state = 'queued', worker = NULL, lease_until = NULL, "
+                               "updated_at = ? WHERE worker = ? AND state = 'leased'", (time.time(), worker))
+
+    def requeue_expired(self, backoff=None):
+        """Bail expiré : compte comme un essai raté, comme fail() (un titre qui bloque ou fait
+        planter son worker finit en échec) ; retourne le nombre de titres concernés"""
+        backoff = RETRY_BACKOFF if backoff is None else backoff
+        now = time.time()
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE queue_jobs SET attempts = attempts + 1, worker = NULL, claim_token = NULL, lease_until = NULL, "
+                "state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'queued' END, "
+                "error = 'Bail expiré (worker arrêté ou bloqué)', failure_class = 'transient', "
+                "available_at = CASE WHEN attempts + 1 >= ? THEN 0 ELSE ? + ? * (1 << attempts) END, updated_at = ? "
+                "WHERE state = 'leased' AND lease_until < ?",
+                (QUEUE_MAX_ATTEMPTS, QUEUE_MAX_ATTEMPTS, now, backoff, now, now)).rowcount
+
+    def counts(self):
+        """{état: nombre de titres} pour queued, leased, done, failed"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM queue_jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys(('queued', 'leased', 'done', 'failed'), 0)
+        counts.update(rows)
+        return counts
+
+    def workers(self, since):
+        """Workers actifs depuis `since` : {worker: titres terminés}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT worker, SUM(state = 'done') FROM queue_jobs WHERE worker IS NOT NULL AND updated_at >= ? "
+                "GROUP BY worker", (since,)).fetchall()
+        return dict(rows)
+
+def run_coordinator(playlist_urls, queue_path, wait=True):
+    """Coordinateur : met les titres des playlists (chaînes développées) dans la file partagée,
+    puis surveille les baux jusqu'à ce qu'il ne reste plus rien à faire
+
+    Retourne les compteurs finaux de la file.
+    """
+    queue = JobQueue(queue_path)
+    try:
+        added = 0
+        for playlist_url, result in MetadataEngine().resolve(playlist_urls):
+            if not result:
+                safe_print(f"❌ Aucune vidéo trouvée: {playlist_url}")
+                continue
+            playlist_name, entries, playlist_id, total = result
+            if entries is None:
+                # Trop longue pour être gardée en mémoire : relue en streaming, directement vers la file
+                _, _, entries = stream_playlist_info(playlist_url)
+                if entries is None:
+                    safe_print(f"❌ Aucune vidéo trouvée: {playlist_url}")
+                    continue
+            folder = queue.folder_for(playlist_id, playlist_name)
+            count = queue.enqueue(entries, folder, playlist_name, playlist_id)
+            added += count
+            safe_print(f"📥 [{playlist_name}] {count} titres mis en file ({total} dans la playlist)")
+        counts = queue.counts()
+        safe_print(f"\033[96m🗂️  File {queue_path}: {added} titres ajoutés, {counts['queued']} en attente\033[0m")
+
+        started = time.time()
+        while wait:
+            expired = queue.requeue_expired()
+            if expired:
+                safe_print(f"\033[93m♻️  {expired} baux expirés (remis en file, ou en échec après {QUEUE_MAX_ATTEMPTS} essais)\033[0m")
+            counts = queue.counts()
+            workers = queue.workers(started)
+            safe_print(f"📡 {counts['done']} finis, {counts['leased']} en cours, {counts['queued']} en attente, "
+                       f"{counts['failed']} échecs - {len(workers)} workers")
+            if not counts['queued'] and not counts['leased']:
+                break
+            time.sleep(QUEUE_POLL)
+        return queue.counts()
+    finally:
+        queue.close()
+
+def run_worker(queue_path, threads=6, output_policy=None, adaptive=True, progress='auto', wait=False):
+    """Worker : prend des titres dans la file partagée, les télécharge dans la bibliothèque locale
+    et rend compte du résultat ; prolonge ses baux tant qu'il travaille
+
+    Sans wait, s'arrête quand la file est vide (plus rien en attente ni en cours ailleurs).
+    """
+    queue = JobQueue(queue_path)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    manifest = get_manifest()
+    safe_print(f"\033[92m🛰️  Worker {worker} : {threads} threads, file {queue_path}\033[0m")
+    if network_budget.limited:
+        safe_print(f"\033[96m🔌 Budget réseau: {network_budget.describe()}\033[0m")
+
+    global_stats.start_time = time.time()
+    try:
+        resume_interrupted_jobs()
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Lecture du journal impossible: {e}")
+    scheduler = FairScheduler(threads)
+    if adaptive:
+        adaptive_controller.start(scheduler)
+    progress_board.start(progress)
+    run_metrics.start()
+
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(QUEUE_LEASE / 3):
+            try:
+                queue.heartbeat(worker)
+            except sqlite3.Error as e:
+                logger.error(f"Heartbeat impossible: {e}")
+    threading.Thread(target=heartbeat, name='queue-heartbeat', daemon=True).start()
+
+    in_flight = {}
+    counted = set()  # (video_id, dossier) déjà ajoutés au total : un titre repris n'est compté qu'une fois
+    try:
+        while True:
+            # Un petit stock d'avance pour que les threads ne restent jamais sans travail
+            claimed = queue.claim(worker, threads * 2 - len(in_flight)) if len(in_flight) < threads * 2 else []
+            for job in claimed:
+                output_dir = LIBRARY_DIR / job['folder']
+                output_dir.mkdir(parents=True, exist_ok=True)
+                manifest.queue_job(job['video_id'], output_dir, job['title'], job['playlist'])
+                if (job['video_id'], job['folder']) not in counted:
+                    counted.add((job['video_id'], job['folder']))
+                    global_stats.add_videos(1)
+                scheduler.register(job['folder'])
+                progress_board.add_tracks(job['folder'], 1)
+                video_info = PlaylistEntry(job['video_id'], job['title'])
+                future = scheduler.submit(job['folder'], submit_single_video, video_info, output_dir,
+                                          job['playlist'], output_policy)
+                future.add_done_callback(_report_track_done(job['folder']))
+                in_flight[_final_result(future, job['playlist'])] = job
+
+            if not in_flight:
+                counts = queue.counts()
+                if not wait and not counts['queued'] and not counts['leased']:
+                    break
+                time.sleep(QUEUE_POLL)  # Titres en attente de nouvel essai, ou en cours sur d'autres workers
+                continue
+
+            finished, _ = wait_futures(in_flight, timeout=QUEUE_POLL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = in_flight.pop(future)
+                output_dir = LIBRARY_DIR / job['folder']
+                if future.result():
+                    entry = manifest.lookup(job['video_id'], output_dir)
+                    if not queue.complete(job, f"{worker}:{entry['path']}" if entry else worker):
+                        # Bail expiré entre-temps : le titre est à un autre worker, qui en rendra compte
+                        logger.warning(f"Bail perdu pour {job['video_id']} ({job['folder']}) : résultat non enregistré")
+                else:
+                    failure = manifest.get_job(job['video_id'], output_dir) or {}
+                    requeued = queue.fail(job, failure.get('error'), failure.get('failure_class') or 'transient')
+                    if requeued is None:
+                        logger.warning(f"Bail perdu pour {job['video_id']} ({job['folder']}) : échec non enregistré")
+                    if requeued is not False:
+                        global_stats.requeue_failure()  # Retenté plus tard, ici ou ailleurs
+                    else:
+                        global_stats.add_failed_video(job['playlist'], job['title'][:50])
+    finally:
+        stop.set()
+        # Interruption : les titres non terminés sont rendus à la file pour les autres workers
+        queue.release(worker)
+        queue.close()
+        progress_board.stop()
+        run_metrics.stop()
+        if adaptive:
+            adaptive_controller.stop()
+        scheduler.shutdown()
+
+# === Mode démon : moteur gardé chaud, playlists surveillées, API HTTP locale ===
+
+class DaemonJob:
+    """Un lot d'URLs confié au démon (par l'API ou par un passage de surveillance)"""
+    def __init__(self, urls, source, prune=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.urls = urls
+        self.source = source  # 'api' ou 'watch'
+        self.prune = prune
+        self.state = 'queued'  # queued -> running -> done / failed
+        self.playlists = {}  # Dict: url de playlist -> queued / running / ok / failed / skipped
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0  # Numéro du dernier changement (flux d'événements)
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'source': self.source, 'state': self.state, 'urls': list(self.urls),
+            'prune': self.prune, 'playlists': dict(self.playlists), 'error': self.error,
+            'created_at': self.created_at, 'started_at': self.started_at, 'finished_at': self.finished_at,
+        }
+
+class DownloadDaemon:
+    """Service de fond : un seul moteur de téléchargement, gardé chaud d'un lot à l'autre
+
+    Les threads du FairScheduler (et leurs contextes yt-dlp), les caches, le contrôleur
+    adaptatif et le résultat du test Premium restent en place entre les lots. Les playlists
+    surveillées repassent en mode synchro toutes les `interval` secondes (± jitter), et
+    l'API HTTP locale ajoute des lots et suit leur avancement.
+    """
+    def __init__(self, watch_urls=(), playlist_threads=2, video_threads=6, output_policy=None, adaptive=True,
+                 prune=False, retry_rounds=RETRY_ROUNDS, interval=None, jitter=None):
+        self.watch_urls = list(dict.fromkeys(watch_urls))
+        self.playlist_threads = playlist_threads
+        self.video_threads = video_threads
+        self.output_policy = output_policy
+        self.adaptive = adaptive
+        self.prune = prune
+        self.retry_rounds = retry_rounds
+        self.interval = interval or DAEMON_INTERVAL
+        self.jitter = DAEMON_JITTER if jitter is None else jitter
+        self.scheduler = None
+        self.premium = None  # (accès Premium, message) du dernier test, None sans cookies.txt
+        self.next_poll = None
+        self.started_at = None
+        self._jobs = {}  # Dict: id -> DaemonJob, dans l'ordre de soumission
+        self._active_urls = set()  # Une playlist n'est jamais traitée par deux lots en même temps
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self._playlist_slots = threading.Semaphore(playlist_threads)  # Partagés par tous les lots
+        self._retry_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+
+    def start(self, host=DAEMON_HOST, port=DAEMON_PORT, progress='auto'):
+        """Démarre l'API, le moteur et la surveillance ; retourne (hôte, port) d'écoute
+
+        OSError si le port est déjà pris (rien n'est démarré dans ce cas).
+        """
+        self._server = ThreadingHTTPServer((host, port), DaemonRequestHandler)
+        self._server.daemon_threads = True
+        self._server.download_daemon = self
+        self.started_at = global_stats.start_time = time.time()
+        try:
+            interrupted = resume_interrupted_jobs()
+            if interrupted:
+                safe_print(f"\033[93m♻️  {interrupted} titres interrompus au dernier arrêt, reprise\033[0m")
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Lecture du journal impossible: {e}")
+        self.refresh_premium()
+        if self.premium:
+            safe_print(self.premium[1])
+
+        self.scheduler = FairScheduler(self.playlist_threads * self.video_threads)
+        if self.adaptive:
+            adaptive_controller.start(self.scheduler)
+        progress_board.start(progress)
+        run_metrics.start()
+        threading.Thread(target=self._server.serve_forever, name='daemon-api', daemon=True).start()
+        if self.watch_urls:
+            threading.Thread(target=self._watch_loop, name='daemon-watch', daemon=True).start()
+        return self._server.server_address[:2]
+
+    def serve_forever(self):
+        """Bloque jusqu'à request_stop() (SIGTERM) ou Ctrl+C, puis arrête le démon"""
+        try:
+            while not self._stop.wait(1):  # Attente courte : Ctrl+C reste pris en compte partout
+                pass
+        finally:
+            self.close()
+
+    def request_stop(self):
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()  # Ferme les flux d'événements ouverts
+
+    def close(self):
+        """Arrêt : les titres en cours reprendront au prochain démarrage (journal du manifeste)"""
+        self.request_stop()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        progress_board.stop()
+        metrics_path = run_metrics.stop()
+        if metrics_path:
+            safe_print(f"\033[96m📈 Métriques: {metrics_path} + {METRICS_DIR / PROMETHEUS_FILENAME}\033[0m")
+        if self.adaptive:
+            adaptive_controller.stop()
+        if self.scheduler:
+            self.scheduler.shutdown(wait=False)
+
+    def refresh_premium(self):
+        """Test Premium (gardé PREMIUM_PROBE_TTL dans le manifeste, refait si cookies.txt change)"""
+        if not Path('cookies.txt').exists():
+            self.premium = None
+            return
+        try:
+            self.premium = test_premium_access()
+        except Exception as e:
+            logger.error(f"Test Premium impossible: {e}")
+
+    def _watch_loop(self):
+        # Premier passage peu après le démarrage, puis toutes les `interval` secondes ± jitter :
+        # un redémarrage ou plusieurs démons ne sollicitent pas YouTube à la même seconde
+        delay = random.uniform(0, self.interval * self.jitter)
+        while True:
+            self.next_poll = time.time() + delay
+            if self._stop.wait(delay):
+                return
+            self.poll()
+            delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def poll(self):
+        """Passage sur les playlists surveillées ; None si rien à surveiller ou si le précédent tourne encore"""
+        if not self.watch_urls:
+            return None
+        with self._lock:
+            if any(job.source == 'watch' and not job.finished for job in self._jobs.values()):
+                logger.info("Passage de surveillance ignoré : le précédent n'est pas terminé")
+                return None
+        self.refresh_premium()
+        return self.submit(self.watch_urls, 'watch')
+
+    def submit(self, urls, source='api', prune=None):
+        """Ajoute un lot d'URLs (playlists ou chaînes), traité en mode synchro ; retourne le DaemonJob"""
+        job = DaemonJob(list(dict.fromkeys(urls)), source, self.prune if prune is None else bool(prune))
+        with self._lock:
+            if all(other.finished for other in self._jobs.values()):
+                progress_board.reset_counts()  # Démon inactif jusqu'ici : nouveau tableau, nouvelle ETA
+            self._jobs[job.id] = job
+            finished = [job_id for job_id, other in self._jobs.items() if other.finished]
+            for job_id in finished[:max(0, len(finished) - DAEMON_JOBS_KEPT)]:
+                del self._jobs[job_id]
+            self._touch(job)
+        threading.Thread(target=self._run_job, args=(job,), name=f"daemon-job-{job.id}", daemon=True).start()
+        return job
+
+    def _touch(self, job):
+        """Note un changement du lot et réveille les flux d'événements (appelé avec le verrou)"""
+        self._version += 1
+        job.version = self._version
+        self._changed.notify_all()
+
+    def _set_playlist(self, job, playlist_url, state):
+        with self._lock:
+            job.playlists[playlist_url] = state
+            self._touch(job)
+
+    def _run_job(self, job):
+        with self._lock:
+            job.state = 'running'
+            job.started_at = time.time()
+            self._touch(job)
+        safe_print(f"\033[92m📥 Lot {job.id} ({'surveillance' if job.source == 'watch' else 'API'}) : "
+                   f"{len(job.urls)} URLs\033[0m")
+        threads = []
+        try:
+            for playlist_url in MetadataEngine().stream(job.urls, skip=self.playlist_threads):
+                with self._lock:
+                    busy = playlist_url in self._active_urls
+                    self._active_urls.add(playlist_url)
+                if busy:
+                    # Déjà en cours dans un autre lot : ses nouveaux titres y seront pris
+                    self._set_playlist(job, playlist_url, 'skipped')
+                    continue
+                self._set_playlist(job, playlist_url, 'queued')
+                self._playlist_slots.acquire()
+                thread = threading.Thread(target=self._run_playlist, args=(job, playlist_url),
+                                          name='daemon-playlist', daemon=True)
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+            if self.retry_rounds:
+                # Un seul passage de nouveaux essais à la fois : ils couvrent les échecs de tous les lots
+                with self._retry_lock:
+                    retry_failed_tracks(self.scheduler, self.output_policy, job.started_at, rounds=self.retry_rounds)
+        except Exception as e:
+            logger.error(f"Erreur critique lot {job.id}: {str(e)}")
+            job.error = str(e)
+
+        with self._lock:
+            failed = job.error or any(state == 'failed' for state in job.playlists.values())
+            job.state = 'failed' if failed else 'done'
+            job.finished_at = time.time()
+            self._touch(job)
+        ok = sum(1 for state in job.playlists.values() if state == 'ok')
+        color = 91 if failed else 92
+        safe_print(f"\033[{color}m🏁 Lot {job.id} terminé : {ok}/{len(job.playlists)} playlists OK "
+                   f"en {job.finished_at - job.started_at:.0f}s\033[0m")
+
+    def _run_playlist(self, job, playlist_url):
+        ok = False
+        try:
+            self._set_playlist(job, playlist_url, 'running')
+            ok = download_playlist_ultra_fast(playlist_url, self.video_threads, True, job.prune,
+                                              self.scheduler, self.output_policy)
+        except Exception as e:
+            logger.error(f"Erreur critique playlist {playlist_url}: {str(e)}")
+        finally:
+            self._playlist_slots.release()
+            with self._lock:
+                self._active_urls.discard(playlist_url)
+                job.playlists[playlist_url] = 'ok' if ok else 'failed'
+                self._touch(job)
+
+    def jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def status(self):
+        with self._lock:
+            states = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for job in self._jobs.values():
+                states[job.state] += 1
+        return {
+            'started_at': self.started_at,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'threads': self.scheduler.max_workers,
+            'active_threads': self.scheduler.active_limit,
+            'output': str(self.output_policy or DEFAULT_OUTPUT_POLICY),
+            'premium': ({'premium': self.premium[0], 'message': self.premium[1]} if self.premium else None),
+            'watch': {'urls': self.watch_urls, 'interval_seconds': self.interval, 'jitter': self.jitter,
+                      'next_poll_at': self.next_poll if self.watch_urls else None},
+            'jobs': states,
+            'progress': progress_board.snapshot(),
+            'metrics': run_metrics.snapshot(),
+        }
+
+    def wait_changes(self, version, timeout):
+        """Attend un changement plus récent que `version` (timeout en secondes) -> (version, lots modifiés)"""
+        with self._changed:
+            if self._version == version and not self._stop.is_set():
+                self._changed.wait(timeout)
+            changed = [job.to_dict() for job in self._jobs.values() if job.version > version]
+            return self._version, changed
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """API HTTP du démon (JSON)
+
+    GET  /status           état du moteur, des lots, progression et métriques
+    GET  /jobs             lots récents          GET /jobs/<id>   un lot
+    POST /jobs             {"urls": [...], "prune": false} -> nouveau lot (202)
+    POST /poll             passage immédiat sur les playlists surveillées
+    GET  /events[?job=id]  flux de progression (text/event-stream)
+    """
+    server_version = "UltraDownloader"
+    MAX_BODY = 1024 * 1024
+
+    @property
+    def download_daemon(self):
+        return self.server.download_daemon
+
+    def log_message(self, format, *args):
+        logger.info(f"API {self.address_string()} {format % args}")
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        if path == '/status':
+            self._send_json(200, self.download_daemon.status())
+        elif path == '/jobs':
+            self._send_json(200, {'jobs': self.download_daemon.jobs()})
+        elif path.startswith('/jobs/'):
+            job = self.download_daemon.job(path[len('/jobs/'):])
+            if job:
+                self._send_json(200, job)
+            else:
+                self._send_error(404, "lot inconnu")
+        elif path == '/events':
+            self._stream_events(parse_qs(url.query).get('job', [None])[0])
+        else:
+            self._send_error(404, "chemin inconnu")
+
+    def do_POST(self):
+        path = urlsplit(self.path).path.rstrip('/')
+        if path == '/jobs':
+            payload = self._read_json()
+            if payload is None:
+                return
+            urls = payload.get('urls')
+            if isinstance(urls, str):
+                urls = [urls]
+            if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip() for url in urls):
+                self._send_error(400, "'urls' doit être une liste d'URLs non vide")
+                return
+            job = self.download_daemon.submit([url.strip() for url in urls], 'api', payload.get('prune'))
+            self._send_json(202, job.to_dict(), headers=[('Location', f"/jobs/{job.id}")])
+        elif path == '/poll':
+            if not self.download_daemon.watch_urls:
+                self._send_error(409, "aucune playlist surveillée")
+                return
+            job = self.download_daemon.poll()
+            if job is None:
+                self._send_error(409, "passage de surveillance déjà en cours")
+                return
+            self._send_json(202, job.to_dict(), headers=[('Location', f"/jobs/{job.id}")])
+        else:
+            self._send_error(404, "chemin inconnu")
+
+    def _read_json(self):
+        """Corps JSON de la requête (None si invalide, la réponse d'erreur est déjà envoyée)"""
+        # Exiger du JSON : une page web ne peut pas envoyer ce type de requête à l'API locale
+        # sans pré-vérification CORS, à laquelle l'API ne répond jamais
+        if self.headers.get_content_type() != 'application/json':
+            self._send_error(415, "Content-Type: application/json attendu")
+            return None
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= self.MAX_BODY:
+            self._send_error(413, "corps de requête invalide ou trop gros")
+            return None
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self._send_error(400, f"JSON invalide: {e}")
+            return None
+        if not isinstance(payload, dict):
+            self._send_error(400, "un objet JSON est attendu")
+            return None
+        return payload
+
+    def _send_event(self, event, payload):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _stream_events(self, job_id):
+        """Server-Sent Events : 'job' à chaque changement de lot, 'progress' au moins chaque seconde
+
+        Avec ?job=<id>, seulement ce lot, et le flux se ferme quand il est terminé.
+        """
+        daemon = self.download_daemon
+        if job_id and not daemon.job(job_id):
+            self._send_error(404, "lot inconnu")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        version = 0
+        try:
+            while not daemon.stopping:
+                version, changed = daemon.wait_changes(version, DAEMON_EVENT_INTERVAL)
+                finished = False
+                for job in changed:
+                    if job_id in (None, job['id']):
+                        self._send_event('job', job)
+                        finished = job['state'] in ('done', 'failed')
+                self._send_event('progress', progress_board.snapshot())
+                if job_id and finished:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return  # Client parti
+
+def read_url_file(path):
+    """Une URL par ligne ; lignes vides et commentaires (#) ignorés"""
+    urls = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                urls.extend(url.strip() for url in line.split(',') if url.strip())
+    return urls
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="YouTube Music Downloader ULTRA - sans argument : mode interactif")
+    commands = parser.add_subparsers(dest='command')
+
+    download = commands.add_parser(
+        'download', help="Téléchargement non-interactif (cron, tâches planifiées)",
+        description="Télécharge sans aucune question ni pause. Code de sortie : "
+                    "0 = tout OK, 1 = échecs partiels, 2 = arguments invalides, 3 = rien n'a pu être traité")
+    download.add_argument('urls', nargs='*', help="URLs de playlists")
+    download.add_argument('-f', '--file', action='append', default=[],
+                          help="Fichier d'URLs (une par ligne, # pour commenter), répétable")
+    download.add_argument('-c', '--config',
+                          help="Fichier de config JSON (mêmes clés que les options longues, ex: {\"urls\": [...], \"threads\": 6})")
+    download.add_argument('-p', '--playlists', type=int, help="Playlists simultanées (défaut 2)")
+    download.add_argument('-t', '--threads', type=int, help="Threads vidéo par playlist (défaut 6)")
+    download.add_argument('--sync', action='store_true', default=None, help="Mode synchro (dossier stable, seulement les nouveaux titres)")
+    download.add_argument('--prune', action='store_true', default=None, help="Avec --sync : supprimer les titres retirés des playlists")
+    download.add_argument('-o', '--output', choices=OutputPolicy.MODES, help="Format de sortie (défaut mp3)")
+    download.add_argument('--pipe', action='store_true', default=None,
+                          help="Flux téléchargé envoyé directement à ffmpeg, sans fichier intermédiaire")
+    download.add_argument('--scratch-dir',
+                          help="Dossier de travail (téléchargement + conversion, ex: tmpfs), défaut downloads/.staging")
+    download.add_argument('--allowed-codecs', help="Avec --output auto : codecs gardés tels quels (défaut aac,opus)")
+    download.add_argument('--no-adaptive', dest='adaptive', action='store_false', default=None,
+                          help="Désactiver le contrôleur de concurrence adaptatif")
+    download.add_argument('--retry-failed', action='store_true', default=None,
+                          help="Retenter les titres en échec des runs précédents, sans réextraire les playlists (URLs facultatives)")
+    download.add_argument('--include-permanent', action='store_true', default=None,
+                          help="Avec --retry-failed : retenter aussi les échecs Premium/privés/supprimés")
+    download.add_argument('--retry-rounds', type=int,
+                          help=f"Nouveaux essais des échecs temporaires en fin de run (défaut {RETRY_ROUNDS}, 0 = aucun)")
+    download.add_argument('--max-rate',
+                          help="Débit total max, tous téléchargements confondus (octets/s, suffixes K/M/G, ex: 5M ; défaut illimité)")
+    download.add_argument('--max-connections', type=int,
+                          help="Connexions de téléchargement simultanées max, fragments compris (défaut illimité)")
+    download.add_argument('--cache-ttl', type=int, help=f"Validité du cache de playlists en secondes (défaut {PLAYLIST_CACHE_TTL}, 0 = désactivé)")
+    download.add_argument('--metadata-concurrency', type=int,
+                          help=f"Extractions de playlists/chaînes simultanées (défaut {METADATA_CONCURRENCY})")
+    download.add_argument('--progress', choices=('auto', 'live', 'plain', 'off'),
+                          help="Affichage de la progression (défaut auto : tableau en terminal, résumé sinon)")
+    download.add_argument('--profile', action='store_true', default=None,
+                          help="Profiler le run (piles des threads + attentes sur les verrous), rapport dans logs/")
+    download.add_argument('--premium-check', action='store_true', default=None, help="Tester l'accès Premium avant de commencer")
+
+    # Mode distribué : un coordinateur remplit une file SQLite partagée, des workers sur plusieurs machines la vident
+    coordinator = commands.add_parser(
+        'coordinator', help="Mode distribué : mettre les titres des playlists dans une file partagée",
+        description="Met les titres des playlists dans la file partagée, puis remet en file les titres "
+                    "des workers disparus (bail expiré) jusqu'à ce que tout soit fini")
+    coordinator.add_argument('urls', nargs='*', help="URLs de playlists ou de chaînes (aucune : surveiller seulement)")
+    coordinator.add_argument('-f', '--file', action='append', default=[], help="Fichier d'URLs, répétable")
+    coordinator.add_argument('-q', '--queue', required=True, help="Fichier de file SQLite, sur un stockage commun aux workers")
+    coordinator.add_argument('--no-wait', action='store_true', help="Remplir la file et quitter sans surveiller les baux")
+
+    worker = commands.add_parser(
+        'worker', help="Mode distribué : télécharger les titres d'une file partagée",
+        description="Prend des titres dans la file partagée et les télécharge dans downloads/ sur cette machine")
+    worker.add_argument('-q', '--queue', required=True, help="Fichier de file SQLite du coordinateur")
+    worker.add_argument('-t', '--threads', type=int, default=6, help="Téléchargements simultanés (défaut 6)")
+    worker.add_argument('-o', '--output', choices=OutputPolicy.MODES, default='mp3', help="Format de sortie (défaut mp3)")
+    worker.add_argument('--pipe', action='store_true', help="Flux téléchargé envoyé directement à ffmpeg")
+    worker.add_argument('--allowed-codecs', default='aac,opus', help="Avec --output auto : codecs gardés tels quels")
+    worker.add_argument('--no-adaptive', dest='adaptive', action='store_false', help="Désactiver le contrôleur adaptatif")
+    worker.add_argument('--scratch-dir', help="Dossier de travail (défaut downloads/.staging)")
+    worker.add_argument('--max-rate', help="Débit total max de ce worker (octets/s, suffixes K/M/G, ex: 5M)")
+    worker.add_argument('--max-connections', type=int, help="Connexions de téléchargement simultanées max de ce worker")
+    worker.add_argument('--progress', choices=('auto', 'live', 'plain', 'off'), default='auto', help="Affichage de la progression")
+    worker.add_argument('--wait', action='store_true', help="Ne pas quitter quand la file est vide, attendre de nouveaux titres")
+
+    index = commands.add_parser(
+        'index', help="Indexer les fichiers déjà présents dans downloads/ (téléchargés avant le manifeste)",
+        description="Lit les tags ID3 (URL source) et les noms des fichiers audio de downloads/ pour que les titres "
+                    "déjà présents ne soient pas retéléchargés. Incrémental : seuls les fichiers nouveaux ou "
+                    "modifiés (taille, date) sont relus")
+    index.add_argument('-t', '--threads', type=int, default=INDEX_THREADS,
+                       help=f"Fichiers lus en parallèle (défaut {INDEX_THREADS})")
+    index.add_argument('--full', action='store_true', help="Tout relire, même les fichiers inchangés")
+
+    # Mode démon : un seul processus gardé chaud (sessions, caches, test Premium) au lieu d'un run par demande
+    daemon = commands.add_parser(
+        'daemon', help="Service de fond : surveille des playlists et reçoit des URLs par une API HTTP locale",
+        description="Garde le moteur de téléchargement chaud, repasse les playlists surveillées en mode synchro "
+                    "à intervalle régulier et expose une API HTTP locale (/status, /jobs, /poll, /events)")
+    daemon.add_argument('urls', nargs='*', help="URLs de playlists ou de chaînes à surveiller")
+    daemon.add_argument('-f', '--file', action='append', default=[], help="Fichier d'URLs à surveiller, répétable")
+    daemon.add_argument('-c', '--config', help="Fichier de config JSON (mêmes clés que les options longues)")
+    daemon.add_argument('--interval', type=int,
+                        help=f"Secondes entre deux passages sur les playlists surveillées (défaut {DAEMON_INTERVAL}, minimum 60)")
+    daemon.add_argument('--jitter', type=float,
+                        help=f"Part aléatoire de l'intervalle, ± (défaut {DAEMON_JITTER}, maximum 0.5)")
+    daemon.add_argument('--host', help=f"Adresse d'écoute de l'API (défaut {DAEMON_HOST})")
+    daemon.add_argument('--port', type=int, help=f"Port de l'API (défaut {DAEMON_PORT})")
+    daemon.add_argument('-p', '--playlists', type=int, help="Playlists simultanées (défaut 2)")
+    daemon.add_argument('-t', '--threads', type=int, help="Threads vidéo par playlist (défaut 6)")
+    daemon.add_argument('--prune', action='store_true', default=None, help="Supprimer les titres retirés des playlists")
+    daemon.add_argument('-o', '--output', choices=OutputPolicy.MODES, help="Format de sortie (défaut mp3)")
+    daemon.add_argument('--pipe', action='store_true', default=None, help="Flux téléchargé envoyé directement à ffmpeg")
+    daemon.add_argument('--scratch-dir', help="Dossier de travail (défaut downloads/.staging)")
+    daemon.add_argument('--allowed-codecs', help="Avec --output auto : codecs gardés tels quels (défaut aac,opus)")
+    daemon.add_argument('--no-adaptive', dest='adaptive', action='store_false', default=None,
+                        help="Désactiver le contrôleur de concurrence adaptatif")
+    daemon.add_argument('--retry-rounds', type=int,
+                        help=f"Nouveaux essais des échecs temporaires en fin de lot (défaut {RETRY_ROUNDS}, 0 = aucun)")
+    daemon.add_argument('--max-rate', help="Débit total max (octets/s, suffixes K/M/G, ex: 5M)")
+    daemon.add_argument('--max-connections', type=int, help="Connexions de téléchargement simultanées max")
+    daemon.add_argument('--cache-ttl', type=int,
+                        help=f"Validité du cache de playlists en secondes (défaut {PLAYLIST_CACHE_TTL}, "
+                             f"plafonnée à la moitié de l'intervalle)")
+    daemon.add_argument('--metadata-concurrency', type=int,
+                        help=f"Extractions de playlists/chaînes simultanées (défaut {METADATA_CONCURRENCY})")
+    daemon.add_argument('--progress', choices=('auto', 'live', 'plain', 'off'),
+                        help="Affichage de la progression (défaut auto)")
+    return parser
+
+def load_headless_config(args):
+    """Fusionne fichier de config JSON et arguments (les arguments l'emportent)"""
+    config = {}
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("le fichier de config doit contenir un objet JSON")
+
+    for key, value in vars(args).items():
+        if key in ('command', 'config', 'urls', 'file'):
+            continue
+        if value is not None:
+            config[key] = value
+
+    urls = list(config.get('urls', [])) + list(args.urls)
+    for path in list(config.get('files', [])) + list(args.file):
+        urls.extend(read_url_file(path))
+    config['urls'] = list(dict.fromkeys(urls))  # Sans doublons, ordre conservé
+    return config
+
+def parse_run_settings(config):
+    """Réglages communs à download et daemon, tirés de la config fusionnée (ValueError/TypeError si invalides)"""
+    allowed_codecs = config.get('allowed_codecs', 'aac,opus')
+    if isinstance(allowed_codecs, str):
+        allowed_codecs = [codec.strip() for codec in allowed_codecs.split(',') if codec.strip()]
+    return {
+        'output_policy': OutputPolicy(config.get('output', 'mp3'), allowed_codecs, pipe=bool(config.get('pipe'))),
+        'playlist_threads': max(1, min(int(config.get('playlists', 2)), 4)),
+        'video_threads': max(1, min(int(config.get('threads', 6)), 12)),
+        'retry_rounds': max(0, int(config.get('retry_rounds', RETRY_ROUNDS))),
+        'metadata_concurrency': max(1, int(config.get('metadata_concurrency', METADATA_CONCURRENCY))),
+        'cache_ttl': int(config['cache_ttl']) if 'cache_ttl' in config else None,
+        'max_rate': parse_rate(config.get('max_rate')),
+        'max_connections': max(0, int(config.get('max_connections') or 0)),
+    }
+
+def apply_run_settings(config, settings):
+    """Applique les réglages globaux (dossier de travail, caches, budget réseau)"""
+    global SCRATCH_DIR, METADATA_CONCURRENCY
+    if settings['cache_ttl'] is not None:
+        playlist_cache.ttl = settings['cache_ttl']
+    if config.get('scratch_dir'):
+        SCRATCH_DIR = config['scratch_dir']
+    METADATA_CONCURRENCY = settings['metadata_concurrency']
+    network_budget.configure(settings['max_rate'], settings['max_connections'])
+
+def run_headless(args):
+    """Mode non-interactif : pas de bannière, pas de pause, pas de question"""
+    try:
+        config = load_headless_config(args)
+        settings = parse_run_settings(config)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"❌ Configuration invalide: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if not config['urls'] and not config.get('retry_failed'):
+        print("❌ Aucune URL fournie (arguments, --file, --config ou --retry-failed)", file=sys.stderr)
+        return EXIT_USAGE
+
+    setup_logging()
+    cleanup_old_logs()
+    apply_run_settings(config, settings)
+
+    if config.get('premium_check') and Path('cookies.txt').exists():
+        is_premium, message = test_premium_access()
+        print(message)
+
+    try:
+        failed_playlists = download_all_playlists_parallel(config['urls'], settings['playlist_threads'],
+                                                           settings['video_threads'],
+                                                           bool(config.get('sync')), bool(config.get('prune')),
+                                                           adaptive=config.get('adaptive', True),
+                                                           output_policy=settings['output_policy'],
+                                                           progress=config.get('progress', 'auto'),
+                                                           profile=bool(config.get('profile')),
+                                                           retry_rounds=settings['retry_rounds'],
+                                                           retry_failed=bool(config.get('retry_failed')),
+                                                           include_permanent=bool(config.get('include_permanent')))
+    except KeyboardInterrupt:
+        print("\n⏹️  Arrêt demandé")
+        print_final_stats()
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        logger.error(f"Erreur critique headless: {str(e)}")
+        print(f"❌ Erreur critique: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+
+    print_final_stats()
+    playlists_done, _, videos_done, videos_failed, _ = global_stats.get_stats()
+    if not config['urls']:
+        # Seulement les échecs précédents : jugé sur les titres
+        if not videos_failed:
+            return EXIT_OK
+        return EXIT_PARTIAL if videos_done else EXIT_FAILED
+    if playlists_done == 0:
+        return EXIT_FAILED
+    if videos_failed or failed_playlists:
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+def run_daemon_cli(args):
+    """Service de fond : moteur gardé chaud, playlists surveillées, API HTTP locale"""
+    try:
+        config = load_headless_config(args)
+        settings = parse_run_settings(config)
+        interval = max(60, int(config.get('interval', DAEMON_INTERVAL)))  # Pas plus d'un passage par minute
+        jitter = min(max(float(config.get('jitter', DAEMON_JITTER)), 0.0), 0.5)
+        host = str(config.get('host', DAEMON_HOST))
+        port = int(config.get('port', DAEMON_PORT))
+    except (OSError, ValueError, TypeError) as e:
+        print(f"❌ Configuration invalide: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    setup_logging()
+    cleanup_old_logs()
+    apply_run_settings(config, settings)
+    # Le cache de playlists ne doit pas cacher les nouveaux titres d'un passage à l'autre
+    playlist_cache.ttl = min(playlist_cache.ttl, interval // 2)
+    playlist_cache.memory_ttl = interval // 2
+
+    daemon = DownloadDaemon(config['urls'], settings['playlist_threads'], settings['video_threads'],
+                            settings['output_policy'], adaptive=config.get('adaptive', True),
+                            prune=bool(config.get('prune')), retry_rounds=settings['retry_rounds'],
+                            interval=interval, jitter=jitter)
+    try:
+        host, port = daemon.start(host, port, config.get('progress', 'auto'))
+    except OSError as e:
+        print(f"❌ API impossible sur {host}:{port}: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    safe_print(f"\033[92m🛰️  Démon prêt : API http://{host}:{port}/status, "
+               f"{settings['playlist_threads'] * settings['video_threads']} threads\033[0m")
+    if daemon.watch_urls:
+        safe_print(f"\033[96m👀 {len(daemon.watch_urls)} URLs surveillées toutes les {interval // 60} min "
+                   f"(± {jitter:.0%})\033[0m")
+    if network_budget.limited:
+        safe_print(f"\033[96m🔌 Budget réseau: {network_budget.describe()}\033[0m")
+
+    # systemd / docker stop : même arrêt propre que Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.request_stop())
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("\n⏹️  Arrêt demandé (les titres en cours reprendront au prochain démarrage)")
+    print_final_stats()
+    return EXIT_OK
+
+def run_coordinator_cli(args):
+    try:
+        urls = list(args.urls)
+        for path in args.file:
+            urls.extend(read_url_file(path))
+    except OSError as e:
+        print(f"❌ Configuration invalide: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not urls and args.no_wait:
+        print("❌ Aucune URL fournie (arguments ou --file)", file=sys.stderr)
+        return EXIT_USAGE
+
+    setup_logging()
+    cleanup_old_logs()
+    try:
+        counts = run_coordinator(list(dict.fromkeys(urls)), args.queue, wait=not args.no_wait)
+    except KeyboardInterrupt:
+        print("\n⏹️  Arrêt demandé (la file est conservée, les workers continuent)")
+        return EXIT_INTERRUPTED
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Erreur critique coordinateur: {str(e)}")
+        print(f"❌ Erreur critique: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+
+    print(f"🏁 File: {counts['done']} finis, {counts['failed']} échecs, {counts['queued'] + counts['leased']} restants")
+    if counts['failed']:
+        return EXIT_PARTIAL if counts['done'] else EXIT_FAILED
+    return EXIT_OK
+
+def run_worker_cli(args):
+    global SCRATCH_DIR
+    allowed_codecs = [codec.strip() for codec in args.allowed_codecs.split(',') if codec.strip()]
+    output_policy = OutputPolicy(args.output, allowed_codecs, pipe=args.pipe)
+    try:
+        max_rate = parse_rate(args.max_rate)
+    except ValueError as e:
+        print(f"❌ Configuration invalide: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    network_budget.configure(max_rate, max(0, args.max_connections or 0))
+    setup_logging()
+    cleanup_old_logs()
+    if args.scratch_dir:
+        SCRATCH_DIR = args.scratch_dir
+    try:
+        run_worker(args.queue, max(1, args.threads), output_policy, adaptive=args.adaptive,
+                   progress=args.progress, wait=args.wait)
+    except KeyboardInterrupt:
+        print("\n⏹️  Arrêt demandé (titres en cours rendus à la file)")
+        print_final_stats()
+        return EXIT_INTERRUPTED
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Erreur critique worker: {str(e)}")
+        print(f"❌ Erreur critique: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+
+    print_final_stats()
+    _, _, _, videos_failed, _ = global_stats.get_stats()
+    return EXIT_PARTIAL if videos_failed else EXIT_OK
+
+def run_index_cli(args):
+    setup_logging()
+    cleanup_old_logs()
+    safe_print(f"\033[96m🔎 Indexation de {LIBRARY_DIR}/ ({max(1, args.threads)} threads"
+               f"{', tout est relu' if args.full else ''})\033[0m")
+    start = time.time()
+    try:
+        counts = index_library(LIBRARY_DIR, max(1, args.threads), full=args.full)
+    except KeyboardInterrupt:
+        print("\n⏹️  Arrêt demandé (les lots déjà lus sont gardés, relancez pour continuer)")
+        return EXIT_INTERRUPTED
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Erreur critique indexation: {str(e)}")
+        print(f"❌ Erreur critique: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+
+    safe_print(f"\033[92m✅ {counts['files']} fichiers en {time.time() - start:.1f}s : {counts['unchanged']} inchangés, "
+               f"{counts['read']} lus ({counts['with_id']} avec ID vidéo, {counts['by_title']} sans ID, comparés au titre), "
+               f"{counts['removed']} disparus\033[0m")
+    return EXIT_OK
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        cli_args = build_arg_parser().parse_args()
+        if cli_args.command == 'download':
+            sys.exit(run_headless(cli_args))
+        if cli_args.command == 'coordinator':
+            sys.exit(run_coordinator_cli(cli_args))
+        if cli_args.command == 'worker':
+            sys.exit(run_worker_cli(cli_args))
+        if cli_args.command == 'index':
+            sys.exit(run_index_cli(cli_args))
+        if cli_args.command == 'daemon':
+            sys.exit(run_daemon_cli(cli_args))
     main()
\ No newline at end of file